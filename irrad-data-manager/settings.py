@@ -37,6 +37,14 @@ EMAIL_PORT = 587
 EMAIL_HOST_USER = 'placeholder@cern.ch'
 EMAIL_HOST_PASSWORD = 'password'
 
+# Seconds between last_login updates of an unchanged logged user
+LOGGED_USER_UPDATE_INTERVAL = 3600
+
+# Answer list searches from the denormalized search index table of
+# identifier and number fields, comments and dates are no longer matched.
+# Rebuild it with "python manage.py rebuild_search_index" before enabling
+SEARCH_INDEX_ENABLED = False
+
 # Application definition
 
 INSTALLED_APPS = (
@@ -64,6 +72,7 @@ MIDDLEWARE = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'samples_manager.remuser.ProxyRemoteUserMiddleware',
     'samples_manager.middleware.middleware.TimezoneMiddleware',
+    'samples_manager.middleware.middleware.LoggedUserMiddleware',
     #'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     #'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -0,0 +1,179 @@
+"""
+Sample and experiment aggregates. Aggregates are calculated in the database
+with a single grouped query per level. Saving samples and occupancies queues
+their aggregates instead of saving the whole chain of related instances.
+Queued aggregates are updated once when the transaction commits, or when a
+deferred_aggregates block exits.
+"""
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Count, Sum
+from .models import Experiment, Occupancy, Sample
+from .utilities import get_aware_datetime
+from .search import is_search_index_enabled, \
+    update_search_index_with_dependents
+
+OCCUPANCY_FIELDS = ['radiation_length_occupancy', 'nu_coll_length_occupancy',
+    'nu_int_length_occupancy']
+SAMPLE_AGGREGATE_FIELDS = OCCUPANCY_FIELDS
+EXPERIMENT_AGGREGATE_FIELDS = ['number_registered_samples', 'number_users'] \
+    + OCCUPANCY_FIELDS
+AGGREGATES_BATCH_SIZE = 500
+# Aggregates queued in current thread.
+PENDING_AGGREGATES = threading.local()
+
+
+def get_pending_aggregates():
+    """Returns aggregates queued in current thread."""
+    if not hasattr(PENDING_AGGREGATES, 'samples'):
+        PENDING_AGGREGATES.samples = set()
+        PENDING_AGGREGATES.experiments = set()
+        PENDING_AGGREGATES.deferred = 0
+    return PENDING_AGGREGATES
+
+
+def queue_aggregates(samples=(), experiments=()):
+    """
+    Queues aggregates of sample and experiment pks. Unless they are deferred
+    they are updated when the transaction commits, immediately in
+    autocommit mode.
+    """
+    pending = get_pending_aggregates()
+    pending.samples.update(pk for pk in samples if pk is not None)
+    pending.experiments.update(pk for pk in experiments if pk is not None)
+    if not pending.deferred:
+        # Callbacks registered in the same transaction after the first one
+        # find nothing pending.
+        transaction.on_commit(flush_aggregates)
+
+
+@contextmanager
+def deferred_aggregates():
+    """Defers aggregates queued in block until it exits."""
+    pending = get_pending_aggregates()
+    pending.deferred += 1
+    try:
+        yield
+    finally:
+        pending.deferred -= 1
+    if not pending.deferred:
+        transaction.on_commit(flush_aggregates)
+
+
+def flush_aggregates():
+    """Updates queued aggregates. Samples are updated before experiments."""
+    pending = get_pending_aggregates()
+    samples = set(pending.samples)
+    experiments = set(pending.experiments)
+    pending.samples.clear()
+    pending.experiments.clear()
+    if samples:
+        update_sample_aggregates(samples)
+        experiments.update(Sample.objects.filter(pk__in=samples)
+            .exclude(experiment=None).values_list('experiment', flat=True))
+    if experiments:
+        update_experiment_aggregates(experiments)
+
+
+def get_occupancy_sums(queryset, group_field):
+    """
+    Returns dictionary of group_field value to occupancy sums of queryset
+    rows, calculated with a single grouped query.
+    """
+    rows = queryset.order_by().values(group_field).annotate(
+        num_rows=Count('pk'), **dict((field + '_sum', Sum(field))
+        for field in OCCUPANCY_FIELDS))
+    result = dict()
+    for row in rows:
+        result[row[group_field]] = row
+        for field in OCCUPANCY_FIELDS:
+            value = row.pop(field + '_sum')
+            row[field] = 0 if value is None else value
+    return result
+
+
+def get_sample_aggregates(pks=None):
+    """
+    Returns dictionary of sample pk to its aggregates. If pks isn't 
+    provided all samples are aggregated.
+    """
+    occupancies = Occupancy.objects.all() if pks is None \
+        else Occupancy.objects.filter(sample__in=pks)
+    sums = get_occupancy_sums(occupancies, 'sample')
+    samples = Sample.objects.all() if pks is None \
+        else Sample.objects.filter(pk__in=pks)
+    result = dict()
+    for pk in samples.values_list('pk', flat=True):
+        values = sums.get(pk, {})
+        result[pk] = dict((field, values.get(field, 0))
+            for field in SAMPLE_AGGREGATE_FIELDS)
+    return result
+
+
+def get_experiment_aggregates(pks=None):
+    """
+    Returns dictionary of experiment pk to its aggregates. If pks isn't 
+    provided all experiments are aggregated. The responsible is counted as
+    an additional user.
+    """
+    samples = Sample.objects.all() if pks is None \
+        else Sample.objects.filter(experiment__in=pks)
+    sums = get_occupancy_sums(samples, 'experiment')
+    experiments = Experiment.objects.all() if pks is None \
+        else Experiment.objects.filter(pk__in=pks)
+    result = dict()
+    for pk, num_users in experiments.order_by().annotate(
+        num_users=Count('users')).values_list('pk', 'num_users'):
+        values = sums.get(pk, {})
+        result[pk] = dict((field, values.get(field, 0))
+            for field in OCCUPANCY_FIELDS)
+        result[pk]['number_registered_samples'] = values.get('num_rows', 0)
+        result[pk]['number_users'] = num_users + 1
+    return result
+
+
+def update_sample_aggregates(pks=None, touch=True):
+    """
+    Updates aggregates of samples with a bulk update. If touch is True
+    their update timestamp is set as well. Returns number of samples.
+    """
+    fields = SAMPLE_AGGREGATE_FIELDS + (['updated_at'] if touch else [])
+    now = get_aware_datetime()
+    aggregates = get_sample_aggregates(pks)
+    samples = [Sample(id=pk, updated_at=now, **values)
+        for pk, values in aggregates.items()]
+    Sample.objects.bulk_update(samples, fields,
+        batch_size=AGGREGATES_BATCH_SIZE)
+    if is_search_index_enabled() and samples:
+        update_search_index_with_dependents(Sample, list(aggregates))
+    return len(samples)
+
+
+def update_experiment_aggregates(pks=None, touch=True):
+    """
+    Updates aggregates of experiments with a bulk update. If touch is True
+    their update timestamp is set as well. Returns number of experiments.
+    """
+    fields = EXPERIMENT_AGGREGATE_FIELDS + (['updated_at'] if touch else [])
+    now = get_aware_datetime()
+    aggregates = get_experiment_aggregates(pks)
+    experiments = [Experiment(id=pk, updated_at=now, **values)
+        for pk, values in aggregates.items()]
+    Experiment.objects.bulk_update(experiments, fields,
+        batch_size=AGGREGATES_BATCH_SIZE)
+    if is_search_index_enabled() and experiments:
+        update_search_index_with_dependents(Experiment, list(aggregates))
+    return len(experiments)
+
+
+def rebuild_aggregates():
+    """
+    Recalculates aggregates of all samples and experiments in bulk, without
+    changing their update timestamps. Returns number of updated samples and
+    experiments.
+    """
+    with transaction.atomic():
+        num_samples = update_sample_aggregates(touch=False)
+        num_experiments = update_experiment_aggregates(touch=False)
+    return num_samples, num_experiments
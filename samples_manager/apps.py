@@ -0,0 +1,13 @@
+"""Django app configuration."""
+from django.apps import AppConfig
+
+
+class SamplesManagerConfig(AppConfig):
+    """Samples manager app configuration."""
+    name = 'samples_manager'
+
+    def ready(self):
+        """Builds search plans and connects signals once models are loaded."""
+        from .search import build_search_plans
+        from . import signals
+        build_search_plans()
@@ -4,6 +4,7 @@ import logging
 from .forms import *
 from .views import *
 from .models import *
+from .occupancies import update_compound_lengths, update_occupancies
 from django.urls import reverse
 from django.http import JsonResponse
 from django.forms import inlineformset_factory
@@ -24,6 +25,17 @@ ALERT_MESSAGES = {
 }
 
 
+def update_compound_properties(compound):
+    """
+    Recalculates stored lengths of compound and occupancies of samples 
+    using it at once.
+    """
+    update_compound_lengths([compound])
+    samples = Sample.objects.filter(layer__compound_type=compound)\
+        .distinct().select_related('experiment')
+    update_occupancies(samples)
+
+
 def save_compound_form(request, form_data):
     """Saves compound and the elements related to it."""
     data = dict()
@@ -41,6 +53,7 @@ def save_compound_form(request, form_data):
                         element = elem.save()
                         element.compound = compound
                         element.save()
+                    update_compound_properties(compound)
 
                     data['compound_id'] = compound.id
                     data['compound_name'] = compound.name
@@ -59,7 +72,8 @@ def save_compound_form(request, form_data):
         else:
             if form_data['form'].is_valid() and \
                 form_data['form_action'].lower() == 'update':
-                form_data['form'].save()
+                compound = form_data['form'].save()
+                update_compound_properties(compound)
                 args = {'list_name': 'compounds_list'}
                 data['html_list'] = render_partial_list_to_string(
                     request, args)
@@ -204,13 +218,9 @@ def compound_delete(request):
 
 def compounds_have_associated_samples(compound_pks):
     """Calculates if list of compounds have an associated sample."""
-    for pk in compound_pks:
-        compound = Compound.objects.get(pk=pk)
-        layers = Layer.objects.filter(compound_type=compound)
-        has_asssocaited_sample = len(layers) > 0
-        if has_asssocaited_sample:
-            return True
-    return False
+    result = annotate_num_samples(Compound.objects.filter(pk__in=compound_pks))\
+        .filter(samples_sum__gt=0).exists()
+    return result
 
 
 def compounds_list(request):
@@ -1,12 +1,14 @@
 """Django app views related to Experiment data model. It also includes
  auxiliary functions."""
 import logging
+from collections import namedtuple
 from .forms import *
 from .views import *
 from .models import *
 from .utilities import *
 from django.urls import reverse
 from django.http import JsonResponse
+from django.db.models import Prefetch
 from django.forms import inlineformset_factory
 from django.template.loader import render_to_string
 from django.shortcuts import get_object_or_404, render
@@ -40,6 +42,13 @@ ALERT_MESSAGES = {
     'invalid_operation_not_validated': 'Invalid operation. Action not '\
         'possible until experiment is validated by administrators.'
 }
+EXPERIMENT_CATEGORY_MODELS = {
+    'Passive Standard': PassiveStandardCategory,
+    'Passive Custom': PassiveCustomCategory,
+}
+ExperimentDetails = namedtuple('ExperimentDetails', ['experiment',
+    'category_object', 'requested_fluences', 'materials',
+    'experiment_samples', 'fluences'])
 
 
 def save_experiment_form_formset(request, form_data):
@@ -471,127 +480,43 @@ def get_experiment_inline_formset(model, form, formset, min_num = 1, extra = 0):
     return result
 
 
+def get_experiment_details(pk):
+    """
+    Loads experiment details with a fixed number of queries, regardless of
+    number of samples. Returns immutable ExperimentDetails.
+    """
+    experiments = Experiment.objects.select_related('responsible',
+        'created_by', 'updated_by').prefetch_related('reqfluence_set',
+        'material_set', Prefetch('sample_set',
+            queryset=Sample.objects.select_related('material', 'req_fluence')))
+    experiment = get_object_or_404(experiments, pk=pk)
+    category_model = EXPERIMENT_CATEGORY_MODELS.get(experiment.category,
+        ActiveCategory)
+    category_object = get_object_or_404(category_model, experiment=experiment)
+    experiment_samples = tuple(experiment.sample_set.all())
+    samples_fluences = get_samples_fluences(experiment_samples)
+    fluences = tuple(fluence for sample in experiment_samples
+        for fluence in samples_fluences[sample.pk])
+    result = ExperimentDetails(
+        experiment=experiment,
+        category_object=category_object,
+        requested_fluences=tuple(experiment.reqfluence_set.all()),
+        materials=tuple(experiment.material_set.all()),
+        experiment_samples=experiment_samples,
+        fluences=fluences)
+    return result
+
+
 def get_experiment_details_data(experiment):
     """Retrieves data related to experiment in JSON format."""
-    if experiment.category == 'Passive Standard':
-        category_object = get_object_or_404(PassiveStandardCategory,
-                                            experiment=experiment)
-    elif experiment.category == 'Passive Custom':
-        category_object = get_object_or_404(PassiveCustomCategory,
-                                            experiment=experiment)
-    else:
-        category_object = get_object_or_404(ActiveCategory,
-                                            experiment=experiment)
-    requested_fluences = ReqFluence.objects.filter(experiment=experiment)
-    materials = Material.objects.filter(experiment=experiment)
-    experiment_samples = Sample.objects.filter(experiment=experiment)
-    fluences = []
-    for sample in experiment_samples:
-        irradiations = Irradiation.objects.filter(sample=sample)
-        tuple_list = []
-        for irradiation in irradiations:
-            if irradiation.estimated_fluence:
-                if '.' in str(irradiation.dosimeter):
-                    logging.info('no calculation')
-                else:
-                    dosimeter_area = irradiation.dosimeter.width * irradiation.dosimeter.height
-                    dos_tuple = (dosimeter_area, irradiation.dosimeter,
-                                 irradiation.estimated_fluence,
-                                 irradiation.sample, irradiation.dos_position)
-                    tuple_list.append(dos_tuple)
-        tuple_list.sort(key=lambda tup: (tup[0], tup[4]))
-        if tuple_list:
-            sum_fluence = tuple_list[0][2]
-            tuple_list_length = len(tuple_list)
-            if tuple_list_length > 1:
-                for i in range(1, tuple_list_length):
-                    if tuple_list[i - 1][0] == tuple_list[i][0]:
-                        if tuple_list[i - 1][4] == tuple_list[i][4]:
-                            sum_fluence = sum_fluence + tuple_list[i][2]
-                        else:
-                            fluences.append({
-                                'Sample': sample,
-                                'Fluence_data': {
-                                    'width': tuple_list[i - 1][1].width,
-                                    'height': tuple_list[i - 1][1].height,
-                                    'estimated_fluence': sum_fluence
-                                }
-                            })
-                            sum_fluence = 0
-                    else:
-                        fluences.append({
-                            'Sample': sample,
-                            'Fluence_data': {
-                                'width': tuple_list[i - 1][1].width,
-                                'height': tuple_list[i - 1][1].height,
-                                'estimated_fluence': sum_fluence
-                            }
-                        })
-                        sum_fluence = 0
-
-                if tuple_list[tuple_list_length -
-                              2][0] == tuple_list[tuple_list_length - 1][0]:
-                    if tuple_list[i - 1][4] == tuple_list[i][4]:
-                        fluences.append({
-                            'Sample': sample,
-                            'Fluence_data': {
-                                'width':
-                                tuple_list[tuple_list_length - 1][1].width,
-                                'height':
-                                tuple_list[tuple_list_length - 1][1].height,
-                                'estimated_fluence': sum_fluence
-                            }
-                        })
-                    else:
-                        fluences.append({
-                            'Sample': sample,
-                            'Fluence_data': {
-                                'width':
-                                tuple_list[tuple_list_length - 1][1].width,
-                                'height':
-                                tuple_list[tuple_list_length - 1][1].height,
-                                'estimated_fluence':
-                                tuple_list[tuple_list_length - 1][2]
-                            }
-                        })
-                else:
-                    fluences.append({
-                        'Sample': sample,
-                        'Fluence_data': {
-                            'width':
-                            tuple_list[tuple_list_length - 1][1].width,
-                            'height':
-                            tuple_list[tuple_list_length - 1][1].height,
-                            'estimated_fluence':
-                            tuple_list[tuple_list_length - 1][2]
-                        }
-                    })
-            else:
-                fluences.append({
-                    'Sample': sample,
-                    'Fluence_data': {
-                        'width': tuple_list[tuple_list_length - 1][1].width,
-                        'height': tuple_list[tuple_list_length - 1][1].height,
-                        'estimated_fluence':
-                        tuple_list[tuple_list_length - 1][2]
-                    }
-                })
-    data = {
-        'experiment': experiment,
-        'category_object': category_object,
-        'requested_fluences': requested_fluences,
-        'materials': materials,
-        'experiment_samples': experiment_samples,
-        'fluences': fluences
-    }
+    data = get_experiment_details(experiment.pk)._asdict()
     return data
 
 
 def experiment_details(request, pk):
     """Displays data regarding an experiment."""
     has_permission_or_403(request, 'experiment_details', pk)
-    experiment = get_object_or_404(Experiment, pk=pk)
-    data = get_experiment_details_data(experiment)
+    data = get_experiment_details(pk)._asdict()
     data['logged_user'] = get_logged_user(request)
     return render(request, 'samples_manager/experiment_details.html', data)
 
@@ -54,15 +54,23 @@ class IDMModelChoiceField(forms.ModelChoiceField):
 
 
 class RemoteChoiceField(forms.ChoiceField):
-    """RemoteChoiceField. Custom form remote search choice field."""
+    """
+    RemoteChoiceField. Custom form remote search choice field. By default
+    it searches locations. Otherwise url_name is the search view and 
+    get_choices returns the choices matching a submitted value.
+    """
     def __init__(self, *args, **kwargs):
+        url_name = kwargs.pop('url_name', 'samples_manager:get_locations')
+        self.get_choices = kwargs.pop('get_choices', None)
         kwargs['choices'] = ()
         super(RemoteChoiceField, self).__init__(*args, **kwargs)
-        self.widget = RemoteChoiceWidget()
+        self.widget = RemoteChoiceWidget(url_name=url_name,
+            get_choices=self.get_choices)
 
     def validate(self, value):
         """Validate that the input is in self.choices."""
-        self.choices = get_locations_choices()
+        self.choices = get_locations_choices() if self.get_choices is None \
+            else self.get_choices(value)
         super().validate(value)
         self.choices = ()
 
@@ -70,18 +78,25 @@ class RemoteChoiceField(forms.ChoiceField):
 class RemoteChoiceWidget(forms.Select):
     """Custom widget for RemoteChoiceField."""
     def __init__(self, *args, **kwargs):
+        url_name = kwargs.pop('url_name', 'samples_manager:get_locations')
+        self.get_choices = kwargs.pop('get_choices', None)
         super(RemoteChoiceWidget, self).__init__(*args, **kwargs)
         self.attrs['class'] = 'search-remote'
-        self.attrs['search-remote-url'] = reverse('samples_manager:get_locations')
+        self.attrs['search-remote-url'] = reverse(url_name)
 
     def render(self, name, value, attrs=None, renderer=None):
         """Modified widget rendering function."""
         text_html = super(RemoteChoiceWidget, self).render(name,
             value, attrs=attrs, renderer=renderer)
         index = text_html.find('\n')
+        label = str(value)
+        if self.get_choices is not None:
+            labels = dict((str(key), choice_label) 
+                for key, choice_label in self.get_choices(value))
+            label = labels.get(str(value), label)
         # Modification needed for field to load populated.
         result = text_html[:index] + '<option value="' + str(value) + \
-            '" selected>' + str(value) + '</option>' + text_html[index:]
+            '" selected>' + label + '</option>' + text_html[index:]
         return result
 
 
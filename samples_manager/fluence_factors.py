@@ -0,0 +1,74 @@
+"""
+In-process fluence factor index. Active fluence factors are loaded once, 
+keyed by irradiation table and dosimeter dimensions, and the index is 
+invalidated by FluenceFactor signals.
+"""
+import time
+import threading
+from .models import FluenceFactor
+
+# Seconds the index is kept. Bounds staleness in other processes, where 
+# signals of this process aren't received.
+FLUENCE_FACTOR_INDEX_TIMEOUT = 300
+FLUENCE_FACTOR_INDEX = {}
+FLUENCE_FACTOR_INDEX_LOCK = threading.Lock()
+
+
+def get_fluence_factor_key(irrad_table, height, width):
+    """Returns index key of irradiation table and dosimeter dimensions."""
+    result = (irrad_table, height, width)
+    return result
+
+
+def load_fluence_factor_index():
+    """
+    Loads all fluence factors with a single query. Returns index with 
+    active factors per key and default factor of value 1.
+    """
+    result = {'factors': {}, 'default': None, 'loaded_at': time.time()}
+    for factor in FluenceFactor.objects.all():
+        if result['default'] is None and factor.value == 1:
+            result['default'] = factor
+        if factor.status == 'Active':
+            key = get_fluence_factor_key(factor.irrad_table, 
+                factor.dosimeter_height, factor.dosimeter_width)
+            result['factors'].setdefault(key, []).append(factor)
+    return result
+
+
+def get_fluence_factor_index():
+    """Returns fluence factor index, loading it if required."""
+    with FLUENCE_FACTOR_INDEX_LOCK:
+        is_expired = ('loaded_at' not in FLUENCE_FACTOR_INDEX or 
+            time.time() - FLUENCE_FACTOR_INDEX['loaded_at'] 
+            > FLUENCE_FACTOR_INDEX_TIMEOUT)
+        if is_expired:
+            FLUENCE_FACTOR_INDEX.clear()
+            FLUENCE_FACTOR_INDEX.update(load_fluence_factor_index())
+        result = dict(FLUENCE_FACTOR_INDEX)
+    return result
+
+
+def invalidate_fluence_factor_index():
+    """Invalidates fluence factor index."""
+    with FLUENCE_FACTOR_INDEX_LOCK:
+        FLUENCE_FACTOR_INDEX.clear()
+
+
+def get_fluence_factors(irradiations):
+    """
+    Retrieves fluence factors for list of irradiations. If none or several 
+    active factors match, then assigns a default factor of 1. Resolved 
+    with at most one query, plus one if default factor has to be created.
+    """
+    index = get_fluence_factor_index()
+    default_factor = index['default']
+    if default_factor is None:
+        default_factor = FluenceFactor.objects.create(value=1)
+    result = []
+    for irradiation in irradiations:
+        key = get_fluence_factor_key(irradiation.irrad_table, 
+            irradiation.dosimeter.height, irradiation.dosimeter.width)
+        factors = index['factors'].get(key, [])
+        result.append(factors[0] if len(factors) == 1 else default_factor)
+    return result
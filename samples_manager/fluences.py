@@ -0,0 +1,48 @@
+"""
+Sample fluence aggregation. Estimated fluences of the irradiations of a set
+of samples are loaded with a single query and summed per sample, dosimeter
+area and dosimeter position.
+"""
+from .models import Irradiation
+
+
+def get_fluence_group_key(irradiation):
+    """
+    Returns sorting key of fluence group of irradiation. Groups are sorted
+    by dosimeter area and dosimeter position.
+    """
+    area = irradiation.dosimeter.width * irradiation.dosimeter.height
+    position = irradiation.dos_position
+    result = (area, position is None, 0 if position is None else position)
+    return result
+
+
+def get_samples_fluences(samples):
+    """
+    Calculates estimated fluences of samples grouped by dosimeter area and
+    dosimeter position. Irradiations and dosimeters of all samples are
+    loaded with a single query and grouped in a single pass. Returns
+    dictionary of sample pk to list of fluences.
+    """
+    samples = list(samples)
+    groups = dict()
+    irradiations = Irradiation.objects.filter(sample__in=samples,
+        dosimeter__isnull=False).select_related('dosimeter')
+    for irradiation in irradiations:
+        # Dosimeters with dots in their ids are not used in calculations.
+        has_fluence = (bool(irradiation.estimated_fluence)
+            and '.' not in str(irradiation.dosimeter))
+        if has_fluence:
+            key = (irradiation.sample_id, get_fluence_group_key(irradiation))
+            group = groups.setdefault(key, {'estimated_fluence': 0})
+            group['estimated_fluence'] += irradiation.estimated_fluence
+            group['width'] = irradiation.dosimeter.width
+            group['height'] = irradiation.dosimeter.height
+    result = dict((sample.pk, []) for sample in samples)
+    samples_by_pk = dict((sample.pk, sample) for sample in samples)
+    for key in sorted(groups, key=lambda key: key[1]):
+        result[key[0]].append({
+            'Sample': samples_by_pk[key[0]],
+            'Fluence_data': groups[key]
+        })
+    return result
@@ -3,6 +3,7 @@
 from .models import *
 from .fields import *
 from .utilities import *
+from .lineage import filter_childless
 from django import forms
 from django.db.models import Q
 from django.urls import reverse
@@ -78,6 +79,9 @@ PRINTER_TEMPLATES = (
 
 MAX_PRINT_COPIES = 50
 MAX_NUM_GEN_DOS_IDS = 50
+# Above this number of parent irradiations they are searched remotely.
+MAX_PREVIOUS_IRRADIATION_CHOICES = 500
+PREVIOUS_IRRADIATION_CHOICES_REQUEST_ATTR = 'previous_irradiation_choices'
 
 
 def get_fluences(experiment_id, queryset=False):
@@ -152,23 +156,50 @@ def get_box_id_choices():
     return result
 
 
-def get_previous_irradiation_choices():
+def get_previous_irradiation_label(pk, dos_id, sample_id, set_id):
+    """Returns label of parent irradiation choice."""
+    result = str(dos_id)
+    has_sample = (sample_id is not None)
+    if has_sample:
+        result = result + '|' + str(set_id)
+    result = result + '|' + str(pk)
+    return result
+
+
+def get_previous_irradiation_choices(request=None, query_string=None, 
+    pks=None, limit=None):
     """
     Returns an iterable of 2-tuples to use as choices for parent 
-    irradiations.
+    irradiations. Completed and out of beam irradiations without children
+    and their labels are loaded with a single query, optionally filtered by
+    query string or pks. Choices are cached in request if provided.
     """
-    result = []
-    irradiations = Irradiation.objects.filter(Q(status='Completed') | Q(status='OutBeam')).order_by('id')
-    for irradiation in irradiations:
-        children = Irradiation.objects.filter(previous_irradiation=irradiation.id)
-        has_no_children = (len(children) == 0)
-        if has_no_children:
-            name = str(irradiation.dosimeter.dos_id)
-            has_sample = (irradiation.sample is not None)
-            if has_sample:
-                name = name + '|' + str(irradiation.sample.set_id)
-            name = name + '|' + str(irradiation.id)
-            result.append((irradiation.id, name))
+    key = (query_string, None if pks is None else tuple(pks), limit)
+    cache = None
+    if request is not None:
+        if not hasattr(request, PREVIOUS_IRRADIATION_CHOICES_REQUEST_ATTR):
+            setattr(request, PREVIOUS_IRRADIATION_CHOICES_REQUEST_ATTR, {})
+        cache = getattr(request, PREVIOUS_IRRADIATION_CHOICES_REQUEST_ATTR)
+        if key in cache:
+            return cache[key]
+    irradiations = filter_childless(Irradiation.objects.filter(
+        Q(status='Completed') | Q(status='OutBeam')))
+    if pks is not None:
+        irradiations = irradiations.filter(pk__in=[pk for pk in pks 
+            if str(pk).isdigit()])
+    if query_string:
+        filters = Q(dosimeter__dos_id__icontains=query_string) | \
+            Q(sample__set_id__icontains=query_string)
+        if query_string.isdigit():
+            filters = filters | Q(pk=query_string)
+        irradiations = irradiations.filter(filters)
+    rows = irradiations.order_by('id').values_list('id', 'dosimeter__dos_id',
+        'sample', 'sample__set_id')
+    if limit is not None:
+        rows = rows[:limit]
+    result = [(row[0], get_previous_irradiation_label(*row)) for row in rows]
+    if cache is not None:
+        cache[key] = result
     return result
 
 
@@ -1366,6 +1397,7 @@ class IrradiationForm(ModelForm):
     Located in irradiation list view. Accessed by admins.
     """
     def __init__(self, *args, **kwargs):
+        request = kwargs.pop('request', None)
         super(IrradiationForm, self).__init__(*args, **kwargs)
         self.use_required_attribute = False
         self.fields['sample'] = SampleIrradiationChoiceField(
@@ -1382,8 +1414,16 @@ class IrradiationForm(ModelForm):
         self.fields['dosimeter'].help_text = '<p>The dosimeter associated '\
             'to this sample for the specific irradiation time interval of '\
             'Date in and Date out.</p>'
-        self.fields['previous_irradiation'] = IDMChoiceField(choices=
-            get_previous_irradiation_choices())
+        previous_irradiations = get_previous_irradiation_choices(request,
+            limit=MAX_PREVIOUS_IRRADIATION_CHOICES + 1)
+        if len(previous_irradiations) > MAX_PREVIOUS_IRRADIATION_CHOICES:
+            self.fields['previous_irradiation'] = RemoteChoiceField(
+                url_name='samples_manager:get_previous_irradiations',
+                get_choices=lambda value: get_previous_irradiation_choices(
+                    request, pks=[value]))
+        else:
+            self.fields['previous_irradiation'] = IDMChoiceField(
+                choices=previous_irradiations)
         self.fields['previous_irradiation'].required = False
         self.fields['previous_irradiation'].label = 'Previous Irradiation'
         self.fields['previous_irradiation'].help_text = '<p>Parent irradiation '\
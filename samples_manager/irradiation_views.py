@@ -4,10 +4,15 @@
 from .forms import *
 from .views import *
 from .models import *
-from django.db.models import Q
+from django.db.models import Max, Q
 from django.urls import reverse
+from django.db import connection, transaction
 from django.http import JsonResponse
 from django.template.loader import render_to_string
+from .search import is_search_index_enabled, update_search_index
+from .fluence_factors import get_fluence_factors
+from .lineage import filter_childless, get_parent_secs, \
+    mark_irradiation_parents, update_lineage_descendants
 from .templatetags.custom_filters import num_notation
 from django.shortcuts import get_object_or_404, render
 
@@ -23,6 +28,11 @@ ALERT_MESSAGES = {
     'invalid': 'Form is invalid. Please review the data.',
     'invalid_set_ids': 'Invalid operation. Samples have invalid set ids.',
 }
+NUM_RESULTS_PREVIOUS_IRRADIATION_QUERY = 20
+BEAM_DATA_REFRESH_BATCH_SIZE = 200
+BEAM_DATA_FIELDS = ['sec', 'estimated_fluence', 'fluence_factor']
+IRRADIATION_STATE_FIELDS = ['sec', 'estimated_fluence', 'fluence_factor',
+    'date_first_sec', 'date_last_sec', 'status', 'updated_at']
 
 
 def save_irradiation_form(request, form_data):
@@ -81,7 +91,8 @@ def irradiations_list(request):
     logged_user = get_logged_user(request)
     ongoing_irradiations = Irradiation.objects.all()
     search_url = reverse('samples_manager:irradiations_search')
-    pagination_data = get_pagination_data(request, ongoing_irradiations)
+    pagination_data = get_pagination_data(request, ongoing_irradiations,
+        IRRADIATIONS_ORDERING)
     return render(request, 'samples_manager/irradiations_list.html', {
         'irradiations': pagination_data['page_obj'].object_list,
         'search_url': search_url,
@@ -100,9 +111,12 @@ def irradiation_status_update(request):
     if validation_data['valid']:
         if request.method == 'POST':
             data['alert_message'] = ALERT_MESSAGES['success']
-            for pk in checked_elements:
-                irradiation = get_object_or_404(Irradiation, pk=pk)
-                new_status = request.POST['status']
+            new_status = request.POST['status']
+            beam_pks = []
+            updated_irradiations = []
+            irradiations = Irradiation.objects.filter(pk__in=checked_elements)\
+                .select_related('previous_irradiation', 'dosimeter')
+            for irradiation in irradiations:
                 same_status = \
                     (irradiation.status == new_status)
                 beam_transition = \
@@ -112,14 +126,16 @@ def irradiation_status_update(request):
                 if form.is_valid():
                     if not same_status:
                         if beam_transition:
-                            set_beam_irradiation_state([pk], new_status)
+                            beam_pks.append(irradiation.pk)
                         else:
                             form.save()
-                            set_irradiation_state([irradiation])
-                            irradiation.save()
+                            updated_irradiations.append(irradiation)
                 else:
                     data['form_is_valid'] = False
                     data['alert_message'] = ALERT_MESSAGES['invalid']
+            if beam_pks:
+                set_beam_irradiation_state(beam_pks, new_status)
+            set_irradiation_state(updated_irradiations)
             args = {'list_name': 'irradiations_list'}
             data['html_list'] = render_partial_list_to_string(
                 request, args)
@@ -156,9 +172,9 @@ def irradiation_create(request):
     if 'render_with_errors' in request.POST.keys():
         render_with_errors = bool(request.POST['render_with_errors'] == 'on')
     if request.method == 'POST':
-        form = IrradiationForm(request.POST)
+        form = IrradiationForm(request.POST, request=request)
     else:
-        form = IrradiationForm()
+        form = IrradiationForm(request=request)
     form_data = {
         'form': form,
         'current_page': current_page,
@@ -187,9 +203,10 @@ def irradiation_update(request):
         if 'render_with_errors' in request.POST.keys():
             render_with_errors = bool(request.POST['render_with_errors'] == 'on')
         if request.method == 'POST':
-            form = IrradiationForm(request.POST, instance=irradiation)
+            form = IrradiationForm(request.POST, instance=irradiation,
+                request=request)
         else:
-            form = IrradiationForm(instance=irradiation)
+            form = IrradiationForm(instance=irradiation, request=request)
         form_data = {
             'form': form,
             'current_page': current_page,
@@ -235,6 +252,69 @@ def irradiation_delete(request):
     return JsonResponse(data)
 
 
+def get_valid_group_samples(pks):
+    """
+    Retrieves samples for group irradiation with a single query. Returns 
+    None if any sample doesn't exist or has an invalid set id.
+    """
+    samples = list(Sample.objects.filter(pk__in=pks))
+    valid_samples = (len(samples) == len(set(pks)) 
+        and all(get_equipment_type(sample.set_id) is not None 
+            for sample in samples))
+    result = samples if valid_samples else None
+    return result
+
+
+def bulk_create_irradiations(irradiations):
+    """
+    Inserts irradiations with a single bulk insert and returns their pks.
+    Backends that don't return rows of bulk inserts get them with a single
+    query of the irradiations of the same samples with pks greater than 
+    the last pk before the insert. Must be called in a transaction.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        Irradiation.objects.bulk_create(irradiations)
+        result = [irradiation.pk for irradiation in irradiations]
+    else:
+        last_pk = Irradiation.objects.aggregate(last_pk=Max('pk'))['last_pk']
+        Irradiation.objects.bulk_create(irradiations)
+        result = list(Irradiation.objects.filter(pk__gt=last_pk or 0,
+            sample__in=set(irradiation.sample_id 
+                for irradiation in irradiations))
+            .order_by('pk').values_list('pk', flat=True))
+    return result
+
+
+def create_group_irradiations(samples, dosimeter, irrad_table, 
+    table_position, logged_user):
+    """
+    Creates irradiations of samples with a dosimeter in a single 
+    transaction. Initial state of all irradiations is calculated at once 
+    and they are stored with a single bulk insert. Returns pks of created
+    irradiations.
+    """
+    now = get_aware_datetime()
+    irradiations = [Irradiation(
+        sample=sample,
+        dosimeter=dosimeter,
+        irrad_table=irrad_table,
+        table_position=table_position,
+        status='Registered',
+        dos_position=1,
+        created_by=logged_user,
+        updated_by=logged_user,
+        created_at=now,
+        updated_at=now) for sample in samples]
+    set_irradiation_state(irradiations, save=False)
+    with transaction.atomic():
+        result = bulk_create_irradiations(irradiations)
+    # Bulk inserts don't send signals.
+    invalidate_elements_count(Irradiation)
+    if is_search_index_enabled():
+        update_search_index(Irradiation, result)
+    return result
+
+
 def group_irradiation_create(request, pk):
     """
     Displays and saves IrradiationGroup form. 
@@ -250,37 +330,23 @@ def group_irradiation_create(request, pk):
             data['form_is_valid'] = True
             data['alert_message'] = ALERT_MESSAGES['create_irradiation_group']
             form = GroupIrradiationForm(request.POST)
-            if form.is_valid():
+            samples = get_valid_group_samples(checked_elements)
+            if samples is None:
+                data['form_is_valid'] = False
+                data['alert_message'] = ALERT_MESSAGES['invalid_set_ids']
+            elif form.is_valid():
                 if form.cleaned_data is not None:
-                    dosimeter = form.cleaned_data['dosimeter']
-                    for pk in checked_elements:
-                        logged_user = get_logged_user(request)
-                        sample = Sample.objects.get(pk=pk)
-                        irradiation = Irradiation(dos_position=1)
-                        irradiation.save()
-                        irradiation.sample = sample
-                        irradiation.dosimeter = dosimeter
-                        irradiation.irrad_table = form.cleaned_data['irrad_table']
-                        irradiation.table_position = form.cleaned_data[
-                            'table_position']
-                        irradiation.status = 'Registered'
-                        irradiation.updated_by = logged_user
-                        irradiation.created_by = logged_user
-                        irradiation.dos_position = 1
-                        set_irradiation_state([irradiation])
-                        irradiation.save()
+                    create_group_irradiations(samples, 
+                        form.cleaned_data['dosimeter'],
+                        form.cleaned_data['irrad_table'],
+                        form.cleaned_data['table_position'],
+                        get_logged_user(request))
                 data['form_is_valid'] = True
             else:
                 data['form_is_valid'] = False
                 data['alert_message'] = ALERT_MESSAGES['invalid']
         else:
-            valid_ids = True
-            for pk in checked_elements:
-                valid_ids = (get_equipment_type(\
-                    Sample.objects.get(pk=pk).set_id) != None)
-                if not valid_ids:
-                    break
-            if valid_ids:
+            if get_valid_group_samples(checked_elements) is not None:
                 form = GroupIrradiationForm()
                 context = dict()
                 context['form'] = form
@@ -306,7 +372,8 @@ def dosimetry_results_list(request):
     logged_user = get_logged_user(request)
     results = Irradiation.objects.filter(Q(status='Completed')).order_by('id')
     search_url = reverse('samples_manager:dosimetry_results_search')
-    pagination_data = get_pagination_data(request, results)
+    pagination_data = get_pagination_data(request, results,
+        DOSIMETRY_RESULTS_ORDERING)
     return render(request, 'samples_manager/dosimetry_results_list.html', {
         'results': pagination_data['page_obj'].object_list,
         'search_url': search_url,
@@ -376,45 +443,117 @@ def irradiation_in_beam_status_update(request):
     return JsonResponse(data)
 
 
-def set_beam_irradiation_state(pks, status):
-    """Applies action related to beam state."""
+def set_beam_irradiation_state(pks, status, timestamp=None):
+    """
+    Applies action related to beam state. Affected irradiations are locked 
+    until the transition is stored and all of them share the same timestamp.
+    SEC data is calculated for all irradiations at once and continuation 
+    irradiations are created with a single bulk insert.
+    """
     set_in_beam = ('in' in status.lower() and \
         'beam' in status.lower())
-
-    for pk in pks:
-        irradiation = get_object_or_404(Irradiation, pk=pk)
-        in_beam_status, _ = Irradiation.get_beam_status()
-        if irradiation.date_out is None:
-            if set_in_beam:
-                if irradiation.status != in_beam_status:
-                    irradiation.date_in = get_aware_datetime()
-                    irradiation.date_out = None
-                    irradiation.date_first_sec = None
-                    irradiation.date_last_sec = None
-                    irradiation.status = status
+    in_beam_status, _ = Irradiation.get_beam_status()
+    now = get_aware_datetime() if timestamp is None else timestamp
+
+    with transaction.atomic():
+        irradiations = list(Irradiation.objects.filter(pk__in=pks)
+            .select_related('dosimeter').select_for_update(of=('self',)))
+        ongoing_irradiations = []
+        continuation_irradiations = []
+        for irradiation in irradiations:
+            if irradiation.date_out is None:
+                if set_in_beam:
+                    if irradiation.status != in_beam_status:
+                        irradiation.date_in = now
+                        irradiation.date_out = None
+                        irradiation.date_first_sec = None
+                        irradiation.date_last_sec = None
+                        irradiation.status = status
+                else:
+                    if irradiation.status == in_beam_status:
+                        irradiation.date_out = now
+                        irradiation.status = status
+                ongoing_irradiations.append(irradiation)
             else:
-                if irradiation.status == in_beam_status:
-                    irradiation.date_out = get_aware_datetime()
-                    sec_dates = get_sec_dates_from_irradiation(
-                        irradiation)
-                    irradiation.date_first_sec = sec_dates['date_first_sec']
-                    irradiation.date_last_sec = sec_dates['date_last_sec']
-                    irradiation.status = status
-            set_irradiation_state([irradiation])
-            irradiation.save()
-        else:
-            if set_in_beam:
-                if irradiation.status != in_beam_status:
-                    Irradiation.objects.create(
-                        sample=irradiation.sample,
-                        dosimeter=irradiation.dosimeter,
-                        previous_irradiation=irradiation,
-                        dos_position=irradiation.dos_position,
-                        irrad_table=irradiation.irrad_table,
-                        table_position=irradiation.table_position,
-                        status=in_beam_status,
-                        date_in = get_aware_datetime()
-                    )
+                if set_in_beam:
+                    if irradiation.status != in_beam_status:
+                        continuation_irradiations.append(Irradiation(
+                            sample_id=irradiation.sample_id,
+                            dosimeter_id=irradiation.dosimeter_id,
+                            previous_irradiation=irradiation,
+                            dos_position=irradiation.dos_position,
+                            irrad_table=irradiation.irrad_table,
+                            table_position=irradiation.table_position,
+                            status=in_beam_status,
+                            date_in=now,
+                            created_at=now,
+                            updated_at=now))
+
+        set_irradiation_state(ongoing_irradiations, save=False)
+        for irradiation in ongoing_irradiations:
+            irradiation.updated_at = now
+        bulk_update_irradiations(ongoing_irradiations, 
+            ['date_in', 'date_out'] + IRRADIATION_STATE_FIELDS)
+        # Bulk inserts don't call save, lineage is set explicitly.
+        for irradiation in continuation_irradiations:
+            irradiation.set_lineage()
+        continuation_pks = bulk_create_irradiations(continuation_irradiations) \
+            if continuation_irradiations else []
+        mark_irradiation_parents(continuation_irradiations)
+
+    if continuation_pks:
+        # Bulk inserts don't send signals.
+        invalidate_elements_count(Irradiation)
+        if is_search_index_enabled():
+            update_search_index(Irradiation, continuation_pks)
+
+
+def get_table_beam_irradiations(irrad_table, to_in_beam):
+    """
+    Retrieves pks of irradiations on table affected by a beam transition. 
+    Irradiations put in beam are the registered or out of beam ones without
+    continuation irradiations. Irradiations taken out are the in beam ones.
+    """
+    in_beam_status, out_beam_status = Irradiation.get_beam_status()
+    irradiations = Irradiation.objects.filter(irrad_table=irrad_table)
+    if to_in_beam:
+        irradiations = filter_childless(irradiations.filter(
+            status__in=['Registered', out_beam_status]))
+    else:
+        irradiations = irradiations.filter(status=in_beam_status)
+    result = list(irradiations.values_list('pk', flat=True))
+    return result
+
+
+def set_table_beam_state(irrad_table, to_in_beam):
+    """
+    Puts all irradiations on table in beam or takes them out of beam at 
+    the same moment. Returns pks of affected irradiations.
+    """
+    in_beam_status, out_beam_status = Irradiation.get_beam_status()
+    status = in_beam_status if to_in_beam else out_beam_status
+    result = get_table_beam_irradiations(irrad_table, to_in_beam)
+    set_beam_irradiation_state(result, status)
+    return result
+
+
+def table_beam_status_update(request):
+    """Updates in beam status of all irradiations on a table."""
+    has_permission_or_403(request, 'admin')
+    data = dict()
+    data['form_is_valid'] = False
+    if request.method == 'POST' and request.POST.get('irrad_table'):
+        to_in_beam = (request.POST.get('in_beam') == 'True')
+        pks = set_table_beam_state(request.POST['irrad_table'], to_in_beam)
+        data['form_is_valid'] = True
+        data['alert_message'] = ALERT_MESSAGES['success']
+        data['pks'] = pks
+        args = {'list_name': 'irradiations_list'}
+        data['html_list'] = render_partial_list_to_string(request, args)
+        data['updated_beam_status'] = True
+    else:
+        data['alert_message'] = ALERT_MESSAGES['invalid']
+    return JsonResponse(data)
 
 
 def get_irradiations_factor(irradiations):
@@ -422,24 +561,7 @@ def get_irradiations_factor(irradiations):
     Retrieves irradiation factors for list of irradiations.
     If none match, then assigns a default factor of 1.
     """
-    result = []
-    default_factor = None
-    factors = FluenceFactor.objects.filter(value=1)
-    exists = (len(factors) > 0)
-    if exists:
-        default_factor = factors[0]
-    else:
-        default_factor = FluenceFactor.objects.create(value=1)
-    for i in irradiations:
-        factors = FluenceFactor.objects.filter(
-            status="Active",
-            irrad_table=i.irrad_table,
-            dosimeter_height=i.dosimeter.height,
-            dosimeter_width=i.dosimeter.width)
-        if (len(factors) == 1):
-            result.append(factors[0])
-        else:
-            result.append(default_factor)
+    result = get_fluence_factors(irradiations)
     return result
 
 
@@ -447,33 +569,26 @@ def calc_beam_related_data(irradiations, with_sec_data=False, update=False):
     """Updates beam realted data of irradiaitons in list."""
     data = dict()
     data['irradiation_data'] = []
-    for irradiation in irradiations:
-        has_parent = (irradiation.previous_irradiation \
-            is not None)
-        acc_sec = 0
-        # If has parent calculate parent's acc_sec if not already done. 
-        if has_parent:
-            parent_sec = 0 if irradiation.previous_irradiation.sec is None \
-                else irradiation.previous_irradiation.sec
-            acc_sec += parent_sec
-        if irradiation.date_in:
-            if irradiation.date_out:
-                acc_sec += calc_acc_sec_in_range(irradiation.date_in,
-                    irradiation.date_out)
-            else:
-                acc_sec += calc_acc_sec_in_range(irradiation.date_in)
+    # SEC and SEC dates of all irradiations are calculated in a single batch.
+    sec_data = calc_sec_data_in_ranges([(irradiation.date_in, 
+        irradiation.date_out) for irradiation in irradiations])
+    factors = get_irradiations_factor(irradiations)
+    # Accumulated SEC of previous irradiations is stored in lineage data.
+    parent_secs = get_parent_secs(irradiations)
+    for irradiation, sec_element, factor, parent_sec in zip(irradiations,
+        sec_data, factors, parent_secs):
+        acc_sec = 0 if parent_sec is None else parent_sec
+        acc_sec += sec_element['sec']
         # Other values
-        factor = get_irradiations_factor([irradiation])[0]
         estimated_fluence = acc_sec * factor.value
         is_in_beam = (irradiation.status == 'InBeam')
 
         if with_sec_data:
-            sec_dates = get_sec_dates_from_irradiation(
-                    irradiation)
+            sec_dates = sec_element
         
         # Update irradiations if required
         if update:
-            irradiation.sec = acc_sec
+            irradiation.sec = round_sec(acc_sec)
             irradiation.estimated_fluence = estimated_fluence
             irradiation.fluence_factor = factor
             if with_sec_data:
@@ -526,28 +641,67 @@ def get_irradiation_state(irradiations):
     return result
 
 
-def set_irradiation_state(irradiations):
-    """Sets data according to iiradiation state."""
+def get_irradiation_state_values(state, element):
+    """Returns field values of irradiation according to its state."""
+    result = {
+        'sec': None,
+        'estimated_fluence': None,
+        'fluence_factor_id': None,
+        'date_first_sec': None,
+        'date_last_sec': None,
+        'status': IRRADIATION_STATUS[state][0],
+    }
+    if state > 0:
+        result['sec'] = round_sec(element['sec'])
+        result['estimated_fluence'] = element['estimated_fluence']
+        result['fluence_factor_id'] = element['factor'].id
+        result['date_first_sec'] = element['date_first_sec']
+    if state > 1:
+        result['date_last_sec'] = element['date_last_sec']
+    return result
+
+
+def bulk_update_irradiations(irradiations, fields):
+    """
+    Stores fields of irradiations with a single bulk update. Bulk updates 
+    don't send signals, so search index and lineage data of children are 
+    updated explicitly.
+    """
+    Irradiation.objects.bulk_update(irradiations, fields)
+    if 'sec' in fields:
+        update_lineage_descendants([e.pk for e in irradiations])
+    if is_search_index_enabled():
+        update_search_index(Irradiation, [e.pk for e in irradiations])
+
+
+def set_irradiation_state(irradiations, save=True):
+    """
+    Sets data according to iiradiation state. Beam related data of all 
+    irradiations is calculated at once and, if save is True, changed 
+    irradiations are stored with a single bulk update. Returns changed 
+    irradiations.
+    """
     data = calc_beam_related_data(irradiations, True)['irradiation_data']
     states = get_irradiation_state(irradiations)
-    for i in range(0, len(irradiations)):
-        for e in data:
-            if e['pk'] == irradiations[i].id:
-                if states[i] is not None:
-                    irradiations[i].sec = None
-                    irradiations[i].estimated_fluence = None
-                    irradiations[i].fluence_factor = None
-                    irradiations[i].date_first_sec = None
-                    irradiations[i].date_last_sec = None
-                    irradiations[i].status = IRRADIATION_STATUS[states[i]][0]
-                    if states[i] > 0:
-                        irradiations[i].sec = e['sec']
-                        irradiations[i].estimated_fluence = e['estimated_fluence']
-                        irradiations[i].fluence_factor = e['factor']
-                        irradiations[i].date_first_sec = e['date_first_sec']
-                    if states[i] > 1:
-                        irradiations[i].date_last_sec = e['date_last_sec']
-                    irradiations[i].save()
+    result = []
+    for irradiation, state, element in zip(irradiations, states, data):
+        if state is None:
+            continue
+        values = get_irradiation_state_values(state, element)
+        changed = False
+        for key, value in values.items():
+            if getattr(irradiation, key) != value:
+                setattr(irradiation, key, value)
+                changed = True
+        if changed:
+            result.append(irradiation)
+
+    if save and result:
+        now = get_aware_datetime()
+        for irradiation in result:
+            irradiation.updated_at = now
+        bulk_update_irradiations(result, IRRADIATION_STATE_FIELDS)
+    return result
 
 
 def update_sec(request):
@@ -557,11 +711,9 @@ def update_sec(request):
     """
     has_permission_or_403(request, 'admin')
     checked_elements = get_checked_elements(request)
-    irradiations = []
-    for pk in checked_elements:
-        irradiation = Irradiation.objects.get(pk=pk)
-        if 'InBeam' in irradiation.status:
-            irradiations.append(irradiation)
+    irradiations = list(Irradiation.objects.filter(pk__in=checked_elements,
+        status__contains='InBeam').select_related('previous_irradiation',
+        'dosimeter'))
     data = calc_beam_related_data(irradiations, False, True)
     # Apply scientific notation
     for e in data['irradiation_data']:
@@ -573,6 +725,52 @@ def update_sec(request):
     return JsonResponse(data)
 
 
+def refresh_in_beam_irradiations(batch_size=BEAM_DATA_REFRESH_BATCH_SIZE):
+    """
+    Recomputes accumulated SEC and estimated fluence of in beam 
+    irradiations in batches and stores them with bulk updates. Returns 
+    number of refreshed irradiations.
+    """
+    result = 0
+    in_beam_status, _ = Irradiation.get_beam_status()
+    irradiations = Irradiation.objects.filter(status=in_beam_status)\
+        .select_related('dosimeter')
+    pks = list(irradiations.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(pks), batch_size):
+        batch = list(irradiations.filter(pk__in=pks[start:start + batch_size]))
+        data = calc_beam_related_data(batch)['irradiation_data']
+        for irradiation, element in zip(batch, data):
+            irradiation.sec = round_sec(element['sec'])
+            irradiation.estimated_fluence = element['estimated_fluence']
+            irradiation.fluence_factor = element['factor']
+        bulk_update_irradiations(batch, BEAM_DATA_FIELDS)
+        result += len(batch)
+    return result
+
+
+def get_previous_irradiations(request):
+    """Searches irradiations which can be used as previous irradiation."""
+    has_permission_or_403(request, 'admin')
+    data = dict()
+    data['success'] = True
+    results = []
+    if request.method == 'GET':
+        filter_str = request.GET.get('q')
+        data['q'] = filter_str
+        choices = get_previous_irradiation_choices(request, filter_str, 
+            limit=NUM_RESULTS_PREVIOUS_IRRADIATION_QUERY)
+        for value, name in choices:
+            results.append({
+                'name': name,
+                'value': value,
+            })
+    else:
+        data['success'] = False
+    data['results'] = results
+    data['length'] = len(results)
+    return JsonResponse(data)
+
+
 def select_table(request):
     """Retrieves irradiations related to a table."""
     has_permission_or_403(request, 'admin')
@@ -0,0 +1,178 @@
+"""
+Materialized irradiation lineage. Every irradiation stores the root of its
+chain of previous irradiations, its depth in the chain, the accumulated SEC
+of its previous irradiation and whether it has children, so chain totals and
+children checks are single indexed lookups instead of walks over the chain.
+"""
+from django.db import models, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Subquery, Value, \
+    When
+from django.db.models.functions import Coalesce
+from .models import Irradiation
+
+LINEAGE_FIELDS = ['lineage_root', 'lineage_depth', 'parent_sec',
+    'has_children']
+LINEAGE_BATCH_SIZE = 500
+# Cached once lineage data of all irradiations is stored. Irradiations
+# saved afterwards get their lineage data on save, so it stays stored.
+LINEAGE_STATE = {}
+
+
+def get_lineage(irradiation):
+    """Returns irradiations of chain of irradiation ordered by depth."""
+    root = irradiation.id if irradiation.lineage_root is None \
+        else irradiation.lineage_root
+    result = Irradiation.objects.filter(Q(pk=root) | Q(lineage_root=root))\
+        .order_by('lineage_depth', 'id')
+    return result
+
+
+def is_lineage_materialized():
+    """
+    Checks if lineage data of all irradiations is stored. Irradiations
+    created before lineage data existed have depth 0 even when they have
+    a previous irradiation. Checked until it is stored, cached afterwards.
+    """
+    if not LINEAGE_STATE.get('materialized'):
+        LINEAGE_STATE['materialized'] = not Irradiation.objects.filter(
+            previous_irradiation__isnull=False, lineage_depth=0).exists()
+    result = LINEAGE_STATE['materialized']
+    return result
+
+
+def invalidate_lineage_state():
+    """
+    Invalidates cached lineage state. Used when lineage data is cleared
+    without saving irradiations.
+    """
+    LINEAGE_STATE.clear()
+
+
+def materialize_lineage():
+    """
+    Stores lineage data of all irradiations if it isn't stored yet.
+    Returns number of updated irradiations.
+    """
+    result = 0 if is_lineage_materialized() else rebuild_irradiation_lineage()
+    return result
+
+
+def filter_childless(irradiations):
+    """
+    Filters irradiations without continuation irradiations. Children
+    flags are used once lineage data is stored, children are joined
+    before.
+    """
+    if is_lineage_materialized():
+        result = irradiations.filter(has_children=False)
+    else:
+        result = irradiations.filter(irradiation__isnull=True)
+    return result
+
+
+def get_parent_secs(irradiations):
+    """
+    Returns accumulated SEC of previous irradiation of each irradiation.
+    Stored lineage data is used. Previous irradiations of irradiations
+    without it are loaded with a single query.
+    """
+    missing = set(irradiation.previous_irradiation_id
+        for irradiation in irradiations
+        if irradiation.previous_irradiation_id is not None
+        and irradiation.parent_sec is None)
+    secs = dict(Irradiation.objects.filter(pk__in=missing)
+        .values_list('pk', 'sec')) if missing else {}
+    result = [secs.get(irradiation.previous_irradiation_id)
+        if irradiation.parent_sec is None else irradiation.parent_sec
+        for irradiation in irradiations]
+    return result
+
+
+def update_has_children(pks):
+    """Recalculates children flag of irradiations with a single update."""
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        children = Irradiation.objects.filter(previous_irradiation=OuterRef('pk'))
+        Irradiation.objects.filter(pk__in=pks).update(has_children=Case(
+            When(Exists(children), then=Value(True)), default=Value(False),
+            output_field=models.BooleanField()))
+
+
+def mark_irradiation_parents(irradiations):
+    """
+    Flags previous irradiations of new irradiations as having children.
+    Used after bulk inserts, which don't call save.
+    """
+    pks = set(irradiation.previous_irradiation_id
+        for irradiation in irradiations
+        if irradiation.previous_irradiation_id is not None)
+    if pks:
+        Irradiation.objects.filter(pk__in=pks).update(has_children=True)
+
+
+def update_lineage_descendants(pks):
+    """
+    Propagates lineage data of irradiations to their descendants. Each
+    level of the chains is updated with a single query.
+    """
+    parents = Irradiation.objects.filter(pk=OuterRef('previous_irradiation'))
+    pks = list(pks)
+    while pks:
+        pks = list(Irradiation.objects.filter(previous_irradiation__in=pks)
+            .values_list('pk', flat=True))
+        if pks:
+            Irradiation.objects.filter(pk__in=pks).update(
+                lineage_root=Coalesce(
+                    Subquery(parents.values('lineage_root')[:1]),
+                    F('previous_irradiation'),
+                    output_field=models.IntegerField()),
+                lineage_depth=Subquery(parents.values('lineage_depth')[:1]) + 1,
+                parent_sec=Subquery(parents.values('sec')[:1]))
+
+
+def get_lineage_values(pk, parents, values):
+    """
+    Returns (root, depth) of irradiation from its chain of previous
+    irradiations. Calculated values are stored in values.
+    """
+    chain = []
+    current = pk
+    while current is not None and current not in values \
+        and current not in chain:
+        chain.append(current)
+        current = parents.get(current)
+    root, depth = (None, -1) if current is None or current in chain \
+        else values[current]
+    for element in reversed(chain):
+        parent = parents.get(element)
+        if parent is None or depth < 0:
+            root, depth = None, 0
+        else:
+            root, depth = (parent if root is None else root), depth + 1
+        values[element] = (root, depth)
+    return values[pk]
+
+
+def rebuild_irradiation_lineage():
+    """
+    Recalculates lineage data of all irradiations in memory and stores it
+    with bulk updates. Returns number of irradiations.
+    """
+    rows = list(Irradiation.objects.order_by()
+        .values_list('pk', 'previous_irradiation', 'sec'))
+    parents = {pk: parent for pk, parent, _ in rows}
+    secs = {pk: sec for pk, _, sec in rows}
+    with_children = set(parent for parent in parents.values()
+        if parent is not None)
+    values = {}
+    irradiations = []
+    for pk, parent, _ in rows:
+        root, depth = get_lineage_values(pk, parents, values)
+        irradiations.append(Irradiation(id=pk, lineage_root=root,
+            lineage_depth=depth, parent_sec=secs.get(parent),
+            has_children=(pk in with_children)))
+    with transaction.atomic():
+        Irradiation.objects.bulk_update(irradiations, LINEAGE_FIELDS,
+            batch_size=LINEAGE_BATCH_SIZE)
+    LINEAGE_STATE['materialized'] = True
+    return len(irradiations)
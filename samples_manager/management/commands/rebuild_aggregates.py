@@ -0,0 +1,14 @@
+"""Management command recalculating sample and experiment aggregates."""
+from django.core.management.base import BaseCommand
+from samples_manager.aggregates import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    """Recalculates aggregates of all samples and experiments in bulk."""
+    help = 'Recalculates aggregates of all samples and experiments in bulk.'
+
+    def handle(self, *args, **options):
+        """Rebuilds aggregates and reports number of updated instances."""
+        num_samples, num_experiments = rebuild_aggregates()
+        self.stdout.write('%d samples and %d experiments updated' 
+            % (num_samples, num_experiments))
@@ -0,0 +1,13 @@
+"""Management command rebuilding materialized irradiation lineage."""
+from django.core.management.base import BaseCommand
+from samples_manager.lineage import rebuild_irradiation_lineage
+
+
+class Command(BaseCommand):
+    """Recalculates lineage data of all irradiations in bulk."""
+    help = 'Recalculates lineage data of all irradiations in bulk.'
+
+    def handle(self, *args, **options):
+        """Rebuilds lineage data and reports number of irradiations."""
+        result = rebuild_irradiation_lineage()
+        self.stdout.write('%d irradiations updated' % result)
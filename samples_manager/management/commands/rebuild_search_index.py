@@ -0,0 +1,15 @@
+"""Management command rebuilding the search index table."""
+from django.core.management.base import BaseCommand
+from samples_manager.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    """Rebuilds search index of all indexed models in bulk."""
+    help = 'Rebuilds search index of all indexed models in bulk.'
+
+    def handle(self, *args, **options):
+        """Rebuilds search index and reports indexed instances per model."""
+        result = rebuild_search_index()
+        for model_name, num_entries in result.items():
+            self.stdout.write('%s: %d entries indexed' 
+                % (model_name, num_entries))
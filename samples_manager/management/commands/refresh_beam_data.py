@@ -0,0 +1,51 @@
+"""Management command refreshing SEC and fluence of in beam irradiations."""
+import time
+import logging
+from django.core.management.base import BaseCommand
+from samples_manager.irradiation_views import refresh_in_beam_irradiations, \
+    BEAM_DATA_REFRESH_BATCH_SIZE
+from samples_manager.sec_cache import get_sec_cache_range, sync_sec_cache
+
+REFRESH_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    """
+    Periodically recomputes SEC and estimated fluence of in beam 
+    irradiations. The local SEC cache is synced before every refresh if it
+    has been initialised with sync_sec_cache.
+    """
+    help = 'Periodically recomputes SEC and estimated fluence of in beam '\
+        'irradiations.'
+
+    def add_arguments(self, parser):
+        """Adds command arguments."""
+        parser.add_argument('--interval', type=int, default=REFRESH_INTERVAL,
+            help='Seconds between refreshes.')
+        parser.add_argument('--batch-size', type=int, 
+            default=BEAM_DATA_REFRESH_BATCH_SIZE,
+            help='Irradiations refreshed per batch.')
+        parser.add_argument('--once', action='store_true',
+            help='Refresh once and exit.')
+
+    def handle(self, *args, **options):
+        """Runs refresh loop."""
+        while True:
+            try:
+                self.refresh(options['batch_size'])
+            except Exception:
+                if options['once']:
+                    raise
+                logging.exception('Error refreshing beam data.')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, batch_size):
+        """Syncs SEC cache and refreshes in beam irradiations."""
+        cache_start, _ = get_sec_cache_range()
+        if cache_start is not None:
+            sync_sec_cache()
+        num_irradiations = refresh_in_beam_irradiations(batch_size)
+        self.stdout.write('%d in beam irradiations refreshed' 
+            % num_irradiations)
@@ -0,0 +1,24 @@
+"""Management command syncing the local SEC cache."""
+from datetime import datetime as dt
+from django.core.management.base import BaseCommand
+from samples_manager.sec_cache import sync_sec_cache
+from samples_manager.utilities import datetime_naive_to_aware
+
+
+class Command(BaseCommand):
+    """Appends new SEC measurements to the local SEC cache."""
+    help = 'Appends new SEC measurements to the local SEC cache.'
+
+    def add_arguments(self, parser):
+        """Adds command arguments."""
+        parser.add_argument('--since', type=dt.fromisoformat, default=None,
+            help='UTC date (YYYY-MM-DD) of first measurement synced when '\
+                'the cache is empty. By default all measurements are synced.')
+
+    def handle(self, *args, **options):
+        """Syncs SEC cache and reports number of synced measurements."""
+        since = options['since']
+        if since is not None and since.tzinfo is None:
+            since = datetime_naive_to_aware(since)
+        num_measurements = sync_sec_cache(since)
+        self.stdout.write('%d SEC measurements synced' % num_measurements)
@@ -14,3 +14,15 @@ class TimezoneMiddleware:
         timezone.activate(tz)
         return self.get_response(request)
 
+
+
+class LoggedUserMiddleware:
+    """App logged user middleware."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Resolves logged user once and stores it in request.logged_user."""
+        from ..views import get_logged_user
+        get_logged_user(request)
+        return self.get_response(request)
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from .utilities import *
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 # Create your models here.
@@ -25,6 +26,8 @@ EXPERIMENT_STATUS = (STATUS[0], STATUS[1], STATUS[2], STATUS[3], STATUS[4], STAT
 FLUENCE_FACTOR_STATUS = (STATUS[15], STATUS[16])
 FLUENCE_FACTOR_NUCLIDE = (('Na-22', 'Na-22'), ('Na-24', 'Na-24'))
 EXPERIMENT_VISIBILITY = (('Public', 'Public'), ('Private', 'Private'))
+# Maximum length of search index tokens, and of keywords searched in it.
+SEARCH_TOKEN_MAX_LENGTH = 100
 DOSIMETER_CATEGORY = (('Aluminium', 'Aluminium'), ('Film', 'Film'),
                       ('Diamond', 'Diamond'), ('Other', 'Other'))
 
@@ -206,20 +209,14 @@ class Experiment(models.Model):
         super(Experiment, self).save(*args, **kwargs)
     
     def set_additional_info(self):
-        """Method to set additional information in model."""
-        samples = Sample.objects.filter(experiment=self.id)
-        radiation_length_occupancy = 0
-        nu_coll_length_occupancy = 0
-        nu_int_length_occupancy = 0
-        for sample in samples:
-            radiation_length_occupancy += sample.radiation_length_occupancy
-            nu_coll_length_occupancy += sample.nu_coll_length_occupancy
-            nu_int_length_occupancy += sample.nu_int_length_occupancy
-        self.number_registered_samples = samples.count()
-        self.number_users = self.users.count() + 1
-        self.radiation_length_occupancy = radiation_length_occupancy
-        self.nu_coll_length_occupancy = nu_coll_length_occupancy
-        self.nu_int_length_occupancy = nu_int_length_occupancy
+        """
+        Method to set additional information in model. Aggregates are 
+        calculated in the database, see aggregates module.
+        """
+        from .aggregates import get_experiment_aggregates
+        aggregates = get_experiment_aggregates([self.id]).get(self.id, {})
+        for field, value in aggregates.items():
+            setattr(self, field, value)
     
     class Meta:
         ordering = ['-updated_at', 'title']
@@ -434,29 +431,34 @@ class Sample(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        """Overwritten method. See Model class."""
+        """
+        Overwritten method. See Model class. Aggregates of sample and its
+        experiment are queued by signals, see aggregates module.
+        """
         if not self.id:
             self.created_at = get_aware_datetime()
         self.updated_at = get_aware_datetime()
-        self.set_additional_info()
         super(Sample, self).save(*args, **kwargs)
-        if self.experiment:
-            self.experiment.save()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Overwritten method. See Model class. Keeps loaded experiment to 
+        update its aggregates when sample is moved to another experiment.
+        """
+        instance = super(Sample, cls).from_db(db, field_names, values)
+        instance._loaded_experiment_id = instance.__dict__.get('experiment_id')
+        return instance
     
     def set_additional_info(self):
-        """Method to set additional information in model."""
-        occ_list = Occupancy.objects.filter(sample=self.id)
-        radiation_length_occupancy = 0
-        nu_coll_length_occupancy = 0
-        nu_int_length_occupancy = 0
-        for occ in occ_list:
-            radiation_length_occupancy += occ.radiation_length_occupancy
-            nu_coll_length_occupancy += occ.nu_coll_length_occupancy
-            nu_int_length_occupancy += occ.nu_int_length_occupancy
-        
-        self.radiation_length_occupancy = radiation_length_occupancy
-        self.nu_coll_length_occupancy = nu_coll_length_occupancy
-        self.nu_int_length_occupancy = nu_int_length_occupancy
+        """
+        Method to set additional information in model. Aggregates are 
+        calculated in the database, see aggregates module.
+        """
+        from .aggregates import get_sample_aggregates
+        aggregates = get_sample_aggregates([self.id]).get(self.id, {})
+        for field, value in aggregates.items():
+            setattr(self, field, value)
 
     class Meta:
         ordering = ['-updated_at', 'set_id']
@@ -490,10 +492,11 @@ class Occupancy(models.Model):
                 self.nu_int_length_occupancy)
 
     def save(self, *args, **kwargs):
-        """Overwritten method. See Model class."""
+        """
+        Overwritten method. See Model class. Aggregates of sample are 
+        queued by signals, see aggregates module.
+        """
         super(Occupancy, self).save(*args, **kwargs)
-        if self.sample:
-            self.sample.save()
 
 
 class Dosimeter(models.Model):
@@ -602,10 +605,29 @@ class Compound(models.Model):
     Attributes:
         name (CharField): name of compound.
         density (DecimalField): density of compound.
+        radiation_length (DecimalField): radiation length of elements
+            weighted by their percentage, stored exactly. None if not
+            calculated yet.
+        nu_coll_length (DecimalField): weighted nuclear collision length.
+        nu_int_length (DecimalField): weighted nuclear interaction length.
+        linear_radiation_length (FloatField): weighted radiation length
+            divided by density, approximated. 0 if compound has no elements
+            or density.
+        linear_nu_coll_length (FloatField): linear nuclear collision length.
+        linear_nu_int_length (FloatField): linear nuclear interaction length.
     """
     name = models.CharField(max_length=30, unique=True)
     density = models.DecimalField(max_digits=16, decimal_places=7, null=True)
     num_associated_samples = models.PositiveIntegerField(default=0)
+    radiation_length = models.DecimalField(max_digits=26, decimal_places=8,
+        null=True)
+    nu_coll_length = models.DecimalField(max_digits=26, decimal_places=8,
+        null=True)
+    nu_int_length = models.DecimalField(max_digits=26, decimal_places=8,
+        null=True)
+    linear_radiation_length = models.FloatField(null=True)
+    linear_nu_coll_length = models.FloatField(null=True)
+    linear_nu_int_length = models.FloatField(null=True)
 
     def __str__(self):  # __str__ on Python 2
         """Overwritten method. See object class."""
@@ -617,12 +639,24 @@ class Compound(models.Model):
         super(Compound, self).save(*args, **kwargs)
 
     def get_num_associated_samples(self):
-        layers = Layer.objects.filter(compound_type=self)
-        result = []
-        for layer in layers:
-            if layer.sample not in result:
-                result.append(layer.sample)
-        return len(result)
+        """Counts samples with layers of compound with a single query."""
+        result = Layer.objects.filter(compound_type=self, sample__isnull=False)\
+            .values('sample').distinct().count()
+        return result
+
+    @staticmethod
+    def update_num_associated_samples(pks):
+        """
+        Updates stored number of associated samples of compounds with a 
+        single query.
+        """
+        num_samples = Layer.objects.filter(compound_type=models.OuterRef('pk'))\
+            .order_by().values('compound_type').annotate(
+            num_samples=models.Count('sample', distinct=True))\
+            .values('num_samples')
+        Compound.objects.filter(pk__in=[pk for pk in pks if pk is not None])\
+            .update(num_associated_samples=Coalesce(
+            models.Subquery(num_samples), 0))
 
     class Meta:
         ordering = ['name']
@@ -661,11 +695,17 @@ class Layer(models.Model):
         """Overwritten method. See object class."""
         return str(self.name)
 
-    def save(self, *args, **kwargs):
-        """Overwritten method. See Model class."""
-        super(Layer, self).save(*args, **kwargs)
-        if self.compound_type:
-            self.compound_type.save()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Overwritten method. See Model class. Keeps loaded compound to 
+        update its number of associated samples when it changes. It is 
+        updated by signals.
+        """
+        instance = super(Layer, cls).from_db(db, field_names, values)
+        instance._loaded_compound_type_id = \
+            instance.__dict__.get('compound_type_id')
+        return instance
 
 
 class FluenceFactor(models.Model):
@@ -714,6 +754,13 @@ class Irradiation(models.Model):
         sample (Sample): sample instance.
         dosimeter (Dosimeter): dosimeter instance.
         previous_irradiation (Irradiation): previous irradiation used as base.
+        lineage_root (IntegerField): id of first irradiation of the chain of
+            previous irradiations. None if irradiation has no parent.
+        lineage_depth (IntegerField): number of previous irradiations.
+        parent_sec (PositiveIntegerField): accumulated secondary emission
+            chamber measurements of previous irradiation.
+        has_children (BooleanField): true if irradiation is the previous
+            irradiation of another one.
         fluence_factor (FluenceFactor): fluence factor corresponding to irradiation.
         date_in (DateTimeField): timestamp of beguinning of exposure to beam.
         date_out (DateTimeField): timestamp of end of exposure to beam.
@@ -736,6 +783,10 @@ class Irradiation(models.Model):
     sample = models.ForeignKey(Sample, on_delete=models.CASCADE, null=True)
     dosimeter = models.ForeignKey(Dosimeter, on_delete=models.CASCADE, null=True)
     previous_irradiation = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True)
+    lineage_root = models.IntegerField(null=True, db_index=True)
+    lineage_depth = models.IntegerField(default=0)
+    parent_sec = models.PositiveIntegerField(null=True)
+    has_children = models.BooleanField(default=False, db_index=True)
     fluence_factor = models.ForeignKey(FluenceFactor, on_delete=models.SET_NULL, blank=True, null=True)
     date_in = models.DateTimeField(blank=True, null=True)
     date_out = models.DateTimeField(blank=True, null=True)
@@ -771,8 +822,52 @@ class Irradiation(models.Model):
         if not self.id:
             self.created_at = get_aware_datetime()
         self.updated_at = get_aware_datetime()
+        self.set_lineage()
         return super(Irradiation, self).save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Overwritten method. See Model class. Keeps loaded previous 
+        irradiation and lineage values to update lineage data when they
+        change.
+        """
+        instance = super(Irradiation, cls).from_db(db, field_names, values)
+        instance._loaded_previous_irradiation_id = \
+            instance.__dict__.get('previous_irradiation_id')
+        instance._loaded_lineage_values = instance.get_lineage_values()
+        return instance
+
+    def get_lineage_values(self):
+        """Returns loaded values copied to lineage data of children."""
+        result = tuple(self.__dict__.get(name)
+            for name in ('lineage_root', 'lineage_depth', 'sec'))
+        return result
+
+    def set_lineage(self):
+        """
+        Sets lineage data from previous irradiation. Lineage data of saved
+        irradiations with unchanged previous irradiation is kept, it is
+        updated when the previous irradiation is saved.
+        """
+        is_unchanged = self.id is not None \
+            and self.previous_irradiation_id == getattr(self,
+                '_loaded_previous_irradiation_id', None) \
+            and (self.previous_irradiation_id is None
+                or self.lineage_depth > 0)
+        if is_unchanged:
+            return
+        parent = self.previous_irradiation
+        if parent is None:
+            self.lineage_root = None
+            self.lineage_depth = 0
+            self.parent_sec = None
+        else:
+            self.lineage_root = parent.id if parent.lineage_root is None \
+                else parent.lineage_root
+            self.lineage_depth = parent.lineage_depth + 1
+            self.parent_sec = parent.sec
+
     @staticmethod
     def get_beam_status():
         """Retrieves beam status' values for irradiations."""
@@ -809,3 +904,67 @@ class ArchiveExperimentSample(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+
+
+class SearchIndex(models.Model):
+    """
+    SearchIndex data model.
+
+    Search token of a searchable instance. Tokens are the lowercased 
+    suffixes of at least three characters of the words of the identifier 
+    and number fields of the instance and of its related models, so 
+    keywords are matched with prefix lookups on the token index. Comments
+    and dates aren't indexed. Used instead of the joined search query when 
+    SEARCH_INDEX_ENABLED setting is active.
+
+    Attributes:
+        model_name (CharField): model name of indexed instance.
+        object_id (PositiveIntegerField): id of indexed instance.
+        token (CharField): word suffix of instance and related instances.
+    """
+    model_name = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    token = models.CharField(max_length=SEARCH_TOKEN_MAX_LENGTH)
+
+    def __str__(self):  # __str__ on Python 2
+        """Overwritten method. See object class."""
+        return self.model_name + '(' + str(self.object_id) + '): ' + \
+            self.token
+
+    class Meta:
+        unique_together = ('model_name', 'object_id', 'token')
+        indexes = [models.Index(fields=['model_name', 'token'])]
+
+
+class SecMeasurement(models.Model):
+    """
+    SecMeasurement data model.
+
+    Local copy of SEC database measurements, synced periodically. Stores the
+    accumulated SEC up to each measurement, so the SEC of a date range is 
+    the difference between two accumulated values. Timestamps aren't unique,
+    both occurrences of the hour repeated when daylight saving time ends 
+    are stored as its last occurrence.
+
+    Attributes:
+        sequence (PositiveBigIntegerField): position of measurement in the 
+            SEC database.
+        timestamp (DateTimeField): timestamp of measurement.
+        value (DecimalField): SEC value of measurement.
+        cumulative_value (DecimalField): accumulated SEC up to measurement.
+        is_positive (BooleanField): True if SEC value is positive.
+    """
+    sequence = models.PositiveBigIntegerField(unique=True)
+    timestamp = models.DateTimeField()
+    value = models.DecimalField(max_digits=26, decimal_places=6)
+    cumulative_value = models.DecimalField(max_digits=26, decimal_places=6)
+    is_positive = models.BooleanField()
+
+    def __str__(self):  # __str__ on Python 2
+        """Overwritten method. See object class."""
+        return str(self.timestamp) + '(' + str(self.value) + ')'
+
+    class Meta:
+        ordering = ['sequence']
+        indexes = [models.Index(fields=['timestamp', 'sequence']),
+            models.Index(fields=['is_positive', 'timestamp'])]
@@ -0,0 +1,192 @@
+"""
+Batched occupancy engine. Element properties are loaded once per process,
+weighted lengths of compounds are calculated from their elements and stored
+in compound columns, and occupancies of many samples are calculated from 
+those columns with a single layers query. Values are summed in a per-element
+Decimal loop, so stored occupancies are rounded from the same values as the
+former per-sample loops.
+"""
+import threading
+from decimal import Decimal
+from django.db import transaction
+from .aggregates import queue_aggregates
+from .models import Compound, CompoundElement, Element, Layer, Occupancy
+
+OCCUPANCY_DECIMAL_PLACES = 3
+# Element properties, as element id to radiation, nuclear collision and
+# nuclear interaction lengths.
+ELEMENT_PROPERTIES = {}
+ELEMENT_PROPERTIES_LOCK = threading.Lock()
+LENGTH_FIELDS = ['radiation_length', 'nu_coll_length', 'nu_int_length']
+LINEAR_LENGTH_FIELDS = ['linear_radiation_length', 'linear_nu_coll_length',
+    'linear_nu_int_length']
+OCCUPANCY_FIELDS = ['radiation_length_occupancy', 'nu_coll_length_occupancy',
+    'nu_int_length_occupancy']
+
+
+def get_element_properties():
+    """
+    Returns dictionary of element id to lengths. Element table is static, 
+    so it is loaded with a single query the first time.
+    """
+    with ELEMENT_PROPERTIES_LOCK:
+        if not ELEMENT_PROPERTIES:
+            ELEMENT_PROPERTIES.update((row[0], row[1:]) for row in
+                Element.objects.values_list('id', *LENGTH_FIELDS))
+        result = dict(ELEMENT_PROPERTIES)
+    return result
+
+
+def invalidate_element_properties():
+    """Invalidates element properties."""
+    with ELEMENT_PROPERTIES_LOCK:
+        ELEMENT_PROPERTIES.clear()
+
+
+def calc_compounds_weighted_lengths(compound_ids):
+    """
+    Calculates weighted radiation, nuclear collision and nuclear interaction
+    lengths of compounds from their elements with a single query. Returns
+    dictionary of compound id to lengths list. Compounds without elements
+    aren't included.
+    """
+    rows = list(CompoundElement.objects.filter(compound__in=compound_ids)
+        .order_by('id').values_list('compound', 'element_type', 'percentage'))
+    if not rows:
+        return {}
+    lengths = get_element_properties()
+    if any(row[1] not in lengths for row in rows):
+        # Elements created in another process.
+        invalidate_element_properties()
+        lengths = get_element_properties()
+    totals = {}
+    for compound, element, percentage in rows:
+        compound_totals = totals.setdefault(compound, [0] * len(LENGTH_FIELDS))
+        for index, length in enumerate(lengths[element]):
+            compound_totals[index] += percentage * length
+    result = dict((compound, [total / 100 for total in compound_totals])
+        for compound, compound_totals in totals.items())
+    return result
+
+
+def update_compound_lengths(compounds):
+    """
+    Calculates and stores weighted and linear lengths of compounds with a
+    single bulk update. Called when compounds or their elements change.
+    """
+    compounds = list(compounds)
+    weighted_lengths = calc_compounds_weighted_lengths(
+        [compound.id for compound in compounds])
+    for compound in compounds:
+        weighted = weighted_lengths.get(compound.id, [0] * len(LENGTH_FIELDS))
+        density = compound.density or 0
+        has_linear_lengths = (compound.id in weighted_lengths and density != 0)
+        linear = [value / density for value in weighted] \
+            if has_linear_lengths else [0] * len(LENGTH_FIELDS)
+        for field, value in zip(LENGTH_FIELDS, weighted):
+            setattr(compound, field, Decimal(value))
+        for field, value in zip(LINEAR_LENGTH_FIELDS, linear):
+            setattr(compound, field, float(value))
+    Compound.objects.bulk_update(compounds,
+        LENGTH_FIELDS + LINEAR_LENGTH_FIELDS)
+    return compounds
+
+
+def invalidate_compound_lengths(compound_ids=None):
+    """
+    Clears stored lengths of compounds, of all of them if compound_ids
+    isn't provided. They are calculated again when used.
+    """
+    compounds = Compound.objects.all() if compound_ids is None \
+        else Compound.objects.filter(pk__in=compound_ids)
+    compounds.update(**dict((field, None)
+        for field in LENGTH_FIELDS + LINEAR_LENGTH_FIELDS))
+
+
+def get_compounds_weighted_lengths(compound_ids):
+    """
+    Returns dictionary of compound id to weighted lengths. Compounds whose
+    lengths aren't stored yet are calculated and stored.
+    """
+    rows = list(Compound.objects.filter(pk__in=compound_ids)
+        .values_list('id', *LENGTH_FIELDS))
+    result = dict((row[0], row[1:]) for row in rows if None not in row[1:])
+    missing = [row[0] for row in rows if row[0] not in result]
+    if missing:
+        for compound in update_compound_lengths(
+            Compound.objects.filter(pk__in=missing)):
+            result[compound.id] = tuple(getattr(compound, field)
+                for field in LENGTH_FIELDS)
+    return result
+
+
+def round_occupancy(value):
+    """Rounds occupancy as Decimal."""
+    result = round(Decimal(value), OCCUPANCY_DECIMAL_PLACES)
+    return result
+
+
+def calc_occupancies(sample_ids):
+    """
+    Calculates radiation, nuclear collision and nuclear interaction length
+    occupancies of samples from a single layers query, summing Decimal
+    values layer by layer. Returns dictionary of sample id to rounded 
+    occupancies.
+    """
+    sample_ids = list(sample_ids)
+    result = dict((pk, [round_occupancy(0)] * len(OCCUPANCY_FIELDS))
+        for pk in sample_ids)
+    # Layers are added in id order, as the former per sample loop did.
+    layers = list(Layer.objects.filter(sample__in=sample_ids,
+        compound_type__isnull=False).order_by('id').values_list('sample',
+        'compound_type', 'length', 'compound_type__density',
+        *['compound_type__' + field for field in LENGTH_FIELDS]))
+    if not layers:
+        return result
+    missing = set(layer[1] for layer in layers if None in layer[4:])
+    weighted_lengths = get_compounds_weighted_lengths(missing) \
+        if missing else {}
+    totals = dict((pk, [0] * len(OCCUPANCY_FIELDS)) for pk in sample_ids)
+    for sample, compound, length, density, *lengths in layers:
+        density = density or 0
+        for index, weighted in enumerate(weighted_lengths.get(compound,
+            lengths)):
+            # Layers of compounds without elements or density have linear
+            # lengths of 0 and don't occupy irradiation length.
+            linear = weighted / density if density != 0 else 0
+            if linear != 0:
+                totals[sample][index] += length / (10 * linear)
+    for pk, sample_totals in totals.items():
+        result[pk] = [round_occupancy(total * 100) for total in sample_totals]
+    return result
+
+
+def update_occupancies(samples):
+    """
+    Calculates and stores occupancies of samples at once. Existing
+    occupancies are updated and missing ones created with bulk queries.
+    Then aggregates of samples and experiments are updated once.
+    """
+    samples = list(samples)
+    values = calc_occupancies([sample.id for sample in samples])
+    occupancies = dict()
+    for occupancy in Occupancy.objects.filter(sample__in=samples)\
+        .order_by('id'):
+        occupancies.setdefault(occupancy.sample_id, occupancy)
+    new_occupancies = []
+    for sample in samples:
+        occupancy = occupancies.get(sample.id)
+        if occupancy is None:
+            occupancy = Occupancy(sample=sample)
+            new_occupancies.append(occupancy)
+            occupancies[sample.id] = occupancy
+        for field, value in zip(OCCUPANCY_FIELDS, values[sample.id]):
+            setattr(occupancy, field, value)
+    with transaction.atomic():
+        Occupancy.objects.bulk_update([occupancy
+            for occupancy in occupancies.values()
+            if occupancy.pk is not None], OCCUPANCY_FIELDS)
+        Occupancy.objects.bulk_create(new_occupancies)
+        # Bulk operations don't send signals, which queue aggregates.
+        queue_aggregates(samples=[sample.id for sample in samples])
+    return occupancies
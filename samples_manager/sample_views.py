@@ -4,6 +4,7 @@ import logging
 from .forms import *
 from .views import *
 from .models import *
+from .aggregates import deferred_aggregates
 from django.urls import reverse
 from django.http import JsonResponse
 from django.forms import inlineformset_factory
@@ -81,19 +82,21 @@ def save_sample_form(request, form_data):
                         if form_data['with_alert_message']:
                             data['alert_message'] = ALERT_MESSAGES['not_unique']
                 elif form_data['form_action'].lower() == 'update':
-                    sample_temp = form_data['form1'].save()
-                    form_data['form2'].save()
-                    form_data['form3'].save()
-                    sample_updated = Sample.objects.get(pk=sample_temp.pk)
-                    sample_updated.status = 'Updated'
-                    sample_updated.updated_by = logged_user
-                    sample_updated.experiment = form_data['experiment']
-                    sample_updated.save()
-                    if form_data['layer_formset'].is_valid():
-                        form_data['layer_formset'].save()
+                    # Aggregates are updated once after all changes.
+                    with deferred_aggregates():
+                        sample_temp = form_data['form1'].save()
+                        form_data['form2'].save()
+                        form_data['form3'].save()
+                        sample_updated = Sample.objects.get(pk=sample_temp.pk)
+                        sample_updated.status = 'Updated'
+                        sample_updated.updated_by = logged_user
+                        sample_updated.experiment = form_data['experiment']
+                        sample_updated.save()
+                        if form_data['layer_formset'].is_valid():
+                            form_data['layer_formset'].save()
+                        save_occupancies(sample_updated, form_data['form_action'].lower())
                     if form_data['with_alert_message']:
                         data['alert_message'] = ALERT_MESSAGES[form_data['form_action'].lower()]
-                    save_occupancies(sample_updated, form_data['form_action'].lower())
                     args = {
                         'list_name': 'experiment_samples_list',
                         'ids': [form_data['experiment'].id]
@@ -141,15 +144,16 @@ def save_sample_form(request, form_data):
                         if form_data['with_alert_message']:
                             data['alert_message'] = ALERT_MESSAGES['not_unique']
                 else:
-                    sample_updated = form_data['form1'].save()
-                    form_data['form2'].save()
-                    form_data['form3'].save()
-                    sample_updated.save()
-                    if form_data['layer_formset'].is_valid():
-                        form_data['layer_formset'].save()
+                    with deferred_aggregates():
+                        sample_updated = form_data['form1'].save()
+                        form_data['form2'].save()
+                        form_data['form3'].save()
+                        sample_updated.save()
+                        if form_data['layer_formset'].is_valid():
+                            form_data['layer_formset'].save()
+                        save_occupancies(sample_updated, form_data['form_action'].lower())
                     if form_data['with_alert_message']:
                         data['alert_message'] = ALERT_MESSAGES[form_data['form_action'].lower()]
-                    save_occupancies(sample_updated, form_data['form_action'].lower())
                     args = {
                         'list_name': 'experiment_samples_list',
                         'ids': [form_data['experiment'].id]
@@ -0,0 +1,279 @@
+"""
+Database side search. It compiles free text queries into a single joined
+query per model, matching all keywords on the model fields and on the
+fields of the models related through foreign keys. Optionally searches
+are answered from a search index table of word suffixes, with a prefix
+lookup per keyword on its token index. Only identifier and number fields
+are indexed, comments and dates are searched by the joined query alone.
+"""
+from django.conf import settings
+from django.db import models, transaction
+from .models import Box, Dosimeter, Experiment, Irradiation, Sample, \
+    SearchIndex, SEARCH_TOKEN_MAX_LENGTH
+from .utilities import get_model_classes, get_model_name_from_class, \
+    get_query, normalize_query, MAX_FILTER_RECURSION_LEVEL
+
+SEARCH_FIELD_CLASSES = (models.CharField, models.TextField,
+    models.PositiveIntegerField, models.DecimalField, models.DateTimeField)
+SEARCH_INDEX_FIELD_CLASSES = (models.CharField, models.PositiveIntegerField,
+    models.DecimalField)
+SEARCH_INDEX_MODELS = [Experiment, Sample, Dosimeter, Irradiation, Box]
+SEARCH_INDEX_BATCH_SIZE = 500
+# Minimum length of search index tokens. Shorter keywords are searched with
+# the joined query.
+SEARCH_TOKEN_MIN_LENGTH = 3
+
+# Search plan per model. Each plan is the list of field lookups, including
+# the foreign key joins, where keywords are searched.
+SEARCH_PLANS = {}
+# Search index plan per indexed model, the lookups of its search plan
+# stored in the search index.
+SEARCH_INDEX_PLANS = {}
+# Indexed models depending on each related model, as a list of
+# (indexed model, foreign key lookup) tuples.
+SEARCH_INDEX_DEPENDENTS = {}
+# Attribute names of the fields of indexed and related models whose changes
+# require updating the search index.
+SEARCH_INDEX_FIELDS = {}
+
+
+def get_search_joins(Model, prefix='', path=None):
+    """
+    Returns (lookup, related model) tuples of the foreign keys followed by
+    search. Foreign keys are followed up to MAX_FILTER_RECURSION_LEVEL - 1
+    joins and never back to a model already in the join path.
+    """
+    path = [Model] if path is None else path
+    result = []
+    if len(path) < MAX_FILTER_RECURSION_LEVEL:
+        for field in Model._meta.fields:
+            is_followed = (isinstance(field, models.ForeignKey)
+                and field.related_model in get_model_classes()
+                and field.related_model not in path)
+            if is_followed:
+                lookup = prefix + field.name
+                result.append((lookup, field.related_model))
+                result = result + get_search_joins(field.related_model,
+                    lookup + '__', path + [field.related_model])
+    return result
+
+
+def get_search_fields(Model, prefix='', field_classes=SEARCH_FIELD_CLASSES):
+    """Returns lookups of searchable fields of model."""
+    result = [prefix + field.name for field in Model._meta.fields
+        if isinstance(field, field_classes)]
+    return result
+
+
+def get_search_field_paths(Model, field_classes=SEARCH_FIELD_CLASSES):
+    """
+    Returns lookups of searchable fields of model and of models related
+    through foreign keys.
+    """
+    result = get_search_fields(Model, '', field_classes)
+    for lookup, RelatedModel in get_search_joins(Model):
+        result = result + get_search_fields(RelatedModel, lookup + '__',
+            field_classes)
+    return result
+
+
+def get_search_index_field_names(Model):
+    """
+    Returns attribute names of indexed fields and foreign keys of model,
+    which change the search text of model and of its dependents.
+    """
+    result = [field.attname for field in Model._meta.fields
+        if isinstance(field, SEARCH_INDEX_FIELD_CLASSES + (models.ForeignKey,))]
+    return result
+
+
+def build_search_plans():
+    """Builds search plans of all app models. Called once at startup."""
+    for Model in get_model_classes():
+        SEARCH_PLANS[Model] = get_search_field_paths(Model)
+    SEARCH_INDEX_DEPENDENTS.clear()
+    SEARCH_INDEX_FIELDS.clear()
+    for Model in SEARCH_INDEX_MODELS:
+        SEARCH_INDEX_PLANS[Model] = get_search_field_paths(Model,
+            SEARCH_INDEX_FIELD_CLASSES)
+        SEARCH_INDEX_FIELDS[Model] = get_search_index_field_names(Model)
+        for lookup, RelatedModel in get_search_joins(Model):
+            SEARCH_INDEX_DEPENDENTS.setdefault(RelatedModel, []).append(
+                (Model, lookup))
+            SEARCH_INDEX_FIELDS[RelatedModel] = \
+                get_search_index_field_names(RelatedModel)
+
+
+def get_search_plan(Model):
+    """Returns search plan of model."""
+    if Model not in SEARCH_PLANS:
+        SEARCH_PLANS[Model] = get_search_field_paths(Model)
+    return SEARCH_PLANS[Model]
+
+
+def get_search_index_plan(Model):
+    """Returns search index plan of indexed model."""
+    if Model not in SEARCH_INDEX_PLANS:
+        SEARCH_INDEX_PLANS[Model] = get_search_field_paths(Model,
+            SEARCH_INDEX_FIELD_CLASSES)
+    return SEARCH_INDEX_PLANS[Model]
+
+
+def is_search_index_enabled():
+    """Returns if searches use the search index table."""
+    result = getattr(settings, 'SEARCH_INDEX_ENABLED', False)
+    return result
+
+
+def get_search_index_tokens(values):
+    """
+    Returns search tokens of field values. Tokens are the lowercased 
+    suffixes of at least SEARCH_TOKEN_MIN_LENGTH characters of the words of
+    the values truncated to SEARCH_TOKEN_MAX_LENGTH, so every substring of 
+    a word as long as tokens is the prefix of a token.
+    """
+    result = set()
+    for value in values:
+        if value is None:
+            continue
+        for word in str(value).lower().split():
+            for i in range(len(word) - SEARCH_TOKEN_MIN_LENGTH + 1):
+                result.add(word[i:i + SEARCH_TOKEN_MAX_LENGTH])
+    return result
+
+
+def update_search_index(Model, pks=None):
+    """
+    Updates search index tokens of model instances with a single joined
+    query. If pks isn't provided all model instances are indexed. Tokens
+    are inserted in batches of SEARCH_INDEX_BATCH_SIZE. Returns number of
+    indexed instances.
+    """
+    model_name = get_model_name_from_class(Model)
+    instances = Model.objects.all() if pks is None \
+        else Model.objects.filter(pk__in=pks)
+    rows = instances.order_by().values_list('pk',
+        *get_search_index_plan(Model))
+    entries_to_delete = SearchIndex.objects.filter(model_name=model_name)
+    if pks is not None:
+        entries_to_delete = entries_to_delete.filter(object_id__in=pks)
+    result = 0
+    entries = []
+    with transaction.atomic():
+        entries_to_delete.delete()
+        for row in rows.iterator():
+            result += 1
+            entries += [SearchIndex(model_name=model_name, object_id=row[0],
+                token=token) for token in get_search_index_tokens(row[1:])]
+            if len(entries) >= SEARCH_INDEX_BATCH_SIZE:
+                SearchIndex.objects.bulk_create(entries)
+                entries = []
+        SearchIndex.objects.bulk_create(entries)
+    return result
+
+
+def is_search_index_query(terms):
+    """
+    Checks if keywords can be searched in the search index. Keywords 
+    containing spaces, shorter or longer than tokens are searched with the
+    joined query.
+    """
+    result = all(SEARCH_TOKEN_MIN_LENGTH <= len(term) <= SEARCH_TOKEN_MAX_LENGTH
+        and len(term.split()) == 1 for term in terms)
+    return result
+
+
+def get_search_index_values(instance):
+    """
+    Returns values of fields of instance changing the search index. 
+    Deferred fields are returned as DEFERRED.
+    """
+    result = tuple(instance.__dict__.get(name, models.DEFERRED)
+        for name in SEARCH_INDEX_FIELDS.get(type(instance), []))
+    return result
+
+
+def is_search_index_changed(instance):
+    """
+    Checks if fields of instance changing the search index changed since 
+    it was loaded or last checked. Instances without loaded values are 
+    changed.
+    """
+    values = get_search_index_values(instance)
+    result = (getattr(instance, '_search_index_values', None) != values)
+    instance._search_index_values = values
+    return result
+
+
+def delete_search_index(Model, pks):
+    """Deletes search index entries of model instances."""
+    SearchIndex.objects.filter(model_name=get_model_name_from_class(Model),
+        object_id__in=pks).delete()
+
+
+def get_search_index_dependents(instance):
+    """
+    Returns (indexed model, pks) tuples of indexed instances whose search
+    text includes instance fields.
+    """
+    result = []
+    for Model, lookup in SEARCH_INDEX_DEPENDENTS.get(type(instance), []):
+        pks = list(Model.objects.filter(**{lookup: instance})
+            .values_list('pk', flat=True))
+        if pks:
+            result.append((Model, pks))
+    return result
+
+
+def update_search_index_with_dependents(Model, pks):
+    """
+    Updates search index of model instances and of indexed instances whose
+    search text includes their fields. Used after bulk updates, which don't
+    send signals.
+    """
+    if Model in SEARCH_INDEX_MODELS:
+        update_search_index(Model, pks)
+    for DependentModel, lookup in SEARCH_INDEX_DEPENDENTS.get(Model, []):
+        dependent_pks = list(DependentModel.objects.filter(
+            **{lookup + '__in': pks}).values_list('pk', flat=True))
+        if dependent_pks:
+            update_search_index(DependentModel, dependent_pks)
+
+
+def rebuild_search_index():
+    """Rebuilds search index of all indexed models."""
+    result = {}
+    for Model in SEARCH_INDEX_MODELS:
+        result[get_model_name_from_class(Model)] = update_search_index(Model)
+    return result
+
+
+def search_queryset(queryset, query_string):
+    """
+    Filters queryset by string. Returned queryset is lazy and keeps the
+    ordering of the original queryset. Every keyword must match at least
+    one field of the model or of its related models.
+    """
+    terms = normalize_query(query_string)
+    if not terms:
+        return queryset
+    Model = queryset.model
+    is_indexed = (is_search_index_enabled() and Model in SEARCH_INDEX_MODELS
+        and is_search_index_query(terms))
+    if is_indexed:
+        entries = SearchIndex.objects.filter(
+            model_name=get_model_name_from_class(Model))
+        result = queryset
+        for term in terms:
+            result = result.filter(pk__in=entries.filter(
+                token__startswith=term.lower()).values('object_id'))
+    else:
+        query = get_query(query_string, get_search_plan(Model))
+        result = queryset.filter(query)
+    return result
+
+
+def search_model(Model, query_string):
+    """Filters all model objects by string."""
+    result = search_queryset(Model.objects.all(), query_string)
+    return result
@@ -0,0 +1,144 @@
+"""
+Local SEC cache. SEC measurements are append-only, so they are synced 
+incrementally from the SEC database into the SecMeasurement table together
+with their accumulated SEC. Accumulated SEC of a date range is then two 
+indexed lookups and a subtraction, and the lookups of many date ranges are
+resolved with a single query. Measurements are identified by their position
+in the SEC database, since its local timestamps repeat when daylight saving
+time ends.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Max, Min, Subquery
+from .models import SecMeasurement
+from .utilities import db_connection, format_sec_date, \
+    get_sec_date_expression, get_sec_table, get_sec_value, parse_sec_date, \
+    SEC_QUERY_BATCH_SIZE
+
+SEC_CACHE_SYNC_BATCH_SIZE = 5000
+# Cached SEC values are rounded to the decimal places of their columns.
+SEC_CACHE_QUANTUM = Decimal('0.000001')
+
+
+def get_last_sec_measurement():
+    """Returns last cached SEC measurement or None if cache is empty."""
+    result = SecMeasurement.objects.order_by('-sequence').first()
+    return result
+
+
+def get_sec_cache_range():
+    """
+    Returns timestamps of first and last cached SEC measurements. Both are 
+    None if cache is empty.
+    """
+    timestamps = SecMeasurement.objects.aggregate(first=Min('timestamp'),
+        last=Max('timestamp'))
+    result = (timestamps['first'], timestamps['last'])
+    return result
+
+
+def get_cached_sec_subqueries(i, utc_date_in, utc_date_out):
+    """
+    Returns subqueries of accumulated SEC at both ends of date range and of
+    first and last positive SEC measurement in it, named with range index.
+    """
+    measurements = SecMeasurement.objects.order_by()
+    positives = measurements.filter(is_positive=True,
+        timestamp__gt=utc_date_in, timestamp__lt=utc_date_out)\
+        .values('timestamp')
+    result = {
+        'sec_out_%d' % i: Subquery(measurements
+            .filter(timestamp__lt=utc_date_out)
+            .order_by('-timestamp', '-sequence')
+            .values('cumulative_value')[:1]),
+        'sec_in_%d' % i: Subquery(measurements
+            .filter(timestamp__lte=utc_date_in)
+            .order_by('-timestamp', '-sequence')
+            .values('cumulative_value')[:1]),
+        'date_first_sec_%d' % i: Subquery(positives.order_by('timestamp')[:1]),
+        'date_last_sec_%d' % i: Subquery(positives.order_by('-timestamp')[:1])
+    }
+    return result
+
+
+def calc_cached_sec_data_in_ranges(utc_date_ranges):
+    """
+    Calculates accumulated SEC and dates of first and last positive SEC 
+    measurement for list of (date_in, date_out) ranges from cached 
+    measurements. If date_in is None accumulated SEC is 0. Lookups of all 
+    ranges are resolved with one query per SEC_QUERY_BATCH_SIZE ranges.
+    """
+    result = [{'sec': 0, 'date_first_sec': None, 'date_last_sec': None}
+        for _ in utc_date_ranges]
+    ranges = [(i, date_in, date_out)
+        for i, (date_in, date_out) in enumerate(utc_date_ranges)
+        if date_in is not None and date_out > date_in]
+    for start in range(0, len(ranges), SEC_QUERY_BATCH_SIZE):
+        batch = ranges[start:start + SEC_QUERY_BATCH_SIZE]
+        subqueries = dict()
+        for j, (_, date_in, date_out) in enumerate(batch):
+            subqueries.update(get_cached_sec_subqueries(j, date_in, date_out))
+        rows = list(SecMeasurement.objects.order_by('sequence')
+            .values(**subqueries)[:1])
+        if not rows:
+            continue
+        for j, (i, _, _) in enumerate(batch):
+            element = result[i]
+            sec_out = rows[0]['sec_out_%d' % j]
+            sec_in = rows[0]['sec_in_%d' % j]
+            element['sec'] = (0 if sec_out is None else sec_out) - \
+                (0 if sec_in is None else sec_in)
+            element['date_first_sec'] = rows[0]['date_first_sec_%d' % j]
+            element['date_last_sec'] = rows[0]['date_last_sec_%d' % j]
+    return result
+
+
+@transaction.atomic
+def sync_sec_cache(utc_since=None):
+    """
+    Appends SEC measurements newer than the last cached measurement. If 
+    cache is empty only measurements after utc_since are synced, or all of 
+    them if it is None. Runs in a single transaction holding the lock of 
+    the last measurement. Returns number of synced measurements.
+    """
+    result = 0
+    last_measurement = get_last_sec_measurement()
+    if last_measurement is not None:
+        # Concurrent syncs wait for the lock of the last measurement and then
+        # continue from the measurements stored by the other sync. Syncs of
+        # an empty cache are guarded by unique measurement sequences.
+        list(SecMeasurement.objects.filter(pk=last_measurement.pk)
+            .select_for_update())
+        last_measurement = get_last_sec_measurement()
+    date_in = utc_since if last_measurement is None \
+        else last_measurement.timestamp
+    sequence = 0 if last_measurement is None else last_measurement.sequence
+    cumulative_value = Decimal(0) if last_measurement is None \
+        else last_measurement.cumulative_value
+    query = 'SELECT TIMESTAMP, SEC_VALUE FROM ' + get_sec_table() + \
+        ' WHERE SEC_ID = \'SEC_01\''
+    params = dict()
+    if date_in is not None:
+        query += ' AND TIMESTAMP > ' + get_sec_date_expression('date_in')
+        params['date_in'] = format_sec_date(date_in)
+    query += ' ORDER BY TIMESTAMP'
+
+    with db_connection('sec') as connection:
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(SEC_CACHE_SYNC_BATCH_SIZE)
+        while rows:
+            measurements = []
+            for timestamp, value in rows:
+                value = get_sec_value(value).quantize(SEC_CACHE_QUANTUM)
+                cumulative_value += value
+                sequence += 1
+                measurements.append(SecMeasurement(sequence=sequence,
+                    timestamp=parse_sec_date(timestamp),
+                    value=value, cumulative_value=cumulative_value,
+                    is_positive=(value > 0)))
+            SecMeasurement.objects.bulk_create(measurements)
+            result += len(measurements)
+            rows = cursor.fetchmany(SEC_CACHE_SYNC_BATCH_SIZE)
+        cursor.close()
+    return result
@@ -0,0 +1,184 @@
+"""Model signal receivers. Connected when the app is ready."""
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_init, post_migrate, \
+    post_save, pre_delete
+from .models import Compound, CompoundElement, Element, FluenceFactor, \
+    Irradiation, Layer, Occupancy, Sample
+from .utilities import invalidate_elements_count, APP_NAME
+from .fluence_factors import invalidate_fluence_factor_index
+from .lineage import materialize_lineage, update_has_children, \
+    update_lineage_descendants
+from .aggregates import queue_aggregates
+from .occupancies import invalidate_compound_lengths, \
+    invalidate_element_properties
+from .search import delete_search_index, get_search_index_dependents, \
+    get_search_index_values, is_search_index_changed, \
+    is_search_index_enabled, update_search_index, SEARCH_INDEX_DEPENDENTS, \
+    SEARCH_INDEX_FIELDS, SEARCH_INDEX_MODELS
+
+
+@receiver(post_init)
+def store_search_index_values(sender, instance, **kwargs):
+    """Stores indexed field values of instance to detect their changes."""
+    if sender in SEARCH_INDEX_FIELDS and is_search_index_enabled():
+        instance._search_index_values = get_search_index_values(instance)
+
+
+@receiver(post_save)
+def update_search_index_on_save(sender, instance, created=False, raw=False,
+        **kwargs):
+    """
+    Updates search index of saved instance and dependent instances when 
+    indexed fields changed.
+    """
+    if raw or sender not in SEARCH_INDEX_FIELDS \
+            or not is_search_index_enabled():
+        return
+    is_changed = is_search_index_changed(instance)
+    if not (created or is_changed):
+        return
+    if sender in SEARCH_INDEX_MODELS:
+        update_search_index(sender, [instance.pk])
+    for Model, pks in get_search_index_dependents(instance):
+        update_search_index(Model, pks)
+
+
+@receiver(pre_delete)
+def find_search_index_dependents(sender, instance, **kwargs):
+    """Stores instances depending on deleted instance in search index."""
+    if is_search_index_enabled() and sender in SEARCH_INDEX_DEPENDENTS:
+        instance._search_index_dependents = \
+            get_search_index_dependents(instance)
+
+
+@receiver(post_delete)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    """Deletes search index of instance and updates dependent instances."""
+    if not is_search_index_enabled():
+        return
+    if sender in SEARCH_INDEX_MODELS:
+        delete_search_index(sender, [instance.pk])
+    dependents = getattr(instance, '_search_index_dependents', [])
+    for Model, pks in dependents:
+        update_search_index(Model, pks)
+
+
+@receiver(post_save)
+def invalidate_count_on_save(sender, instance, created=False, **kwargs):
+    """Invalidates cached count of model when an instance is created."""
+    if created:
+        invalidate_elements_count(sender)
+
+
+@receiver(post_delete)
+def invalidate_count_on_delete(sender, instance, **kwargs):
+    """Invalidates cached count of model when an instance is deleted."""
+    invalidate_elements_count(sender)
+
+
+@receiver(post_save, sender=FluenceFactor)
+@receiver(post_delete, sender=FluenceFactor)
+def invalidate_fluence_factors(sender, instance, **kwargs):
+    """Invalidates fluence factor index when a factor changes."""
+    invalidate_fluence_factor_index()
+
+
+@receiver(post_save, sender=Element)
+@receiver(post_delete, sender=Element)
+def invalidate_elements(sender, instance, **kwargs):
+    """Invalidates element properties and compound lengths using them."""
+    invalidate_element_properties()
+    invalidate_compound_lengths()
+
+
+@receiver(post_save, sender=CompoundElement)
+@receiver(post_delete, sender=CompoundElement)
+def invalidate_compound_element(sender, instance, raw=False, **kwargs):
+    """Invalidates lengths of compound when its elements change."""
+    if not raw and instance.compound_id is not None:
+        invalidate_compound_lengths([instance.compound_id])
+
+
+@receiver(post_save, sender=Irradiation)
+def update_lineage_on_save(sender, instance, created=False, raw=False,
+        **kwargs):
+    """
+    Updates children flags and descendants' lineage of irradiation when
+    its previous irradiation or lineage values changed.
+    """
+    if raw:
+        return
+    loaded_parent = getattr(instance, '_loaded_previous_irradiation_id', None)
+    # Saved instance flag is recalculated as well, it may have been stale.
+    pks = [instance.pk]
+    if created or loaded_parent != instance.previous_irradiation_id:
+        pks += [instance.previous_irradiation_id, loaded_parent]
+    update_has_children(pks)
+    instance._loaded_previous_irradiation_id = instance.previous_irradiation_id
+    values = instance.get_lineage_values()
+    if not created and values != getattr(instance, '_loaded_lineage_values',
+            None):
+        update_lineage_descendants([instance.pk])
+    instance._loaded_lineage_values = values
+
+
+@receiver(pre_delete, sender=Irradiation)
+def find_lineage_children(sender, instance, **kwargs):
+    """Stores children of deleted irradiation, which become chain roots."""
+    instance._lineage_children = list(Irradiation.objects.filter(
+        previous_irradiation=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Irradiation)
+def update_lineage_on_delete(sender, instance, **kwargs):
+    """Updates lineage of parent and children of deleted irradiation."""
+    update_has_children([instance.previous_irradiation_id])
+    children = getattr(instance, '_lineage_children', [])
+    if children:
+        Irradiation.objects.filter(pk__in=children).update(
+            lineage_root=None, lineage_depth=0, parent_sec=None)
+        update_lineage_descendants(children)
+
+
+@receiver(post_migrate)
+def materialize_lineage_on_migrate(sender, **kwargs):
+    """Stores lineage data of irradiations created before it existed."""
+    if sender.name == APP_NAME:
+        materialize_lineage()
+
+
+@receiver(post_save, sender=Sample)
+def queue_sample_aggregates(sender, instance, raw=False, **kwargs):
+    """Queues aggregates of saved sample and of its experiments."""
+    if raw:
+        return
+    loaded_experiment = getattr(instance, '_loaded_experiment_id', None)
+    queue_aggregates(samples=[instance.pk],
+        experiments=[instance.experiment_id, loaded_experiment])
+    instance._loaded_experiment_id = instance.experiment_id
+
+
+@receiver(post_delete, sender=Sample)
+def queue_deleted_sample_aggregates(sender, instance, **kwargs):
+    """Queues aggregates of experiment of deleted sample."""
+    queue_aggregates(experiments=[instance.experiment_id])
+
+
+@receiver(post_save, sender=Occupancy)
+@receiver(post_delete, sender=Occupancy)
+def queue_occupancy_aggregates(sender, instance, raw=False, **kwargs):
+    """Queues aggregates of sample of saved or deleted occupancy."""
+    if not raw:
+        queue_aggregates(samples=[instance.sample_id])
+
+
+@receiver(post_save, sender=Layer)
+@receiver(post_delete, sender=Layer)
+def update_compound_num_samples(sender, instance, raw=False, **kwargs):
+    """Updates number of associated samples of compounds of layer."""
+    if raw:
+        return
+    loaded_compound = getattr(instance, '_loaded_compound_type_id', None)
+    Compound.update_num_associated_samples(
+        set([instance.compound_type_id, loaded_compound]))
+    instance._loaded_compound_type_id = instance.compound_type_id
@@ -172,11 +172,10 @@ function allowDropdown(){
         direction: 'upward',
     });
 
-    var remoteSearchSelector = $('select.allowed-dropdown.search-remote');
-    if(remoteSearchSelector.length > 0){
-        var str = remoteSearchSelector[0].attributes['search-remote-url'].value
+    $('select.allowed-dropdown.search-remote').each(function(){
+        var str = this.attributes['search-remote-url'].value
         var url = str.substring(0, str.length - 1) + '?q={query}'
-        remoteSearchSelector.dropdown({
+        $(this).dropdown({
             duration: 1,
             maxResults: 20,
             apiSettings: {
@@ -186,7 +185,7 @@ function allowDropdown(){
                 method: "get",
             }
         });
-    }
+    });
 }
 
 /**
@@ -0,0 +1,125 @@
+"""Local fake of the inforEAM SOAP service used by tests."""
+import os
+import tempfile
+import threading
+from xml.sax.saxutils import escape
+from xml.etree import ElementTree
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+WSDL_PATH = os.path.join(os.path.dirname(__file__), 'infoream.wsdl')
+WSDL_LOCATION = 'http://127.0.0.1:8123/infoream'
+SOAP_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+SERVICE_NAMESPACE = 'http://infoream.test/'
+ENVELOPE = '<?xml version="1.0" encoding="UTF-8"?>'\
+    '<soap:Envelope xmlns:soap="' + SOAP_NAMESPACE + '" '\
+    'xmlns:tns="' + SERVICE_NAMESPACE + '"><soap:Body>%s</soap:Body>'\
+    '</soap:Envelope>'
+NOT_FOUND_MESSAGE = 'equipment record couldn\'t be found'
+
+
+class FakeInforEAMHandler(BaseHTTPRequestHandler):
+    """Answers inforEAM operations from the equipments of the server."""
+
+    def do_POST(self):
+        """Dispatches SOAP operation of request."""
+        length = int(self.headers['Content-Length'])
+        root = ElementTree.fromstring(self.rfile.read(length))
+        operation = root.find('{%s}Body' % SOAP_NAMESPACE)[0]
+        name = operation.tag.split('}')[1]
+        self.server.calls.append(name)
+        if name == 'readEquipmentBatch':
+            codes = [element.text for element in
+                operation.findall('equipmentCodes')]
+            self.respond(name, ''.join(self.get_equipment_result(code)
+                for code in codes))
+        elif name == 'readEquipment':
+            code = operation.find('equipmentCode').text
+            if code in self.server.equipments:
+                self.respond(name, '<return>' + self.get_equipment(code) +
+                    '</return>')
+            else:
+                self.respond_fault(NOT_FOUND_MESSAGE)
+        elif name == 'readComments':
+            code = operation.find('comment/entityKeyCode').text
+            comment = '<return><entityKeyCode>%s</entityKeyCode>'\
+                '</return>' % escape(code)
+            self.respond(name, comment if code in self.server.comments
+                else '')
+        else:
+            self.respond_fault('Unknown operation ' + name)
+
+    def get_equipment(self, code):
+        """Returns equipment content."""
+        result = '<code>%s</code>' % escape(code)
+        return result
+
+    def get_equipment_result(self, code):
+        """Returns batch read result of equipment."""
+        if code in self.server.equipments:
+            result = '<return><response>' + self.get_equipment(code) + \
+                '</response></return>'
+        else:
+            result = '<return><errorMessage>' + escape(NOT_FOUND_MESSAGE) + \
+                '</errorMessage></return>'
+        return result
+
+    def respond(self, name, content):
+        """Sends response of operation."""
+        self.send_envelope(200, '<tns:%sResponse>%s</tns:%sResponse>' % (
+            name, content, name))
+
+    def respond_fault(self, message):
+        """Sends SOAP fault."""
+        self.send_envelope(500, '<soap:Fault><faultcode>soap:Server'\
+            '</faultcode><faultstring>%s</faultstring></soap:Fault>' %
+            escape(message))
+
+    def send_envelope(self, status, body):
+        """Sends SOAP envelope."""
+        content = (ENVELOPE % body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        """Silences request logs."""
+
+
+class FakeInforEAMService:
+    """
+    Fake inforEAM service listening on a local port. Equipments and
+    comments are sets of infoream ids and calls lists the names of the
+    received operations. wsdl_path is a copy of the WSDL addressed to it.
+    """
+
+    def __init__(self, equipments=(), comments=()):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeInforEAMHandler)
+        self.server.equipments = set(equipments)
+        self.server.comments = set(comments)
+        self.server.calls = []
+        self.thread = threading.Thread(target=self.server.serve_forever,
+            daemon=True)
+        self.directory = tempfile.TemporaryDirectory()
+        self.wsdl_path = os.path.join(self.directory.name, 'infoream.wsdl')
+        with open(WSDL_PATH) as wsdl:
+            content = wsdl.read().replace(WSDL_LOCATION,
+                'http://127.0.0.1:%s/infoream' % self.server.server_port)
+        with open(self.wsdl_path, 'w') as wsdl:
+            wsdl.write(content)
+
+    @property
+    def calls(self):
+        """Names of received operations."""
+        return self.server.calls
+
+    def start(self):
+        """Starts serving requests."""
+        self.thread.start()
+
+    def stop(self):
+        """Stops serving requests and removes WSDL copy."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
@@ -391,6 +391,21 @@ class IrradiationFormsTest(TestCase):
         })
         self.assertTrue(form.is_valid())
 
+    def test_previous_irradiation_choices(self):
+        """Test parent irradiation choices exclude irradiations with children."""
+        parent = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, status='OutBeam')
+        child = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, previous_irradiation=parent,
+            status='Completed')
+        choices = dict(get_previous_irradiation_choices())
+
+        self.assertNotIn(parent.id, choices)
+        self.assertEqual(choices[child.id], str(self.dosimeter.dos_id) + '|' +
+            str(self.sample.set_id) + '|' + str(child.id))
+        self.assertEqual(get_previous_irradiation_choices(pks=[child.id]),
+            [(child.id, choices[child.id])])
+
     def test_incorrect_data_irradiation_form(self):
         """Test validity incorrect irradiation form."""
         # Test date conflict
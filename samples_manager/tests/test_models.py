@@ -1,6 +1,9 @@
 """Model tests."""
 from django.test import TestCase
 from samples_manager.models import *
+from samples_manager.lineage import filter_childless, get_lineage, \
+    get_parent_secs, invalidate_lineage_state, is_lineage_materialized, \
+    materialize_lineage
 
 
 class ExperimentModelTest(TestCase):
@@ -53,6 +56,20 @@ class ExperimentModelTest(TestCase):
 
         self.assertTrue(isinstance(experiment, Experiment))
 
+    def test_rebuild_aggregates(self):
+        """Tests aggregates of all experiments are recalculated in bulk."""
+        from samples_manager.aggregates import rebuild_aggregates
+        Experiment.objects.update(number_registered_samples=0,
+            radiation_length_occupancy=0)
+        rebuild_aggregates()
+        experiment = Experiment.objects.get(pk=self.experiment.pk)
+        samples = Sample.objects.filter(experiment=experiment)
+
+        self.assertEqual(experiment.number_registered_samples, samples.count())
+        self.assertEqual(experiment.number_users, experiment.users.count() + 1)
+        self.assertEqual(experiment.radiation_length_occupancy, sum(
+            sample.radiation_length_occupancy for sample in samples))
+
     def test_experiment_string_representation(self):
         """Tests experiment __str__ method."""
         self.assertTrue(str(self.experiment) == self.experiment.title)
@@ -173,6 +190,90 @@ class IrradiationModelTest(TestCase):
 
         self.assertTrue(isinstance(irradiation, Irradiation))
 
+    def test_irradiation_lineage(self):
+        """Tests lineage data is kept on irradiation chains."""
+        root = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, sec=10, status='OutBeam')
+        child = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, previous_irradiation=root, sec=15,
+            status='OutBeam')
+        grandchild = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, previous_irradiation=child,
+            status='InBeam')
+        root.sec = 12
+        root.save()
+        root.refresh_from_db()
+        grandchild.refresh_from_db()
+        child.refresh_from_db()
+
+        self.assertTrue(root.has_children)
+        self.assertFalse(grandchild.has_children)
+        self.assertEqual(grandchild.lineage_root, root.id)
+        self.assertEqual(grandchild.lineage_depth, 2)
+        self.assertEqual(child.parent_sec, 12)
+        self.assertEqual(list(get_lineage(child)), [root, child, grandchild])
+        child.delete()
+        root.refresh_from_db()
+        grandchild.refresh_from_db()
+        self.assertFalse(root.has_children)
+        self.assertIsNone(grandchild.lineage_root)
+        self.assertEqual(grandchild.lineage_depth, 0)
+
+    def test_legacy_irradiation_lineage(self):
+        """
+        Tests irradiations created before lineage data existed fall back
+        to previous irradiations until it is materialized.
+        """
+        root = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, sec=10, status='OutBeam')
+        child = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, previous_irradiation=root,
+            status='OutBeam')
+        Irradiation.objects.update(lineage_root=None, lineage_depth=0,
+            parent_sec=None, has_children=False)
+        invalidate_lineage_state()
+        child.refresh_from_db()
+        childless = filter_childless(Irradiation.objects.filter(
+            pk__in=[root.pk, child.pk]))
+
+        self.assertFalse(is_lineage_materialized())
+        self.assertEqual(list(childless), [child])
+        self.assertEqual(get_parent_secs([child]), [10])
+        materialize_lineage()
+        child.refresh_from_db()
+        self.assertTrue(is_lineage_materialized())
+        self.assertEqual(list(filter_childless(Irradiation.objects.filter(
+            pk__in=[root.pk, child.pk]))), [child])
+        self.assertEqual(child.parent_sec, 10)
+        self.assertTrue(Irradiation.objects.get(pk=root.pk).has_children)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_lineage_materialized())
+
+    def test_unchanged_irradiation_lineage(self):
+        """
+        Tests saving irradiation without lineage changes doesn't load its
+        previous irradiation nor update its descendants.
+        """
+        root = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, sec=10, status='OutBeam')
+        child = Irradiation.objects.create(sample=self.sample,
+            dosimeter=self.dosimeter, previous_irradiation=root, sec=15,
+            status='OutBeam')
+        child = Irradiation.objects.get(pk=child.pk)
+        root = Irradiation.objects.get(pk=root.pk)
+        child.comments = 'changed'
+        # Irradiation update and own children flag update.
+        with self.assertNumQueries(2):
+            child.save()
+        root.sec = 20
+        root.save()
+        child.refresh_from_db()
+
+        self.assertEqual(child.parent_sec, 20)
+        self.assertEqual(child.lineage_root, root.pk)
+        self.assertEqual(child.lineage_depth, 1)
+        self.assertTrue(Irradiation.objects.get(pk=root.pk).has_children)
+
 
 class UserModelTest(TestCase):
     """Test User model."""
@@ -477,6 +578,28 @@ class OccupancyModelTest(TestCase):
 
         self.assertTrue(isinstance(occupancy, Occupancy))
 
+    def test_occupancy_aggregates(self):
+        """Tests occupancy aggregates are updated once on commit."""
+        from samples_manager.aggregates import deferred_aggregates
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with deferred_aggregates():
+                for _ in range(3):
+                    Occupancy.objects.create(
+                        radiation_length_occupancy='0.100',
+                        nu_coll_length_occupancy='0.100',
+                        nu_int_length_occupancy='0.100',
+                        sample=self.sample)
+        sample = Sample.objects.get(pk=self.sample.pk)
+        experiment = Experiment.objects.get(pk=sample.experiment_id)
+        occupancies = Occupancy.objects.filter(sample=sample)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(sample.radiation_length_occupancy, sum(
+            occupancy.radiation_length_occupancy for occupancy in occupancies))
+        self.assertEqual(experiment.radiation_length_occupancy, sum(
+            element.radiation_length_occupancy for element in
+            Sample.objects.filter(experiment=experiment)))
+
     def test_occupancy_string_representation(self):
         """Tests occupancy __str__ method."""
         self.assertTrue(str(self.occupancy) == \
@@ -627,6 +750,26 @@ class CompoundModelTest(TestCase):
 
         self.assertTrue(isinstance(compound, Compound))
 
+    def test_compound_num_associated_samples(self):
+        """Tests number of associated samples is kept by layer signals."""
+        compound = Compound.objects.create(name='c-test', density='0.01')
+        sample = Sample.objects.get(pk=1)
+        layer = Layer.objects.create(name='l-test', length='0.1',
+            compound_type=compound, sample=sample)
+        Layer.objects.create(name='l-test-2', length='0.1',
+            compound_type=compound, sample=sample)
+        compound.refresh_from_db()
+
+        self.assertEqual(compound.num_associated_samples, 1)
+        layer.compound_type = self.compound
+        layer.save()
+        self.compound.refresh_from_db()
+        self.assertEqual(self.compound.num_associated_samples,
+            self.compound.get_num_associated_samples())
+        Layer.objects.filter(compound_type=compound).delete()
+        compound.refresh_from_db()
+        self.assertEqual(compound.num_associated_samples, 0)
+
     def test_compound_string_representation(self):
         """Tests compound __str__ method."""
         self.assertTrue(str(self.compound) == str(self.compound.name))
@@ -0,0 +1,188 @@
+"""Utilities tests."""
+import os
+import sqlite3
+import tempfile
+import threading
+from decimal import Decimal
+from datetime import datetime, timedelta
+from django.test import TestCase, override_settings
+from samples_manager.utilities import *
+from samples_manager.models import SecMeasurement
+
+
+class SecDatabaseTest(TestCase):
+    """Test SEC helpers against the SQLite stand-in database."""
+
+    def setUp(self):
+        """Creates SQLite stand-in database with SEC measurements."""
+        handle, self.db_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connection_str = SQLITE_CONNECTION_PREFIX + self.db_path
+        self.settings_override = override_settings(DB_CONNECTION_STRINGS=[
+            {'key': 'locations', 'value': connection_str},
+            {'key': 'sec', 'value': connection_str}
+        ])
+        self.settings_override.enable()
+        self.date_in = get_aware_datetime() - timedelta(hours=1)
+        connection = sqlite3.connect(self.db_path)
+        create_sqlite_tables(connection)
+        for minutes, value in [(10, 1.0), (20, 0.0), (30, 2.5), (40, 4.0)]:
+            connection.execute('INSERT INTO ' + SQLITE_SEC_TABLE +
+                ' VALUES (\'SEC_01\', ?, ?)', (value, format_sec_date(
+                self.date_in + timedelta(minutes=minutes))))
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        """Removes SQLite stand-in database."""
+        self.settings_override.disable()
+        os.remove(self.db_path)
+
+    def test_calc_acc_sec_in_range(self):
+        """Tests accumulated SEC in date range."""
+        date_out = self.date_in + timedelta(minutes=35)
+        sec = calc_acc_sec_in_range(self.date_in, date_out)
+
+        self.assertAlmostEqual(sec, 3.5)
+        self.assertAlmostEqual(calc_acc_sec_in_range(self.date_in), 7.5)
+        self.assertEqual(calc_acc_sec_in_range(None), 0)
+
+    def test_calc_sec_data_in_ranges(self):
+        """Tests accumulated SEC and SEC dates of several date ranges."""
+        ranges = [
+            (self.date_in, self.date_in + timedelta(minutes=25)),
+            (None, None),
+            (self.date_in + timedelta(minutes=15), None)
+        ]
+        result = calc_sec_data_in_ranges(ranges)
+
+        self.assertAlmostEqual(result[0]['sec'], 1.0)
+        self.assertEqual(result[1]['sec'], 0)
+        self.assertIsNone(result[1]['date_first_sec'])
+        self.assertAlmostEqual(result[2]['sec'], 6.5)
+        self.assertEqual(result[2]['date_first_sec'].replace(microsecond=0), 
+            (self.date_in + timedelta(minutes=30)).replace(microsecond=0))
+
+    def test_cached_sec_data_in_ranges(self):
+        """Tests SEC of date ranges using cache and SEC database tail."""
+        from samples_manager.sec_cache import sync_sec_cache
+        ranges = [
+            (self.date_in, self.date_in + timedelta(minutes=35)),
+            (self.date_in + timedelta(minutes=15), None)
+        ]
+        expected = calc_sec_data_in_ranges(ranges)
+        sync_sec_cache(self.date_in + timedelta(minutes=25))
+        connection = sqlite3.connect(self.db_path)
+        connection.execute('INSERT INTO ' + SQLITE_SEC_TABLE +
+            ' VALUES (\'SEC_01\', 0.5, ?)', (format_sec_date(
+            self.date_in + timedelta(minutes=50)),))
+        connection.commit()
+        connection.close()
+        result = calc_sec_data_in_ranges(ranges)
+
+        self.assertEqual(SecMeasurement.objects.count(), 2)
+        self.assertAlmostEqual(result[0]['sec'], expected[0]['sec'])
+        self.assertAlmostEqual(result[1]['sec'],
+            expected[1]['sec'] + Decimal('0.5'))
+        self.assertEqual(result[1]['date_first_sec'], 
+            expected[1]['date_first_sec'])
+
+    def test_cached_sec_data_queries(self):
+        """
+        Tests cached SEC of many date ranges is resolved with a single
+        query and measurements are synced once.
+        """
+        from django.db import IntegrityError, transaction
+        from samples_manager.sec_cache import sync_sec_cache
+        sync_sec_cache()
+        ranges = [(self.date_in + timedelta(minutes=10 + i % 25),
+            self.date_in + timedelta(minutes=40)) for i in range(50)]
+        expected = fetch_sec_data_in_ranges(ranges)
+        with self.assertNumQueries(2):
+            result = calc_sec_data_in_ranges(ranges)
+
+        for element, expected_element in zip(result, expected):
+            self.assertAlmostEqual(element['sec'], expected_element['sec'])
+            self.assertEqual(element['date_last_sec'],
+                expected_element['date_last_sec'])
+        self.assertEqual(sync_sec_cache(), 0)
+        self.assertEqual(SecMeasurement.objects.count(), 4)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            measurement = SecMeasurement.objects.first()
+            SecMeasurement.objects.create(sequence=measurement.sequence,
+                timestamp=measurement.timestamp, value=0, cumulative_value=0,
+                is_positive=False)
+
+    def test_sec_cache_daylight_saving_time_end(self):
+        """
+        Tests measurements of the hour repeated when daylight saving time
+        ends are all cached with the same timestamp.
+        """
+        from samples_manager.sec_cache import sync_sec_cache
+        connection = sqlite3.connect(self.db_path)
+        for value, date in [(1.0, '2021-10-31 02:30:00.000000'),
+            (2.0, '2021-10-31 02:30:00.000000'),
+            (0.5, '2021-10-31 02:45:00.000000')]:
+            connection.execute('INSERT INTO ' + SQLITE_SEC_TABLE +
+                ' VALUES (\'SEC_01\', ?, ?)', (value, date))
+        connection.commit()
+        connection.close()
+        date_in = datetime(2021, 10, 31, tzinfo=get_utc_timezone())
+
+        self.assertEqual(sync_sec_cache(), 7)
+        self.assertEqual(sync_sec_cache(), 0)
+        measurements = list(SecMeasurement.objects.all())
+        self.assertEqual([measurement.sequence for measurement in
+            measurements], list(range(1, 8)))
+        self.assertEqual(measurements[0].timestamp, measurements[1].timestamp)
+        self.assertEqual(measurements[0].timestamp,
+            date_in + timedelta(hours=1, minutes=30))
+        self.assertEqual(measurements[-1].cumulative_value, Decimal('11'))
+        result = calc_sec_data_in_ranges([(date_in,
+            date_in + timedelta(hours=2))])
+        self.assertEqual(result[0]['sec'], Decimal('3.5'))
+
+
+class InforEAMClientTest(TestCase):
+    """Test inforEAM clients are shared against a local WSDL."""
+
+    def setUp(self):
+        """Uses local WSDL and temporary WSDL cache."""
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            INFOREAM_WSDL=os.path.join(os.path.dirname(__file__),
+                'infoream.wsdl'),
+            INFOREAM_WSDL_CACHE_PATH=os.path.join(self.cache_dir.name,
+                'wsdl.sqlite3'))
+        self.settings_override.enable()
+        reset_infoream_clients()
+
+    def tearDown(self):
+        """Discards clients using the local WSDL."""
+        reset_infoream_clients()
+        self.settings_override.disable()
+        self.cache_dir.cleanup()
+
+    def test_shared_infoream_client(self):
+        """Tests clients are created once per process and settings."""
+        from zeep import Settings
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(
+            get_infoream_credentials()[1])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cred, client = get_infoream_credentials()
+        settings = Settings(strict=False, xml_huge_tree=True)
+        _, lax_client = get_infoream_credentials(settings=settings)
+
+        self.assertEqual(cred.username, 'username')
+        self.assertTrue(all(element is client for element in clients))
+        self.assertIsNot(lax_client, client)
+        self.assertIs(get_infoream_credentials(settings=Settings(
+            strict=False, xml_huge_tree=True))[1], lax_client)
+        self.assertIs(lax_client.transport, client.transport)
+        self.assertIs(get_infoream_credentials(
+            settings=INFOREAM_LAX_SETTINGS)[1], lax_client)
+        self.assertEqual(len(INFOREAM_CLIENTS), 3)
@@ -1,8 +1,15 @@
 """Views tests."""
+import os
+import sqlite3
+import tempfile
+from decimal import Decimal
+from datetime import timedelta
 from http.cookies import SimpleCookie
 from django.urls import reverse
 from samples_manager.models import *
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from samples_manager.utilities import create_sqlite_tables, \
+    format_sec_date, SQLITE_CONNECTION_PREFIX, SQLITE_SEC_TABLE
 
 def set_user_cookies(client, user_role):
     """Sets cookies for user."""
@@ -30,6 +37,30 @@ def set_user_cookies(client, user_role):
     client.cookies = cookies
     return client
 
+def set_sec_database(test_case, measurements=()):
+    """
+    Uses SQLite stand-in SEC database with measurements, as (date, value)
+    pairs, during test. Returns path of database.
+    """
+    handle, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    test_case.addCleanup(os.remove, db_path)
+    connection_str = SQLITE_CONNECTION_PREFIX + db_path
+    settings_override = override_settings(DB_CONNECTION_STRINGS=[
+        {'key': 'locations', 'value': connection_str},
+        {'key': 'sec', 'value': connection_str}
+    ])
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    connection = sqlite3.connect(db_path)
+    create_sqlite_tables(connection)
+    for date, value in measurements:
+        connection.execute('INSERT INTO ' + SQLITE_SEC_TABLE +
+            ' VALUES (\'SEC_01\', ?, ?)', (value, format_sec_date(date)))
+    connection.commit()
+    connection.close()
+    return db_path
+
 class ViewsTest(TestCase):
     """Test class experiments view."""
 
@@ -57,6 +88,15 @@ class ViewsTest(TestCase):
         """Ran once before all tests are run."""
         pass
 
+    def setUp(self):
+        """
+        Clears fluence factor index, test transactions are rolled back
+        without signals.
+        """
+        from samples_manager.fluence_factors import \
+            invalidate_fluence_factor_index
+        invalidate_fluence_factor_index()
+
     def test_index(self):
         """Tests index."""
         client = Client()
@@ -247,3 +287,498 @@ class ViewsTest(TestCase):
         response = client.get(reverse('samples_manager:fluence_factors_list'))
 
         self.assertEqual(response.status_code, 403)
+
+    def test_logged_user_resolved_once(self):
+        """Tests logged user is resolved once per request."""
+        from django.test import RequestFactory
+        from samples_manager.views import get_logged_user
+        request = RequestFactory().get('/')
+        request.COOKIES['username'] = 'test-admin'
+        request.COOKIES['first_name'] = 'Test'
+        request.COOKIES['last_name'] = 'Admin'
+        request.COOKIES['telephone'] = '1234'
+        request.COOKIES['email'] = 'test-admin@gmail.com'
+        request.COOKIES['mobile'] = '1234'
+        request.COOKIES['department'] = 'EP/DT'
+        request.COOKIES['home_institute'] = 'TU'
+        user = get_logged_user(request)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_logged_user(request), user)
+
+    def test_search_related_fields(self):
+        """Tests search matches keywords across related models."""
+        from samples_manager.search import search_model
+        results = search_model(Sample, 'e-03 s-04')
+
+        self.assertIn(Sample.objects.get(pk=5), results)
+        self.assertNotIn(Sample.objects.get(pk=1), results)
+
+    def test_search_index(self):
+        """Tests search index returns same results as joined search."""
+        from django.test import override_settings
+        from samples_manager.search import rebuild_search_index, search_model
+        rebuild_search_index()
+        expected = list(search_model(Sample, 'e-03 s-04'))
+
+        with override_settings(SEARCH_INDEX_ENABLED=True):
+            self.assertEqual(list(search_model(Sample, 'e-03 s-04')), expected)
+
+    def test_search_index_tokens(self):
+        """
+        Tests search index matches keywords inside words of indexed fields
+        like the joined search on them, and falls back to the joined search
+        for keywords with spaces or shorter than tokens.
+        """
+        from django.test import override_settings
+        from samples_manager.search import get_search_index_plan, \
+            is_search_index_query, rebuild_search_index, search_model
+        from samples_manager.utilities import get_query, normalize_query
+        rebuild_search_index()
+        queries = ['-03', 'S-0 e-0', 'set-004', '"e-03 s-04"', 'missing', '-0']
+        expected = []
+        for Model in [Sample, Irradiation]:
+            for query in queries:
+                if is_search_index_query(normalize_query(query)):
+                    results = Model.objects.filter(get_query(query,
+                        get_search_index_plan(Model)))
+                else:
+                    results = search_model(Model, query)
+                expected.append((Model, query, list(results)))
+
+        with override_settings(SEARCH_INDEX_ENABLED=True):
+            for Model, query, results in expected:
+                self.assertEqual(list(search_model(Model, query)), results)
+
+    def test_search_index_fields(self):
+        """
+        Tests search index stores suffixes of at least minimum length of 
+        indexed fields only, and is updated when they change.
+        """
+        from django.test import override_settings
+        from samples_manager.search import rebuild_search_index, \
+            SEARCH_TOKEN_MIN_LENGTH
+        Sample.objects.filter(pk=1).update(comments='unmistakable')
+        rebuild_search_index()
+        entries = SearchIndex.objects.filter(model_name='sample', object_id=1)
+
+        self.assertTrue(entries.filter(token='set-004000').exists())
+        self.assertFalse(entries.filter(token__contains='mistak').exists())
+        self.assertFalse(any(len(token) < SEARCH_TOKEN_MIN_LENGTH
+            for token in SearchIndex.objects.values_list('token', flat=True)))
+
+        with override_settings(SEARCH_INDEX_ENABLED=True):
+            sample = Sample.objects.get(pk=1)
+            entries.delete()
+            sample.comments = 'changed comments'
+            sample.save()
+            self.assertFalse(entries.exists())
+            sample.set_id = 'SET-009000'
+            sample.save()
+            self.assertTrue(entries.filter(token='set-009000').exists())
+            self.assertFalse(entries.filter(token='set-004000').exists())
+
+    def test_irradiation_list_all_truncated(self):
+        """
+        Tests all elements page is limited to maximum page size and shows
+        it is truncated.
+        """
+        from unittest import mock
+        client = Client()
+        set_user_cookies(client, 'Admin')
+        client.cookies['elements_per_page'] = 'all'
+        with mock.patch('samples_manager.utilities.MAX_ELEMENTS_PER_PAGE', 1):
+            response = client.get(reverse('samples_manager:irradiations_list'))
+        pagination_data = response.context['pagination_data']
+
+        self.assertEqual(len(response.context['irradiations']), 1)
+        self.assertTrue(pagination_data['is_truncated'])
+        self.assertContains(response, 'the rest are on the next pages')
+
+    def test_irradiation_list_keyset_page(self):
+        """Tests irradiation list page retrieved with keyset pagination."""
+        client = Client()
+        set_user_cookies(client, 'Admin')
+        client.cookies['elements_per_page'] = '1'
+        first = Irradiation.objects.order_by('-updated_at', '-id').first()
+        response = client.get(reverse('samples_manager:irradiations_list'),
+            {'page': 2, 'after': first.pk})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(first, response.context['irradiations'])
+
+    def test_irradiation_list_keyset_null_boundary(self):
+        """
+        Tests keyset pagination places irradiations without update date
+        last and keeps them when they are page boundaries.
+        """
+        client = Client()
+        set_user_cookies(client, 'Admin')
+        client.cookies['elements_per_page'] = '1'
+        Irradiation.objects.filter(pk__in=[1, 3]).update(updated_at=None)
+        irradiations = []
+        params = {'page': 1}
+        for page in range(1, Irradiation.objects.count() + 1):
+            response = client.get(reverse(
+                'samples_manager:irradiations_list'), params)
+            self.assertEqual(response.status_code, 200)
+            irradiations += list(response.context['irradiations'])
+            params = {'page': page + 1, 'after': irradiations[-1].pk}
+        response = client.get(reverse('samples_manager:irradiations_list'),
+            {'page': 2, 'before': irradiations[-1].pk})
+
+        self.assertEqual(sorted(irradiation.pk for irradiation in irradiations),
+            list(Irradiation.objects.order_by('pk').values_list('pk',
+            flat=True)))
+        self.assertIsNone(irradiations[-1].updated_at)
+        self.assertEqual(list(response.context['irradiations']),
+            [irradiations[-2]])
+
+    def test_batched_occupancies(self):
+        """
+        Tests batched occupancies equal the Decimal calculation, also
+        when read from stored compound lengths.
+        """
+        from samples_manager.occupancies import calc_occupancies
+        samples = list(Sample.objects.all())
+        result = calc_occupancies([sample.id for sample in samples])
+
+        for sample in samples:
+            expected = [0, 0, 0]
+            for layer in Layer.objects.filter(sample=sample):
+                elements = CompoundElement.objects.filter(
+                    compound=layer.compound_type)
+                density = layer.compound_type.density
+                if len(elements) == 0 or density == 0:
+                    continue
+                for i, field in enumerate(['radiation_length',
+                    'nu_coll_length', 'nu_int_length']):
+                    weighted = sum(element.percentage * getattr(
+                        element.element_type, field) for element in elements)
+                    linear = weighted / 100 / density
+                    if linear != 0:
+                        expected[i] += layer.length / (10 * linear)
+            self.assertEqual(result[sample.id],
+                [round(value * 100, 3) for value in expected])
+        self.assertFalse(Compound.objects.filter(layer__isnull=False,
+            linear_radiation_length__isnull=True).exists())
+        self.assertEqual(calc_occupancies([sample.id for sample in samples]),
+            result)
+
+    def test_occupancies_rounding_boundary(self):
+        """
+        Tests occupancies are rounded from Decimal values. Here the sum is
+        0.0035, which float arithmetic rounds down to 0.003.
+        """
+        from decimal import Decimal
+        from samples_manager.occupancies import calc_occupancies
+        element = Element.objects.create(atomic_number=200,
+            atomic_symbol='Tst', atomic_mass=1, density=1, min_ionization=1,
+            nu_coll_length='0.3', nu_int_length='0.3', pi_coll_length=1,
+            pi_int_length=1, radiation_length='0.30')
+        compound = Compound.objects.create(name='Boundary', density=1)
+        CompoundElement.objects.create(element_type=element, percentage=100,
+            compound=compound)
+        sample = Sample.objects.get(pk=2)
+        Layer.objects.filter(sample=sample).delete()
+        for length in ['0.000001', '0.000104']:
+            Layer.objects.create(name='Layer', length=length,
+                compound_type=compound, sample=sample)
+        self.assertEqual(calc_occupancies([sample.id])[sample.id],
+            [Decimal('0.004')] * 3)
+
+    def test_fluence_factor_index(self):
+        """
+        Tests fluence factors are resolved from the in-process index, which
+        is reloaded after fluence factors are saved or deleted.
+        """
+        from samples_manager.fluence_factors import get_fluence_factors
+        default_factor = FluenceFactor.objects.create(value=1)
+        irradiations = list(Irradiation.objects.filter(pk__in=[1, 2])
+            .select_related('dosimeter').order_by('pk'))
+        with self.assertNumQueries(1):
+            factors = get_fluence_factors(irradiations)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_fluence_factors(irradiations), factors)
+
+        self.assertEqual([factor.pk for factor in factors], [1, 1])
+        factor = FluenceFactor.objects.get(pk=1)
+        factor.value = 200000
+        factor.save()
+        with self.assertNumQueries(1):
+            factors = get_fluence_factors(irradiations)
+        self.assertEqual(factors[0].value, 200000)
+        factor.delete()
+        self.assertEqual(get_fluence_factors(irradiations),
+            [default_factor, default_factor])
+
+    def test_samples_fluences(self):
+        """Tests fluences of samples are grouped and summed in one pass."""
+        from samples_manager.fluences import get_samples_fluences
+        samples = list(Sample.objects.all())
+        with self.assertNumQueries(1):
+            result = get_samples_fluences(samples)
+
+        for sample in samples:
+            expected = dict()
+            for irradiation in Irradiation.objects.filter(sample=sample):
+                dosimeter = irradiation.dosimeter
+                if irradiation.estimated_fluence and dosimeter is not None \
+                    and '.' not in str(dosimeter):
+                    key = (dosimeter.width * dosimeter.height,
+                        irradiation.dos_position)
+                    expected[key] = expected.get(key, 0) + \
+                        irradiation.estimated_fluence
+            fluences = [fluence['Fluence_data']['estimated_fluence']
+                for fluence in result[sample.pk]]
+            self.assertEqual(sorted(fluences), sorted(expected.values()))
+            for fluence in result[sample.pk]:
+                self.assertEqual(fluence['Sample'], sample)
+
+    def test_experiment_details_queries(self):
+        """Tests experiment details queries don't grow with samples."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from samples_manager.experiment_views import get_experiment_details
+        experiment = Experiment.objects.get(pk=1)
+
+        def load_details():
+            details = get_experiment_details(experiment.pk)
+            str(details.experiment.responsible)
+            for sample in details.experiment_samples:
+                str(sample.material)
+                str(sample.req_fluence)
+            return details
+
+        with CaptureQueriesContext(connection) as queries:
+            load_details()
+        Sample.objects.update(experiment=experiment)
+        with self.assertNumQueries(len(queries)):
+            details = load_details()
+        self.assertEqual(len(details.experiment_samples),
+            Sample.objects.count())
+        with self.assertRaises(AttributeError):
+            details.fluences = ()
+
+    def test_actions_from_equipment_list(self):
+        """
+        Tests inforEAM actions are planned with a batch read against a
+        fake inforEAM service.
+        """
+        import os
+        from django.test import override_settings
+        from samples_manager.tests.fake_infoream import FakeInforEAMService
+        from samples_manager.utilities import reset_infoream_clients
+        from samples_manager.views import get_actions_from_equipment_list
+        service = FakeInforEAMService(
+            equipments=['PXXISET001-CR004000', 'HCPWPDI002-CR000001'],
+            comments=['PXXISET001-CR004000'])
+        service.start()
+        self.addCleanup(service.stop)
+        settings_override = override_settings(INFOREAM_WSDL=service.wsdl_path,
+            INFOREAM_WSDL_CACHE_PATH=os.path.join(
+                os.path.dirname(service.wsdl_path), 'wsdl.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_infoream_clients()
+        self.addCleanup(reset_infoream_clients)
+        result = get_actions_from_equipment_list(
+            ['SET-004000', 'DOS-004002', 'BOX-000001'])
+
+        self.assertNotIn('alert_message', result)
+        self.assertEqual([action['action'] for action in result['actions']], [
+            'update_equipment', 'update_comment',
+            'create_equipment',
+            'update_equipment',
+            'update_equipment', 'detach_parent', 'attach_parent',
+            'create_equipment', 'attach_parent'
+        ])
+        self.assertEqual(service.calls, ['readEquipmentBatch', 'readComments'])
+
+    def test_cached_beam_related_data(self):
+        """
+        Tests beam related data is calculated from cached SEC measurements
+        and multiplied by fluence factors.
+        """
+        from samples_manager.irradiation_views import calc_beam_related_data
+        from samples_manager.sec_cache import sync_sec_cache
+        irradiation = Irradiation.objects.get(pk=1)
+        db_path = set_sec_database(self, [
+            (irradiation.date_in + timedelta(hours=1), 2.5),
+            (irradiation.date_in + timedelta(hours=2), 4.0)])
+        sync_sec_cache()
+        # Measurements are only available in the cache.
+        connection = sqlite3.connect(db_path)
+        connection.execute('DELETE FROM ' + SQLITE_SEC_TABLE)
+        connection.commit()
+        connection.close()
+        element = calc_beam_related_data([irradiation],
+            True)['irradiation_data'][0]
+
+        self.assertEqual(element['sec'], Decimal('6.5'))
+        self.assertEqual(element['estimated_fluence'],
+            Decimal('6.5') * element['factor'].value)
+        self.assertEqual(element['date_first_sec'],
+            irradiation.date_in + timedelta(hours=1))
+
+    def test_chained_beam_related_data(self):
+        """
+        Tests beam related data of a continuation irradiation adds the SEC
+        of its previous irradiation.
+        """
+        from samples_manager.irradiation_views import calc_beam_related_data
+        previous = Irradiation.objects.get(pk=1)
+        previous.sec = 100
+        previous.save()
+        date_in = previous.date_out + timedelta(days=1)
+        set_sec_database(self, [(date_in + timedelta(hours=1), 2.5)])
+        irradiation = Irradiation.objects.create(sample=previous.sample,
+            dosimeter=previous.dosimeter, previous_irradiation=previous,
+            irrad_table=previous.irrad_table, status='OutBeam',
+            date_in=date_in, date_out=date_in + timedelta(hours=2))
+        irradiation = Irradiation.objects.get(pk=irradiation.pk)
+        element = calc_beam_related_data([irradiation])['irradiation_data'][0]
+
+        self.assertEqual(irradiation.parent_sec, 100)
+        self.assertEqual(element['sec'], Decimal('102.5'))
+        self.assertEqual(element['estimated_fluence'],
+            Decimal('102.5') * element['factor'].value)
+
+    def test_batched_irradiation_state(self):
+        """
+        Tests irradiation state set in a batch equals the state set
+        irradiation by irradiation, with SEC rounded when stored.
+        """
+        from samples_manager.irradiation_views import \
+            calc_beam_related_data, get_irradiation_state, \
+            set_irradiation_state
+        date_in = Irradiation.objects.get(pk=1).date_in
+        set_sec_database(self, [(date_in + timedelta(hours=1), 2.4),
+            (date_in + timedelta(hours=2), 3.3)])
+        expected = dict()
+        for irradiation in Irradiation.objects.order_by('pk'):
+            state = get_irradiation_state([irradiation])[0]
+            element = calc_beam_related_data([irradiation],
+                True)['irradiation_data'][0]
+            expected[irradiation.pk] = (IRRADIATION_STATUS[state][0],
+                round(element['sec']), element['estimated_fluence'],
+                element['factor'].id, element['date_first_sec'],
+                element['date_last_sec'] if state > 1 else None) \
+                if state > 0 else (IRRADIATION_STATUS[state][0], None, None,
+                None, None, None)
+        set_irradiation_state(list(Irradiation.objects.order_by('pk')))
+
+        for irradiation in Irradiation.objects.order_by('pk'):
+            status, sec, estimated_fluence, factor, date_first_sec, \
+                date_last_sec = expected[irradiation.pk]
+            self.assertEqual((irradiation.status, irradiation.sec,
+                irradiation.fluence_factor_id, irradiation.date_first_sec,
+                irradiation.date_last_sec), (status, sec, factor,
+                date_first_sec, date_last_sec))
+            if estimated_fluence is None:
+                self.assertIsNone(irradiation.estimated_fluence)
+            else:
+                self.assertAlmostEqual(irradiation.estimated_fluence,
+                    estimated_fluence, places=6)
+        self.assertEqual(Irradiation.objects.get(pk=1).sec, 6)
+
+    def test_refresh_beam_data_command(self):
+        """
+        Tests refresh command syncs the SEC cache and stores SEC and
+        estimated fluence of in beam irradiations.
+        """
+        from io import StringIO
+        from django.core.management import call_command
+        from samples_manager.sec_cache import sync_sec_cache
+        from samples_manager.utilities import get_aware_datetime
+        date_in = get_aware_datetime() - timedelta(hours=3)
+        db_path = set_sec_database(self, [(date_in + timedelta(hours=1), 2.4)])
+        sync_sec_cache()
+        connection = sqlite3.connect(db_path)
+        connection.execute('INSERT INTO ' + SQLITE_SEC_TABLE +
+            ' VALUES (\'SEC_01\', 3.3, ?)', (format_sec_date(
+            date_in + timedelta(hours=2)),))
+        connection.commit()
+        connection.close()
+        Irradiation.objects.filter(pk=2).update(status='InBeam',
+            date_in=date_in)
+        output = StringIO()
+        call_command('refresh_beam_data', '--once', stdout=output)
+        irradiation = Irradiation.objects.get(pk=2)
+
+        self.assertEqual(output.getvalue().strip(),
+            '1 in beam irradiations refreshed')
+        self.assertEqual(SecMeasurement.objects.count(), 2)
+        self.assertEqual(irradiation.sec, 6)
+        self.assertIsNotNone(irradiation.fluence_factor)
+        self.assertAlmostEqual(irradiation.estimated_fluence,
+            Decimal('5.7') * irradiation.fluence_factor.value, places=6)
+        self.assertIsNone(Irradiation.objects.get(pk=1).sec)
+
+    def test_create_group_irradiations(self):
+        """
+        Tests group irradiations are inserted at once, invalidating the
+        cached irradiations count and indexing the new irradiations.
+        """
+        from samples_manager.irradiation_views import \
+            create_group_irradiations
+        from samples_manager.utilities import get_elements_count
+        set_sec_database(self)
+        num_irradiations = get_elements_count(Irradiation.objects.all())
+        samples = list(Sample.objects.filter(pk__in=[1, 2]))
+        with override_settings(SEARCH_INDEX_ENABLED=True):
+            pks = create_group_irradiations(samples, Dosimeter.objects.get(
+                pk=1), 'IRRAD3', 'A', User.objects.first())
+        irradiations = Irradiation.objects.filter(pk__in=pks)
+
+        self.assertEqual(sorted(irradiations.values_list('sample',
+            flat=True)), [1, 2])
+        self.assertFalse(irradiations.filter(pk__in=[1, 2, 3]).exists())
+        self.assertEqual(get_elements_count(Irradiation.objects.all()),
+            num_irradiations + 2)
+        self.assertEqual(set(SearchIndex.objects.filter(
+            model_name='irradiation', object_id__in=pks)
+            .values_list('object_id', flat=True)), set(pks))
+
+    def test_beam_irradiation_state(self):
+        """
+        Tests irradiations put in and taken out of beam share timestamps
+        and finished irradiations get continuation irradiations.
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from samples_manager.irradiation_views import \
+            set_beam_irradiation_state
+        from samples_manager.utilities import get_aware_datetime
+        set_sec_database(self)
+        now = get_aware_datetime()
+        with CaptureQueriesContext(connection) as queries:
+            set_beam_irradiation_state([1, 2], 'InBeam', now)
+        continuation = Irradiation.objects.get(previous_irradiation=1)
+        started = Irradiation.objects.get(pk=2)
+        finished = Irradiation.objects.get(pk=1)
+
+        self.assertFalse(any('"samples_manager_sample"' in query['sql']
+            for query in queries))
+        self.assertEqual(continuation.status, 'InBeam')
+        self.assertEqual(continuation.date_in, now)
+        self.assertEqual(continuation.sample_id, finished.sample_id)
+        self.assertEqual(continuation.dosimeter_id, finished.dosimeter_id)
+        self.assertEqual(continuation.lineage_depth, 1)
+        self.assertTrue(finished.has_children)
+        self.assertEqual(finished.status, 'Registered')
+        self.assertEqual(started.status, 'InBeam')
+        self.assertEqual(started.date_in, now)
+        self.assertIsNone(started.date_out)
+
+        later = now + timedelta(hours=1)
+        set_beam_irradiation_state([continuation.pk, started.pk, 3],
+            'OutBeam', later)
+        for irradiation in Irradiation.objects.filter(
+            pk__in=[continuation.pk, started.pk]):
+            self.assertEqual(irradiation.status, 'OutBeam')
+            self.assertEqual(irradiation.date_out, later)
+            self.assertEqual(irradiation.updated_at, later)
+        self.assertEqual(Irradiation.objects.get(pk=3).status, 'Registered')
+        self.assertEqual(Irradiation.objects.filter(
+            previous_irradiation__in=[1, 2, 3]).count(), 1)
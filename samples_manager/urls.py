@@ -90,9 +90,11 @@ urlpatterns = [
     url(r'^irradiations/beam_status_toggle/$', irradiation_views.irradiation_in_beam_status_update, name='irradiation_in_beam_status_update'),
     url(r'^irradiations/create/$', irradiation_views.irradiation_create, name='irradiation_create'),
     url(r'^irradiations/delete/$', irradiation_views.irradiation_delete, name='irradiation_delete'),
+    url(r'^irradiations/previous/$', irradiation_views.get_previous_irradiations, name='get_previous_irradiations'),
     url(r'^irradiations/search/$', irradiation_views.irradiations_search, name='irradiations_search'),
     url(r'^irradiations/select_table/$', irradiation_views.select_table, name='select_table'),
     url(r'^irradiations/status_update/$', irradiation_views.irradiation_status_update, name='irradiation_status_update'),
+    url(r'^irradiations/table_beam_status_toggle/$', irradiation_views.table_beam_status_update, name='table_beam_status_update'),
     url(r'^irradiations/update/$', irradiation_views.irradiation_update, name='irradiation_update'),
     url(r'^irradiations/update_sec/$', irradiation_views.update_sec, name='irradiations_update_sec'),
     url(r'^list_filter/$',views.list_filter, name='list_filter'),
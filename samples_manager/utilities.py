@@ -4,17 +4,26 @@ import re
 import pytz
 import math
 import logging
+import sqlite3
 import cx_Oracle
+import threading
 import numpy as np
+from decimal import Decimal
 from requests import Session
-from django.db.models import Q
+from django.db.models import F, Q
 from django.urls import reverse
 from zeep import Client, Settings
 from zeep.exceptions import Fault
+from zeep.cache import SqliteCache
 from zeep.transports import Transport
+from requests.adapters import HTTPAdapter
 from django.db import OperationalError
 from django.core.mail import EmailMessage
-from django.core.paginator import Paginator
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+from django.core.paginator import Page, Paginator
 from datetime import datetime as dt, timedelta
 from django.core.exceptions import ValidationError
 
@@ -22,6 +31,12 @@ from django.core.exceptions import ValidationError
 APP_NAME = 'samples_manager'
 MIN_ELEMENTS_PER_PAGE_DOUBLE_PAGINATION = 50
 MAX_PAGES = 10
+ELEMENTS_PER_PAGE = 10
+# Maximum page size, also used when all elements are requested.
+MAX_ELEMENTS_PER_PAGE = 1000
+COUNT_CACHE_KEY = 'samples_manager:count:%s'
+# Seconds a cached count is kept. Counts are also invalidated by signals.
+COUNT_CACHE_TIMEOUT = 300
 FIRST_SET_ID_NUMBER = 3200
 SET_ID_NUM_DIGITS = 6
 MAX_FILTER_RECURSION_LEVEL = 5
@@ -37,6 +52,42 @@ DB_CONNECTION_STRINGS = [
             'placeholder.url.com'
     }
 ]
+# External databases session pools. Sizes in sessions, timeouts in seconds
+# except DB_POOL_WAIT_TIMEOUT and DB_CALL_TIMEOUT in milliseconds.
+DB_POOL_MIN_SIZE = 1
+DB_POOL_MAX_SIZE = 4
+DB_POOL_INCREMENT = 1
+DB_POOL_TIMEOUT = 300
+DB_POOL_WAIT_TIMEOUT = 5000
+DB_CALL_TIMEOUT = 30000
+DB_POOLS = {}
+DB_POOLS_LOCK = threading.Lock()
+# Connection strings with this prefix use a local SQLite database instead 
+# of Oracle, e.g. 'sqlite:///sec.sqlite3'. Used for tests.
+SQLITE_CONNECTION_PREFIX = 'sqlite:///'
+SEC_TABLE = 'PS_IRRAD_USER.SEC_DATA'
+SQLITE_SEC_TABLE = 'SEC_DATA'
+SEC_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Maximum number of date ranges resolved in a single SEC query.
+SEC_QUERY_BATCH_SIZE = 100
+# inforEAM SOAP service. Clients are shared by the threads of a process and
+# the WSDL is cached on disk, in the default zeep cache location if
+# INFOREAM_WSDL_CACHE_PATH is None. Timeouts in seconds. Django settings of
+# the same names override these.
+INFOREAM_WSDL = 'placeholder.url.com'
+INFOREAM_WSDL_CACHE_PATH = None
+INFOREAM_WSDL_CACHE_TIMEOUT = 86400
+INFOREAM_WSDL_TIMEOUT = 60
+INFOREAM_OPERATION_TIMEOUT = 60
+INFOREAM_POOL_CONNECTIONS = 1
+INFOREAM_POOL_MAX_SIZE = 10
+# Maximum number of equipments read in a single inforEAM batch read.
+INFOREAM_BATCH_SIZE = 100
+# zeep settings of calls whose responses aren't strictly valid.
+INFOREAM_LAX_SETTINGS = Settings(strict=False, xml_huge_tree=True)
+INFOREAM_TRANSPORT_KEY = 'transport'
+INFOREAM_CLIENTS = {}
+INFOREAM_CLIENTS_LOCK = threading.Lock()
 LIST_VIEW_URL_INFO = [
     {'url_ref': 'samples_manager:experiments_list', 'args': []},
     {'url_ref': 'samples_manager:experiments_shared_list', 'args': []},
@@ -360,39 +411,154 @@ def get_experiment_users(experiment):
 def get_db_connection_string(connection_str):
     """
     Retrieves database connection string depending on
-    connection identifier.
+    connection identifier. DB_CONNECTION_STRINGS setting, if present, 
+    overrides the module connection strings.
     """
-    for connection in DB_CONNECTION_STRINGS:
+    from django.conf import settings
+    connections = getattr(settings, 'DB_CONNECTION_STRINGS', 
+        DB_CONNECTION_STRINGS)
+    for connection in connections:
         if connection_str in connection['key']:
             return connection['value']
     return None
 
 
+def is_sqlite_db(key):
+    """Checks if external database is a local SQLite stand-in."""
+    result = get_db_connection_string(key).startswith(
+        SQLITE_CONNECTION_PREFIX)
+    return result
+
+
+def get_db_pool(connection_str):
+    """
+    Returns Oracle session pool of connection string. Pools are created 
+    once per process and shared between threads.
+    """
+    with DB_POOLS_LOCK:
+        if connection_str not in DB_POOLS:
+            user, password_dsn = connection_str.split('/', 1)
+            password, dsn = password_dsn.rsplit('@', 1)
+            DB_POOLS[connection_str] = cx_Oracle.SessionPool(
+                user=user, password=password, dsn=dsn,
+                min=DB_POOL_MIN_SIZE, max=DB_POOL_MAX_SIZE,
+                increment=DB_POOL_INCREMENT, threaded=True,
+                getmode=cx_Oracle.SPOOL_ATTRVAL_TIMEDWAIT,
+                wait_timeout=DB_POOL_WAIT_TIMEOUT, timeout=DB_POOL_TIMEOUT)
+    return DB_POOLS[connection_str]
+
+
+def create_sqlite_tables(connection):
+    """Creates tables of external databases in SQLite stand-in."""
+    connection.execute('CREATE TABLE IF NOT EXISTS ' + SQLITE_SEC_TABLE + 
+        ' (SEC_ID CHAR(10), SEC_VALUE FLOAT, TIMESTAMP TIMESTAMP)')
+    connection.execute('CREATE TABLE IF NOT EXISTS LOC_CL_CUR_LOCAL_INFO '\
+        '(NOM_LOCAL VARCHAR(100))')
+
+
+@contextmanager
+def db_connection(key):
+    """
+    Context manager providing connection to external database. Oracle 
+    sessions are acquired from the pool of the connection and released on 
+    exit. The Oracle client pings sessions idle for more than 60 seconds
+    when they are acquired.
+    """
+    connection_str = get_db_connection_string(key)
+    if is_sqlite_db(key):
+        connection = sqlite3.connect(
+            connection_str[len(SQLITE_CONNECTION_PREFIX):])
+        create_sqlite_tables(connection)
+        try:
+            yield connection
+        finally:
+            connection.close()
+    else:
+        pool = get_db_pool(connection_str)
+        connection = pool.acquire()
+        connection.call_timeout = DB_CALL_TIMEOUT
+        try:
+            yield connection
+        finally:
+            pool.release(connection)
+
+
+def get_sec_table(key='sec'):
+    """Returns SEC table name of external database."""
+    result = SQLITE_SEC_TABLE if is_sqlite_db(key) else SEC_TABLE
+    return result
+
+
+def get_sec_date_expression(param, key='sec'):
+    """Returns SQL expression of date bind parameter for SEC database."""
+    result = ':' + param
+    if not is_sqlite_db(key):
+        result = 'TO_TIMESTAMP(' + result + \
+            ', \'YYYY-MM-DD HH24:MI:SS.FF6\')'
+    return result
+
+
+def format_sec_date(utc_date):
+    """
+    Formats UTC date as SEC database date. SEC database has times stored 
+    in CERN timezone.
+    """
+    result = datetime_as_cern_timezone(utc_date).strftime(SEC_DATE_FORMAT)
+    return result
+
+
+def parse_sec_date(value):
+    """Parses SEC database date as UTC aware datetime."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = dt.fromisoformat(value)
+    # Database returns naive timezone
+    result = datetime_naive_to_aware(value, get_cern_timezone())
+    result = datetime_as_timezone(result)
+    return result
+
+
+def get_sec_value(value):
+    """
+    Returns SEC value of database as Decimal, 0 if it is None. Values are 
+    Decimal so they can be multiplied by fluence factors.
+    """
+    result = Decimal(0) if value is None else Decimal(str(value))
+    return result
+
+
+def round_sec(value):
+    """
+    Rounds accumulated SEC to the integer stored in irradiations instead of
+    truncating it on save.
+    """
+    result = int(round(value))
+    return result
+
+
 def get_locations_from_db(str=None, num_results=None):
     """Retrieves list of locations at CERN from oracle database."""
     result = ()
+    table = 'LOC_CL_CUR_LOCAL_INFO' if is_sqlite_db('locations') \
+        else '"AISPUB"."LOC_CL_CUR_LOCAL_INFO"'
+    query = 'SELECT NOM_LOCAL FROM ' + table
+    params = {}
+    if str is not None:
+        query += ' WHERE NOM_LOCAL LIKE :pattern'
+        params['pattern'] = '%' + str + '%'
+    query += ' ORDER BY NOM_LOCAL'
     try:
-        # Database connection removed from settings to not affect tests.
-        connection_str = get_db_connection_string('locations')
-        connection = cx_Oracle.connect(connection_str)
-        cursor = connection.cursor()
-        if str is None:
-            query = 'SELECT NOM_LOCAL FROM "AISPUB".'\
-                '"LOC_CL_CUR_LOCAL_INFO" ORDER BY NOM_LOCAL'
-        else:
-            query = 'SELECT NOM_LOCAL FROM "AISPUB".'\
-                '"LOC_CL_CUR_LOCAL_INFO" WHERE NOM_LOCAL LIKE '\
-                '\'%' + str +  '%\' ORDER BY NOM_LOCAL'
-        cursor.execute(query)
-    except OperationalError:
-        return result
-
-    if type(num_results) is int or type(num_results) is float:
-        result = cursor.fetchmany(num_results)
-    else:
-        result = cursor.fetchall()
-    cursor.close()
-    connection.close() 
+        with db_connection('locations') as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            if type(num_results) is int or type(num_results) is float:
+                result = cursor.fetchmany(int(num_results))
+            else:
+                result = cursor.fetchall()
+            cursor.close()
+    except (cx_Oracle.Error, sqlite3.Error):
+        logging.error('Error retrieving locations.')
     return result
 
 
@@ -414,45 +580,121 @@ def get_sec_dates_from_irradiation(irradiation):
     Returns dates for first and last positive sec measurement
     in date range.
     """
-    connection_str = get_db_connection_string('sec')
-    connection_db = cx_Oracle.connect(connection_str)
-    cursor = connection_db.cursor()
     result = dict()
-    # From UTC to CERN timezone because SEC database has times 
-    # stored in CERN timezone.
-    local_date_in = get_aware_cern_datetime() if irradiation.date_in \
-        is None else datetime_as_cern_timezone(irradiation.date_in)
-    local_date_out = get_aware_cern_datetime() if irradiation.date_out \
-        is None else datetime_as_cern_timezone(irradiation.date_out)
-    local_date_in = local_date_in.strftime('%Y-%m-%d %H:%M:%S')
-    local_date_out = local_date_out.strftime('%Y-%m-%d %H:%M:%S')
-    partial_query = 'SELECT TIMESTAMP FROM PS_IRRAD_USER.SEC_DATA WHERE '\
-        'SEC_ID = \'SEC_01\' AND SEC_VALUE > 0 AND TIMESTAMP > TO_DATE(\'' \
-        + str(local_date_in) + '\', \'YYYY-MM-DD HH24:MI:SS\') AND '\
-        'TIMESTAMP < TO_DATE(\''+ str(local_date_out) + '\', \''\
-        'YYYY-MM-DD HH24:MI:SS\') ORDER BY TIMESTAMP'
-    asc_query = partial_query + ' ASC FETCH FIRST 1 ROWS ONLY'
-    desc_query = partial_query + ' DESC FETCH FIRST 1 ROWS ONLY'
+    date_in = get_aware_datetime() if irradiation.date_in is None \
+        else irradiation.date_in
+    result['date_first_sec'] = None
+    result['date_last_sec'] = None
     try:
-        cursor.execute(asc_query)
-        asc_rows = cursor.fetchall()
-        cursor.execute(desc_query)
-        desc_rows = cursor.fetchall()
-        # Database returns naive timezone
-        local_tz = get_cern_timezone()
-        # Add local timezone before turning to UTC
-        cond = (len(asc_rows) > 0 and len(desc_rows) > 0)
-        date_first_sec = None
-        date_last_sec = None
-        if cond:
-            date_first_sec = datetime_naive_to_aware(asc_rows[0][0], local_tz)
-            date_last_sec = datetime_naive_to_aware(desc_rows[0][0], local_tz)
-            date_first_sec = datetime_as_timezone(date_first_sec)
-            date_last_sec = datetime_as_timezone(date_last_sec)
-    except OperationalError:
+        sec_data = calc_sec_data_in_ranges(
+            [(date_in, irradiation.date_out)])[0]
+        result['date_first_sec'] = sec_data['date_first_sec']
+        result['date_last_sec'] = sec_data['date_last_sec']
+    except (cx_Oracle.Error, sqlite3.Error):
         logging.error('Error calculating sec_dates.')
-    result['date_first_sec'] = date_first_sec
-    result['date_last_sec'] = date_last_sec
+    return result
+
+
+def get_sec_ranges_query(num_ranges, key='sec'):
+    """
+    Returns query calculating accumulated SEC and dates of first and last 
+    positive SEC measurement for a number of date ranges. Date ranges are 
+    passed as bind parameters date_in_<i> and date_out_<i>.
+    """
+    dual = '' if is_sqlite_db(key) else ' FROM DUAL'
+    ranges = ' UNION ALL '.join(
+        'SELECT ' + str(i) + ' AS RANGE_ID, ' + 
+        get_sec_date_expression('date_in_' + str(i), key) + ' AS DATE_IN, ' + 
+        get_sec_date_expression('date_out_' + str(i), key) + ' AS DATE_OUT' + 
+        dual for i in range(num_ranges))
+    result = 'SELECT R.RANGE_ID, SUM(S.SEC_VALUE), '\
+        'MIN(CASE WHEN S.SEC_VALUE > 0 THEN S.TIMESTAMP END), '\
+        'MAX(CASE WHEN S.SEC_VALUE > 0 THEN S.TIMESTAMP END) '\
+        'FROM (' + ranges + ') R JOIN ' + get_sec_table(key) + ' S '\
+        'ON S.TIMESTAMP > R.DATE_IN AND S.TIMESTAMP < R.DATE_OUT '\
+        'WHERE S.SEC_ID = \'SEC_01\' GROUP BY R.RANGE_ID'
+    return result
+
+
+def fetch_sec_data_in_ranges(utc_date_ranges):
+    """
+    Calculates accumulated SEC and dates of first and last positive SEC 
+    measurement for list of (date_in, date_out) ranges querying the SEC 
+    database. If date_in is None accumulated SEC is 0, if date_out is None 
+    it uses current timestamp. Expects dates in UTC timezone. All ranges 
+    are resolved with one query per SEC_QUERY_BATCH_SIZE ranges.
+    """
+    result = [{'sec': 0, 'date_first_sec': None, 'date_last_sec': None} 
+        for _ in utc_date_ranges]
+    now = get_aware_datetime()
+    ranges = [(i, date_in, now if date_out is None else date_out) 
+        for i, (date_in, date_out) in enumerate(utc_date_ranges) 
+        if date_in is not None]
+    if not ranges:
+        return result
+
+    with db_connection('sec') as connection:
+        cursor = connection.cursor()
+        for start in range(0, len(ranges), SEC_QUERY_BATCH_SIZE):
+            batch = ranges[start:start + SEC_QUERY_BATCH_SIZE]
+            params = dict()
+            for j, (_, date_in, date_out) in enumerate(batch):
+                params['date_in_' + str(j)] = format_sec_date(date_in)
+                params['date_out_' + str(j)] = format_sec_date(date_out)
+            cursor.execute(get_sec_ranges_query(len(batch)), params)
+            for range_id, sec_sum, date_first_sec, date_last_sec in \
+                cursor.fetchall():
+                element = result[batch[range_id][0]]
+                element['sec'] = get_sec_value(sec_sum)
+                element['date_first_sec'] = parse_sec_date(date_first_sec)
+                element['date_last_sec'] = parse_sec_date(date_last_sec)
+        cursor.close()
+    return result
+
+
+def calc_sec_data_in_ranges(utc_date_ranges):
+    """
+    Calculates accumulated SEC and dates of first and last positive SEC 
+    measurement for list of (date_in, date_out) ranges. If date_in is None 
+    accumulated SEC is 0, if date_out is None it uses current timestamp. 
+    Expects dates in UTC timezone. Ranges are resolved from the local SEC 
+    cache and only the parts before the first or after the last cached 
+    measurement are queried from the SEC database.
+    """
+    from .sec_cache import calc_cached_sec_data_in_ranges, \
+        get_sec_cache_range
+    cache_start, cache_end = get_sec_cache_range()
+    if cache_start is None:
+        return fetch_sec_data_in_ranges(utc_date_ranges)
+
+    heads = []
+    tails = []
+    now = get_aware_datetime()
+    ranges = [(date_in, now if date_out is None else date_out)
+        for date_in, date_out in utc_date_ranges]
+    result = calc_cached_sec_data_in_ranges(ranges)
+    for element, (date_in, date_out) in zip(result, ranges):
+        if date_in is None:
+            continue
+        if date_in < cache_start:
+            heads.append((element, date_in, min(date_out, cache_start)))
+        if date_out > cache_end:
+            tails.append((element, max(date_in, cache_end), date_out))
+
+    remote_data = fetch_sec_data_in_ranges([(date_in, date_out) 
+        for _, date_in, date_out in heads + tails])
+    for (element, _, _), head in zip(heads, remote_data[:len(heads)]):
+        element['sec'] += head['sec']
+        if head['date_first_sec'] is not None:
+            element['date_first_sec'] = head['date_first_sec']
+        if element['date_last_sec'] is None:
+            element['date_last_sec'] = head['date_last_sec']
+    for (element, _, _), tail in zip(tails, remote_data[len(heads):]):
+        element['sec'] += tail['sec']
+        if element['date_first_sec'] is None:
+            element['date_first_sec'] = tail['date_first_sec']
+        if tail['date_last_sec'] is not None:
+            element['date_last_sec'] = tail['date_last_sec']
     return result
 
 
@@ -596,18 +838,88 @@ def apply_infoream_actions(actions):
     return response
 
 
+def get_infoream_setting(name):
+    """
+    Returns inforEAM setting. Django setting of the same name, if present,
+    overrides the module setting.
+    """
+    from django.conf import settings
+    result = getattr(settings, name, globals()[name])
+    return result
+
+
+def get_infoream_transport():
+    """
+    Returns inforEAM transport. It is created once per process and shared
+    between threads. Its HTTP session keeps a pool of connections and
+    parsed WSDL documents are cached on disk.
+    """
+    with INFOREAM_CLIENTS_LOCK:
+        if INFOREAM_TRANSPORT_KEY not in INFOREAM_CLIENTS:
+            session = Session()
+            # Set to True in production
+            session.verify = False
+            adapter = HTTPAdapter(
+                pool_connections=INFOREAM_POOL_CONNECTIONS,
+                pool_maxsize=INFOREAM_POOL_MAX_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            cache = SqliteCache(
+                path=get_infoream_setting('INFOREAM_WSDL_CACHE_PATH'),
+                timeout=get_infoream_setting('INFOREAM_WSDL_CACHE_TIMEOUT'))
+            INFOREAM_CLIENTS[INFOREAM_TRANSPORT_KEY] = Transport(
+                session=session, cache=cache,
+                timeout=get_infoream_setting('INFOREAM_WSDL_TIMEOUT'),
+                operation_timeout=get_infoream_setting(
+                    'INFOREAM_OPERATION_TIMEOUT'))
+    return INFOREAM_CLIENTS[INFOREAM_TRANSPORT_KEY]
+
+
+def get_infoream_client_key(settings=None):
+    """
+    Returns key of inforEAM client of zeep settings, built from the values
+    of their public fields. The representation of settings can't be used
+    as it includes their thread-local state.
+    """
+    result = None if settings is None else repr(tuple(
+        (field.name, getattr(settings, field.name))
+        for field in type(settings).__attrs_attrs__
+        if not field.name.startswith('_')))
+    return result
+
+
+def get_infoream_client(settings=None):
+    """
+    Returns inforEAM client of zeep settings. Clients are created, and the
+    WSDL parsed, once per process and settings and shared between threads.
+    """
+    key = get_infoream_client_key(settings)
+    transport = get_infoream_transport()
+    with INFOREAM_CLIENTS_LOCK:
+        if key not in INFOREAM_CLIENTS:
+            wsdl = get_infoream_setting('INFOREAM_WSDL')
+            if settings is None:
+                client = Client(wsdl=wsdl, transport=transport)
+            else:
+                client = Client(wsdl=wsdl, transport=transport,
+                    settings=settings)
+            INFOREAM_CLIENTS[key] = client
+    return INFOREAM_CLIENTS[key]
+
+
+def reset_infoream_clients():
+    """Discards inforEAM clients, e.g. after settings change."""
+    with INFOREAM_CLIENTS_LOCK:
+        transport = INFOREAM_CLIENTS.pop(INFOREAM_TRANSPORT_KEY, None)
+        INFOREAM_CLIENTS.clear()
+    if transport is not None:
+        transport.session.close()
+
+
 def get_infoream_credentials(**kwargs):
     """Centralized function to access inforEAM credentials."""
     settings = kwargs.get('settings', None)
-    wsdl = 'placeholder.url.com'
-    session = Session()
-    # Set to True in production
-    session.verify = False
-    transport = Transport(session=session)
-    if settings is None:
-        client = Client(wsdl=wsdl, transport=transport)
-    else:
-        client = Client(wsdl=wsdl, transport=transport, settings=settings)
+    client = get_infoream_client(settings)
     credetials_type = client.get_type('ns0:credentials')
     cred = credetials_type(password= 'password', username='username')
     return cred, client
@@ -636,59 +948,6 @@ def get_query(query_string, search_fields):
     return query
 
 
-def filter_model_objects_by_str(query_str, Model, recursion_level=0, instance_list=None):
-    """
-    Filters model object by string. It compares string with all comparable 
-    model attributes. If instance_list is provided, it ony returns from 
-    instance_list. It also maintains the order of elements from instace_list.
-    """
-    search_field_types = ['CharField', 'TextField', 'PositiveIntegerField', \
-        'DecimalField', 'EmailField', 'DateTimeField']
-    model_names = get_model_class_names()
-    model_name = get_model_name_from_class(Model)
-    recursion_level = recursion_level + 1
-    if model_name not in model_names:
-        return None
-    if query_str.strip():
-        fields = Model._meta.fields
-        query_result = []
-        # Check if maximum recursion level has met
-        if recursion_level < MAX_FILTER_RECURSION_LEVEL:
-            # Find foreign keys and run filter recursively 
-            for field in fields:
-                field_type = str(type(field)) 
-                if 'ForeignKey' in field_type:
-                    foreign_model = get_model_class_from_name(\
-                        field.deconstruct()[3]['to'].split('.')[1])
-                    # Recursive call
-                    foreign_matches = \
-                        filter_model_objects_by_str(query_str, foreign_model, 
-                            recursion_level)
-                    foreign_matches_ids = [e.pk for e in foreign_matches]
-                    entry_query = Q(**{
-                        '%s__id__in' % field.name: foreign_matches_ids})
-                    matches = Model.objects.filter(entry_query)
-                    query_result = query_result + list(matches)
-        fields = [field.name for field in fields 
-            if any(x in str(type(field)) for x in search_field_types)]
-        entry_query = get_query(query_str,fields)
-        query_result = query_result + list(Model.objects.filter(entry_query))
-        # Remove duplicates
-        query_result = list(set(query_result))
-    else:
-        query_result = Model.objects.all()
-
-    # If a list is provided only return items from list.
-    result = query_result
-    if instance_list is not None:
-        result = []
-        for e in instance_list:
-            if e in query_result:
-                result.append(e)
-
-    return result
-
-
 def read_equipment(data):
     """Reads equipment information in inforEAM."""
     result = dict()
@@ -792,6 +1051,24 @@ def read_equipment_list(data):
     return result
 
 
+def read_equipment_existence(infoream_ids):
+    """
+    Checks which equipments exist in inforEAM with batch reads of up to
+    INFOREAM_BATCH_SIZE equipments. Returns dictionary of infoream id to
+    existence. Equipments of failed reads are considered missing.
+    """
+    infoream_ids = list(dict.fromkeys(infoream_id
+        for infoream_id in infoream_ids if infoream_id is not None))
+    result = dict((infoream_id, False) for infoream_id in infoream_ids)
+    for start in range(0, len(infoream_ids), INFOREAM_BATCH_SIZE):
+        batch = infoream_ids[start:start + INFOREAM_BATCH_SIZE]
+        response = read_equipment_list({'infoream_ids': batch})
+        if response['response'] is not None:
+            for infoream_id, item in zip(batch, response['response']):
+                result[infoream_id] = (item['response'] is not None)
+    return result
+
+
 def read_equipment_list_simulated(data):
     """Simulate reading multiple equipment information from inforEAM."""
     result = {
@@ -922,8 +1199,8 @@ def run_assign_set_id_simulation():
 def create_equipment(data):
     """Creates equipment in inforEAM."""
     result = dict()
-    settings = Settings(strict=False, xml_huge_tree=True)
-    cred, client = get_infoream_credentials(settings=settings)
+    cred, client = get_infoream_credentials(
+        settings=INFOREAM_LAX_SETTINGS)
     equipment_type = client.get_type('ns0:equipment')
     current_date = get_aware_datetime().strftime('%d-%b-%Y')
     udf = {}
@@ -1238,88 +1515,38 @@ def calc_acc_sec_in_range(utc_date_in, utc_date_out=None):
     Calculates accumulated SEC for date range. If date_out is None, it uses
     current timestamp. Expects dates in UTC timezone. 
     """
-    connection_str = get_db_connection_string('sec')
-    connection_db = cx_Oracle.connect(connection_str)
-    cursor = connection_db.cursor()
-
     if utc_date_in is None:
         return 0
-    elif utc_date_out is None:
-        utc_date_out = get_aware_datetime()
-    local_date_in = datetime_as_cern_timezone(utc_date_in)
-    local_date_out = datetime_as_cern_timezone(utc_date_out)
-    local_date_in = local_date_in.strftime('%Y-%m-%d %H:%M:%S')
-    local_date_out = local_date_out.strftime('%Y-%m-%d %H:%M:%S')
-    if 'pdbr' in connection_str:
-        query = 'SELECT SUM(SEC_VALUE) FROM PS_IRRAD_USER.SEC_DATA WHERE '\
-            'SEC_ID = \'SEC_01\' AND TIMESTAMP > TO_DATE(\''\
-            + str(local_date_in) + '\', \'YYYY-MM-DD HH24:MI:SS\') AND ' \
-            'TIMESTAMP < TO_DATE(\'' + str(local_date_out) + '\', \''\
-            'YYYY-MM-DD HH24:MI:SS\')'
-    else:
-        #Option included for automated Selenium tests. 
-        query = 'SELECT SUM(SEC_VALUE) FROM SEC_DATA WHERE '\
-            'SEC_ID = "SEC_01" AND TIMESTAMP>"' + str(local_date_in) + \
-            '" AND TIMESTAMP<"' + str(local_date_out) + ';'
-    table_not_present = True
-    while(table_not_present):
-        try:
-            cursor.execute(query)
-            table_not_present = False
-        except OperationalError:
-            cursor.execute('CREATE TABLE SEC_DATA (SEC_ID CHAR(10), '\
-                'SEC_VALUE FLOAT(20, 17), TIMESTAMP TIMESTAMP);')
-
-    sec_sum = cursor.fetchall()[0][0]
-    if sec_sum is None:
-        sec_sum = 0
-    return sec_sum
+    result = calc_sec_data_in_ranges([(utc_date_in, utc_date_out)])[0]['sec']
+    return result
 
 
 def update_previous_irradiations_sec(irradiations):
     """Updates sec of irradiaitons and their children relations."""
-    connection_str = get_db_connection_string('sec')
-    connection_db = cx_Oracle.connect(connection_str)
-    cursor = connection_db.cursor()
     data = dict()
     data['sec_data'] = []
-
+    irradiations = [irradiation for irradiation in irradiations 
+        if 'inbeam' in irradiation.status.lower()]
     for irradiation in irradiations:
-        if 'inbeam' in irradiation.status.lower():
-            has_no_date = (irradiation.date_in is None)
-            if has_no_date:
-                irradiation.date_in = get_aware_datetime()
-            # To Geneva time because SEC database has times stored in local timezone
-            local_date_in = datetime_as_cern_timezone(irradiation.date_in)
-            timestamp = local_date_in.strftime('%Y-%m-%d %H:%M:%S')
-            if 'pdbr' in connection_str:
-                query = 'SELECT SUM(SEC_VALUE) FROM PS_IRRAD_USER.SEC_DATA WHERE '\
-                    'SEC_ID = \'SEC_01\' AND TIMESTAMP > TO_DATE(\''\
-                    + str(timestamp) + '\', \'YYYY-MM-DD HH24:MI:SS\')'
-            else:
-                #Option included for automated Selenium tests. 
-                query = 'SELECT SEC_VALUE FROM SEC_DATA WHERE '\
-                    'SEC_ID = "SEC_01" AND TIMESTAMP>"' + str(timestamp) + '";'
-            table_not_present = True
-            while(table_not_present):
-                try:
-                    cursor.execute(query)
-                    table_not_present = False
-                except OperationalError:
-                    cursor.execute('CREATE TABLE SEC_DATA (SEC_ID CHAR(10), '\
-                        'SEC_VALUE FLOAT(20, 17), TIMESTAMP TIMESTAMP);')
-
-            sec_sum = cursor.fetchall()[0][0]
-            if sec_sum is None:
-                sec_sum = 0
-            if irradiation.previous_irradiation is not None:
-                sec_sum = sec_sum + irradiation.previous_irradiation.sec
-            irradiation.sec = sec_sum
-            irradiation.save()
-            data['sec_data'].append({
-                'pk': irradiation.id,
-                'sec': irradiation.sec
-            })
+        has_no_date = (irradiation.date_in is None)
+        if has_no_date:
+            irradiation.date_in = get_aware_datetime()
+    sec_data = calc_sec_data_in_ranges(
+        [(irradiation.date_in, None) for irradiation in irradiations])
+
+    from .lineage import get_parent_secs
+    parent_secs = get_parent_secs(irradiations)
+    for irradiation, element, parent_sec in zip(irradiations, sec_data,
+        parent_secs):
+        sec_sum = element['sec']
+        if parent_sec is not None:
+            sec_sum = sec_sum + parent_sec
+        irradiation.sec = round_sec(sec_sum)
+        irradiation.save()
+        data['sec_data'].append({
+            'pk': irradiation.id,
+            'sec': irradiation.sec
+        })
     return data
 
 
@@ -1402,7 +1629,8 @@ def get_page_url_parameters_as_string(request):
     params = params.split('?')[-1].split('&')
     result = '?'
     for param in params:
-        condition = ('page=' not in param and param != '')
+        condition = ('page=' not in param and param != ''
+            and not param.startswith(('after=', 'before=')))
         if condition:
             result += param + '&'
     return result
@@ -1461,22 +1689,173 @@ def clean_number_in_range(value, var_type, ranges):
     return result
 
 
-def get_pagination_data(request, elements):
-    """Calculates pagination data."""
-    elements_per_page = None
+def get_count_cache_key(Model):
+    """Returns cache key of model count."""
+    result = COUNT_CACHE_KEY % Model._meta.label_lower
+    return result
+
+
+def get_elements_count(elements):
+    """
+    Returns number of elements. Counts of unfiltered querysets are cached 
+    per model, filtered querysets and lists are counted exactly.
+    """
+    if not isinstance(elements, QuerySet):
+        return len(elements)
+    query = elements.query
+    is_unfiltered = (not query.where and query.can_filter() 
+        and not query.distinct)
+    if not is_unfiltered:
+        return elements.count()
+    key = get_count_cache_key(elements.model)
+    result = cache.get(key)
+    if result is None:
+        result = elements.count()
+        cache.set(key, result, COUNT_CACHE_TIMEOUT)
+    return result
+
+
+def invalidate_elements_count(Model):
+    """Invalidates cached count of model."""
+    cache.delete(get_count_cache_key(Model))
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator using cached counts of unfiltered querysets."""
+
+    @cached_property
+    def count(self):
+        """Overwritten property. See Paginator class."""
+        return get_elements_count(self.object_list)
+
+
+def get_page_numbers(page_num, num_pages):
+    """
+    Returns numbers of page links around current page. Links are filled from 
+    top and bottom simultaneously up to MAX_PAGES links.
+    """
+    num_links = min(MAX_PAGES, num_pages)
+    start = max(1, page_num - (num_links - 1)//2)
+    end = start + num_links - 1
+    if end > num_pages:
+        end = num_pages
+        start = end - num_links + 1
+    result = list(range(start, end + 1))
+    return result
+
+
+def get_nullable_ordering_fields(Model, ordering):
+    """Returns names of nullable fields of ordering."""
+    names = [field.lstrip('-') for field in ordering]
+    result = set(name for name in names if Model._meta.get_field(name).null)
+    return result
+
+
+def get_ordering_expressions(Model, ordering):
+    """
+    Returns ordering of model with null values of nullable fields placed
+    last, so keyset filters can match them.
+    """
+    nullable = get_nullable_ordering_fields(Model, ordering)
+    result = []
+    for field in ordering:
+        name = field.lstrip('-')
+        if name not in nullable:
+            result.append(field)
+        elif field.startswith('-'):
+            result.append(F(name).desc(nulls_last=True))
+        else:
+            result.append(F(name).asc(nulls_last=True))
+    return result
+
+
+def get_keyset_filter(ordering, values, reverse=False, nullable=()):
+    """
+    Returns Q filter matching elements placed after boundary values in 
+    ordering. If reverse is True matches elements placed before. Null
+    values of nullable fields are placed last.
+    """
+    query = None
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        is_descending = (field.startswith('-') != reverse)
+        lookup = '%s__%s' % (name, 'lt' if is_descending else 'gt')
+        value = values[name]
+        if value is None:
+            # Only non-null values are placed before null ones.
+            if not reverse:
+                continue
+            q = Q(**{name + '__isnull': False})
+        else:
+            q = Q(**{lookup: value})
+            if name in nullable and not reverse:
+                q = q | Q(**{name + '__isnull': True})
+        for previous_field in ordering[:i]:
+            previous_name = previous_field.lstrip('-')
+            previous_value = values[previous_name]
+            if previous_value is None:
+                q = q & Q(**{previous_name + '__isnull': True})
+            else:
+                q = q & Q(**{previous_name: previous_value})
+        query = q if query is None else query | q
+    return query
+
+
+def get_keyset_page(paginator, page_num, ordering, params):
+    """
+    Returns page using keyset pagination. Page boundary is read from 'after'
+    and 'before' parameters, which contain the id of the last element of the
+    previous page or the first element of the next page. Returns None if 
+    there is no valid boundary.
+    """
+    boundary = params.get('after') or params.get('before')
+    if page_num == 1 or not str(boundary).isdigit():
+        return None
+    reverse = ('after' not in params)
+    elements = paginator.object_list
+    names = [field.lstrip('-') for field in ordering]
+    values = elements.filter(pk=int(boundary)).values(*names).first()
+    if values is None:
+        return None
+    nullable = get_nullable_ordering_fields(elements.model, ordering)
+    query = get_keyset_filter(ordering, values, reverse, nullable)
+    if query is None:
+        return None
+    elements = elements.filter(query)
+    if reverse:
+        elements = elements.reverse()
+    object_list = list(elements[:paginator.per_page])
+    if not object_list:
+        return None
+    if reverse:
+        object_list.reverse()
+    result = Page(object_list, page_num, paginator)
+    return result
+
+
+def get_pagination_data(request, elements, ordering=None):
+    """
+    Calculates pagination data. Only the current page is retrieved. If 
+    ordering is provided elements are ordered by it and next and previous 
+    links use keyset pagination. Last field of ordering must be unique.
+    When all elements are requested pages have MAX_ELEMENTS_PER_PAGE 
+    elements and the page is marked as truncated if there are more.
+    """
+    elements_per_page = ELEMENTS_PER_PAGE
+    is_all = False
     if 'elements_per_page' in request.COOKIES:
         if request.COOKIES['elements_per_page'] == 'all':
-            length = len(elements)
-            elements_per_page =  len(elements) if length > 0 else 1
+            elements_per_page = MAX_ELEMENTS_PER_PAGE
+            is_all = True
         else:
-            elements_per_page =  int(request.COOKIES['elements_per_page'])
-    ELEMENTS_PER_PAGE = 10 if elements_per_page is None else elements_per_page
-    paginator = Paginator(elements, ELEMENTS_PER_PAGE)
-    page_num = None
-    if request.method == 'GET':
-        page_num = 1 if request.GET.get('page') is None else int(request.GET.get('page'))
-    elif request.method == 'POST':
-        page_num = 1 if request.POST.get('page') is None else int(request.POST.get('page'))
+            elements_per_page = min(MAX_ELEMENTS_PER_PAGE, 
+                int(request.COOKIES['elements_per_page']))
+    if ordering is not None:
+        elements = elements.order_by(*get_ordering_expressions(
+            elements.model, ordering))
+    paginator = CachedCountPaginator(elements, elements_per_page)
+    params = request.POST if request.method == 'POST' else request.GET
+    page_num = int(params.get('page', 1))
 
     too_high = (page_num > paginator.num_pages)
     too_low =  (page_num < 1)
@@ -1486,59 +1865,35 @@ def get_pagination_data(request, elements):
     elif too_low:
         page_num = 1
 
-    page_obj = paginator.page(page_num)
+    page_obj = None
+    if ordering is not None:
+        page_obj = get_keyset_page(paginator, page_num, ordering, params)
+    if page_obj is None:
+        page_obj = paginator.page(page_num)
+    object_list = list(page_obj.object_list)
+    page_obj.object_list = object_list
     prev_params = get_page_url_parameters_as_string(request)
-    current_page = {
-        'active': True,
-        'obj': page_obj,
-        'href': prev_params + 'page=' + str(page_obj.number)
-    }
-    pages = [current_page]
-    free_slots = MAX_PAGES - 1
-    # Fill pages from top and bottom simultaneously
-    while free_slots > 0:
-        low_full = pages[0]['obj'].number == 1
-        high_full = pages[len(pages) - 1]['obj'].number == paginator.num_pages
-        no_slots = free_slots == 0
-
-        if (high_full and low_full) or no_slots:
-            break
-
-        if not high_full and not no_slots:
-            i = len(pages) - 1
-            new_item = [{
-                'active': False,
-                'obj': paginator.page(pages[i]['obj'].next_page_number()),
-                'href': prev_params + 'page=' + \
-                    str(pages[i]['obj'].next_page_number())
-            }]
-            pages = pages + new_item
-            free_slots -= 1
-            no_slots = free_slots == 0
-
-        if not low_full and not no_slots:
-            i = 0
-            new_item = [{
-                'active': False,
-                'obj': paginator.page(pages[i]['obj'].previous_page_number()),
-                'href': prev_params + 'page=' + \
-                    str(pages[i]['obj'].previous_page_number())
-            }]
-            pages = new_item + pages
-            free_slots -= 1
-
-    curr_index = pages.index(current_page)
-    prev_index = 0 if curr_index == 0 else curr_index - 1
-    next_index = \
-        curr_index if curr_index == len(pages) - 1 else curr_index + 1
+    pages = [{
+        'active': (number == page_num),
+        'number': number,
+        'href': prev_params + 'page=' + str(number)
+    } for number in get_page_numbers(page_num, paginator.num_pages)]
+
+    previous_href = prev_params + 'page=' + str(max(1, page_num - 1))
+    next_href = prev_params + 'page=' + \
+        str(min(paginator.num_pages, page_num + 1))
+    if ordering is not None and object_list:
+        previous_href += '&before=' + str(object_list[0].pk)
+        next_href += '&after=' + str(object_list[-1].pk)
     data = {
         'double_pagination': (MIN_ELEMENTS_PER_PAGE_DOUBLE_PAGINATION \
-            <= len(pages[curr_index]['obj'].object_list)),
-        'page_obj': pages[curr_index]['obj'],
-        'previous_href': pages[prev_index]['href'],
-        'next_href': pages[next_index]['href'],
+            <= len(object_list)),
+        'page_obj': page_obj,
+        'previous_href': previous_href,
+        'next_href': next_href,
         'first_href': prev_params + 'page=1',
         'last_href': prev_params + 'page=' + str(paginator.num_pages),
-        'pages': pages
+        'pages': pages,
+        'is_truncated': (is_all and paginator.num_pages > 1)
     }
-    return data
\ No newline at end of file
+    return data
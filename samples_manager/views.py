@@ -5,9 +5,13 @@ import logging
 from .forms import *
 from .models import *
 from .utilities import *
-from django.db.models import Q
+from .search import search_model, search_queryset
+from .occupancies import calc_occupancies, update_occupancies
+from .fluences import get_samples_fluences
+from django.conf import settings
+from django.db.models import Count, Q
 from django.utils.safestring import mark_safe
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.template.loader import render_to_string
 from django.shortcuts import get_object_or_404, render
 from django.core.files.storage import FileSystemStorage
@@ -18,6 +22,13 @@ APP_NAME = 'samples_manager'
 ELEMENTS_PER_PAGE = 10
 CERNBOX_UPLOAD_URL = 'placeholder.url.com'
 NUM_RESULTS_LOCATION_QUERY = 20
+# Seconds between last_login updates of an unchanged user.
+LOGGED_USER_UPDATE_INTERVAL = 3600
+LOGGED_USER_REQUEST_ATTR = 'logged_user'
+PERMISSION_CACHE_REQUEST_ATTR = 'permission_cache'
+# Keyset pagination orderings of time ordered lists.
+IRRADIATIONS_ORDERING = ('-updated_at', '-id')
+DOSIMETRY_RESULTS_ORDERING = ('id',)
 
 
 ALERT_MESSAGES = {
@@ -40,18 +51,17 @@ ALERT_MESSAGES = {
 # production environment because they only happen in the test database. 
 # In the production database, as of 24/03/21, secure connections to 
 # placeholder.url.com are possible and no warning is present. In production set 
-# session.verify = True in the function get_infoream_credentials to a ensure 
+# session.verify = True in the function get_infoream_transport to a ensure 
 # secure connection to the database hosted at placeholder.url.com.
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def get_logged_user(request):
-    """Returns user instance of CERN database user. 
-    
-    If user from CERN database exists in IDM database returns existing 
-    user instance, if it doesn't exist it creates and returns new 
-    instance."""
+def get_user_identity(request):
+    """Returns identity data of CERN database user.
+
+    Data is read from the SSO headers or, if present, from the request
+    cookies. Returns None if there is no identity available."""
     '''
     username =  request.META['HTTP_X_REMOTE_USER']
     first_name = request.META['HTTP_X_REMOTE_USER_FIRSTNAME']
@@ -98,52 +108,137 @@ def get_logged_user(request):
         department = request.COOKIES['department']
         home_institute = request.COOKIES['home_institute']
 
-    email = email.lower()
-    users = User.objects.all()
-    emails = []
-    for item in users:
-        emails.append(item.email)
-    if not email in emails:
-        new_user = User()
-        if first_name is not None:
-            new_user.name = first_name
-        if last_name is not None:
-            new_user.surname = last_name
-        if mobile:
-            new_user.telephone = mobile
-            new_user.db_telephone = mobile
-        else:
-            new_user.telephone = telephone
-            new_user.db_telephone = telephone
-        if email is not None:
-            new_user.email = email
-        logged_user = new_user
-    else:
-        logged_user = User.objects.get(email=email)
+    result = {
+        'username': username,
+        'first_name': first_name,
+        'last_name': last_name,
+        'telephone': mobile if mobile else telephone,
+        'email': email.lower(),
+        'department': department,
+        'home_institute': home_institute,
+    }
+    return result
 
-    if mobile:
-        logged_user.db_telephone = mobile
-    else:
-        logged_user.db_telephone = telephone
-    if department:
-        logged_user.department = department
-
-    if home_institute:
-        logged_user.home_institute = home_institute
-    logged_user.last_login = get_aware_datetime()
-    logged_user.save()
+
+def update_user_identity(user, identity):
+    """
+    Copies identity data to user instance. Returns True if any of the 
+    stored values changed.
+    """
+    values = {'db_telephone': identity['telephone']}
+    if identity['department']:
+        values['department'] = identity['department']
+    if identity['home_institute']:
+        values['home_institute'] = identity['home_institute']
+    result = False
+    for key, value in values.items():
+        if getattr(user, key) != value:
+            setattr(user, key, value)
+            result = True
+    return result
+
+
+def last_login_is_outdated(user):
+    """Checks if user's last login is older than the update interval."""
+    if user.last_login is None:
+        return True
+    interval = timedelta(seconds=getattr(settings, 
+        'LOGGED_USER_UPDATE_INTERVAL', LOGGED_USER_UPDATE_INTERVAL))
+    result = (get_aware_datetime() - user.last_login > interval)
+    return result
+
+
+def resolve_logged_user(request):
+    """
+    Resolves user instance of CERN database user with a single lookup. 
+
+    If user doesn't exist in IDM database a new instance is created. The 
+    instance is only saved if it is new, its identity data changed or its 
+    last login is outdated.
+    """
+    identity = get_user_identity(request)
+    if identity is None:
+        return None
+
+    try:
+        logged_user = User.objects.get(email=identity['email'])
+    except User.DoesNotExist:
+        logged_user = User()
+        logged_user.name = identity['first_name']
+        logged_user.surname = identity['last_name']
+        logged_user.telephone = identity['telephone']
+        logged_user.email = identity['email']
+
+    changed = update_user_identity(logged_user, identity)
+    if logged_user.pk is None or changed or last_login_is_outdated(logged_user):
+        logged_user.save()
     return logged_user
 
 
+def get_logged_user(request):
+    """Returns user instance of CERN database user. 
+    
+    If user from CERN database exists in IDM database returns existing 
+    user instance, if it doesn't exist it creates and returns new 
+    instance. The user is resolved once per request and stored in 
+    request.logged_user, usually by LoggedUserMiddleware."""
+    if not hasattr(request, LOGGED_USER_REQUEST_ATTR):
+        setattr(request, LOGGED_USER_REQUEST_ATTR, resolve_logged_user(request))
+    return getattr(request, LOGGED_USER_REQUEST_ATTR)
+
+
+def get_permission_filters(logged_user):
+    """
+    Returns, per permission kind, the permission model and the Q filter 
+    matching the instances logged user is allowed to access.
+    """
+    write_filter = Q(users=logged_user) | Q(responsible=logged_user)
+    sample_filter = (Q(experiment__users=logged_user)
+        | Q(experiment__responsible=logged_user))
+    result = {
+        'experiment': (Experiment, write_filter),
+        'experiment_samples': (Experiment, write_filter
+            & ~Q(status__iexact='registered')),
+        'sample': (Sample, sample_filter),
+        'experiment_details': (Experiment, 
+            get_read_authorised_filter(logged_user)),
+        'box_details': (Box, Q(sample__experiment__users=logged_user)
+            | Q(sample__experiment__responsible=logged_user)),
+    }
+    return result
+
+
+def get_allowed_pks(logged_user, perm, pks):
+    """
+    Returns set of pks logged user is allowed to access. Every permission 
+    kind is resolved with a single annotated query. Raises Http404 if any 
+    of the pks doesn't exist.
+    """
+    permission_filters = get_permission_filters(logged_user)
+    if perm not in permission_filters:
+        return set()
+
+    Model, allowed_filter = permission_filters[perm]
+    rows = (Model.objects.filter(pk__in=pks)
+        .annotate(num_allowed=Count('pk', filter=allowed_filter))
+        .values_list('pk', 'num_allowed'))
+    rows = dict(rows)
+    if len(rows) < len(pks):
+        raise Http404('No %s matches the given query.' 
+            % Model._meta.object_name)
+    allowed_pks = set(pk for pk, num_allowed in rows.items() if num_allowed)
+    return allowed_pks
+
+
 def has_permission_or_403(request, perm, pk_list = None):
-    """Verifies if logged user has access to resource. If not access is denied."""
+    """
+    Verifies if logged user has access to resource. If not access is denied.
+    Results are cached in request so repeated checks are free.
+    """
     user = get_logged_user(request)
     allowed = True
 
-    if isinstance(pk_list,str):
-        pk_list = int(pk_list)
-
-    if isinstance(pk_list,int):
+    if isinstance(pk_list,(str,int)):
         pk_list = [pk_list]
 
     if user:
@@ -151,40 +246,17 @@ def has_permission_or_403(request, perm, pk_list = None):
             allowed = is_admin(user)
         elif perm == 'login':
             pass
-        else:
-            if user.role != 'Admin':
-                for pk in pk_list:
-                    if perm == 'experiment':
-                        experiment = get_object_or_404(Experiment, pk=pk)
-                        allowed = (user == experiment.responsible
-                            or user in experiment.users.all())
-                    elif perm == 'experiment_samples':
-                        experiment = get_object_or_404(Experiment, pk=pk)
-                        allowed = ((user == experiment.responsible
-                            or user in experiment.users.all())
-                            and experiment.status.lower() != 'registered') 
-                    elif perm == 'sample':
-                        sample = get_object_or_404(Sample, pk=pk)
-                        experiment = sample.experiment
-                        allowed = (user == experiment.responsible
-                            or user in experiment.users.all())
-                    elif perm == 'experiment_details':
-                        experiments = read_authorised_experiments(user)
-                        experiment = get_object_or_404(Experiment, pk=pk)
-                        allowed = (experiment in experiments)
-                    elif perm == 'box_details':
-                        box = Box.objects.get(pk=pk)
-                        samples = Sample.objects.filter(box=box)
-                        experiments = write_authorised_experiments(user)
-                        allowed = False
-                        for sample in samples:
-                            if sample.experiment in experiments:
-                                allowed = True
-                                break
-                    else:
-                        allowed = False
-                    if not allowed:
-                        break
+        elif user.role != 'Admin':
+            if not hasattr(request, PERMISSION_CACHE_REQUEST_ATTR):
+                setattr(request, PERMISSION_CACHE_REQUEST_ATTR, {})
+            cache = getattr(request, PERMISSION_CACHE_REQUEST_ATTR)
+            pks = set(int(pk) for pk in pk_list)
+            uncached_pks = set(pk for pk in pks if (perm, pk) not in cache)
+            if uncached_pks:
+                allowed_pks = get_allowed_pks(user, perm, uncached_pks)
+                for pk in uncached_pks:
+                    cache[(perm, pk)] = (pk in allowed_pks)
+            allowed = all(cache[(perm, pk)] for pk in pks)
     else:
         allowed = False
 
@@ -192,6 +264,19 @@ def has_permission_or_403(request, perm, pk_list = None):
         raise PermissionDenied
 
 
+def get_read_authorised_filter(logged_user):
+    """Returns Q filter of experiments logged user can read."""
+    write_filter = Q(users=logged_user) | Q(responsible=logged_user)
+    has_private_experiments = Experiment.objects.filter(write_filter, 
+        Q(public_experiment=False)).exists()
+
+    if has_private_experiments:
+        result = write_filter
+    else:
+        result = Q(public_experiment=True) | write_filter
+    return result
+
+
 def read_authorised_experiments(logged_user):
     """Retrieves experiments logged user can read."""
     experiments = Experiment.objects.none()
@@ -199,19 +284,8 @@ def read_authorised_experiments(logged_user):
     if is_admin(logged_user):
         experiments = Experiment.objects.order_by('-updated_at')
     else:
-        has_private_experiments = (len(Experiment.objects.filter(
-            Q(users=logged_user)
-            | Q(responsible=logged_user)
-            , Q(public_experiment=False))) > 0)
-
-        if has_private_experiments:
-            experiments = Experiment.objects.filter(
-                Q(users=logged_user)
-                | Q(responsible=logged_user))
-        else :
-            experiments = Experiment.objects.filter(
-                Q(public_experiment=True) | Q(users=logged_user)
-                | Q(responsible=logged_user))
+        experiments = Experiment.objects.filter(
+            get_read_authorised_filter(logged_user))
 
     return experiments
 
@@ -261,21 +335,13 @@ def index(request):
 
 def authorised_samples(logged_user):
     """Retrieves authorized samples for user."""
-    samples = []
-    if is_admin(logged_user):
-        experiments = Experiment.objects.order_by('-updated_at')
-    else:
-        experiment_values = Experiment.objects.filter(
+    samples = Sample.objects.order_by('-experiment__updated_at', 
+        'experiment__title', '-updated_at', 'set_id')
+    if not is_admin(logged_user):
+        experiments = Experiment.objects.filter(
             Q(users=logged_user)
-            | Q(responsible=logged_user)).values('title').distinct()
-        experiments = []
-        for value in experiment_values:
-            experiment = Experiment.objects.get(title=value['title'])
-            experiments.append(experiment)
-    for experiment in experiments:
-        experiment_samples = Sample.objects.filter(experiment=experiment)
-        for sample in experiment_samples:
-            samples.append(sample)
+            | Q(responsible=logged_user))
+        samples = samples.filter(experiment__in=experiments)
     return samples
 
 
@@ -295,45 +361,7 @@ def fluence_conversion(request):
 
 def save_occupancies(sample, status):
     """Saves sample occupancies in DB."""
-    layers = Layer.objects.filter(sample=sample)
-    occupancies = []
-    radiation_length_occupancy = 0
-    nu_coll_length_occupancy = 0
-    nu_int_length_occupancy = 0
-    for layer in layers:
-        compound_elements = CompoundElement.objects.filter(
-            compound=layer.compound_type)
-        if len(compound_elements) != 0:
-            layer_radiation_length = 0
-            layer_nu_coll_length = 0
-            layer_nu_int_length = 0
-            for compound_element in compound_elements:
-                layer_radiation_length = layer_radiation_length + compound_element.percentage * compound_element.element_type.radiation_length
-                layer_nu_coll_length = layer_nu_coll_length + compound_element.percentage * compound_element.element_type.nu_coll_length
-                layer_nu_int_length = layer_nu_int_length + compound_element.percentage * compound_element.element_type.nu_int_length
-            layer_radiation_length = layer_radiation_length / 100
-            layer_nu_coll_length = layer_nu_coll_length / 100
-            layer_nu_int_length = layer_nu_int_length / 100
-            if layer.compound_type.density != 0:
-                layer_linear_radiation_length = layer_radiation_length / layer.compound_type.density
-                layer_linear_nu_coll_length = layer_nu_coll_length / layer.compound_type.density
-                layer_linear_nu_int_length = layer_nu_int_length / layer.compound_type.density
-            else:
-                layer_linear_radiation_length = 0
-                layer_linear_nu_coll_length = 0
-                layer_linear_nu_int_length = 0
-            if layer_linear_radiation_length != 0:
-                radiation_length_occupancy = radiation_length_occupancy + layer.length / (
-                    10 * layer_linear_radiation_length)
-            if layer_linear_nu_coll_length != 0:
-                nu_coll_length_occupancy = nu_coll_length_occupancy + layer.length / (
-                    10 * layer_linear_nu_coll_length)
-            if layer_linear_nu_int_length != 0:
-                nu_int_length_occupancy = nu_int_length_occupancy + layer.length / (
-                    10 * layer_linear_nu_int_length)
-    radiation_length_occupancy = radiation_length_occupancy * 100
-    nu_coll_length_occupancy = nu_coll_length_occupancy * 100
-    nu_int_length_occupancy = nu_int_length_occupancy * 100
+    values = calc_occupancies([sample.id])[sample.id]
     if status == 'new' or status == 'clone':
         sample_occupancy = Occupancy()
         sample_occupancy.sample = sample
@@ -344,128 +372,42 @@ def save_occupancies(sample, status):
         else:
             sample_occupancy = Occupancy()
             sample_occupancy.sample = sample
-    sample_occupancy.radiation_length_occupancy = \
-        round(radiation_length_occupancy, 3)
-    sample_occupancy.nu_coll_length_occupancy = \
-        round(nu_coll_length_occupancy, 3)
-    sample_occupancy.nu_int_length_occupancy = \
-        round(nu_int_length_occupancy, 3)
+    sample_occupancy.radiation_length_occupancy = values[0]
+    sample_occupancy.nu_coll_length_occupancy = values[1]
+    sample_occupancy.nu_int_length_occupancy = values[2]
     sample_occupancy.save()
 
 
 def get_samples_occupancies(samples):
     """Calculates the occupancies of a set of samples."""
     samples_data = []
+    samples = list(samples)
+    occupancies = dict()
+    for occupancy in Occupancy.objects.filter(sample__in=samples)\
+        .order_by('id'):
+        occupancies.setdefault(occupancy.sample_id, occupancy)
+    # Missing occupancies are calculated at once.
+    missing_samples = [sample for sample in samples 
+        if sample.id not in occupancies]
+    if missing_samples:
+        occupancies.update(update_occupancies(missing_samples))
     for sample in samples:
         if 'passive standard' in sample.experiment.category.lower():
             sample_category = sample.category.split('standard', 1)[1]
         else:
             sample_category = sample.category.split(':', 1)[1]
-        occupancy = Occupancy.objects.filter(sample=sample)
-        if len(occupancy) == 0:
-            save_occupancies(sample, 'new')
-        occupancy1 = Occupancy.objects.filter(sample=sample.id)[0]
         samples_data.append({
             'sample': sample,
             'sample_category': sample_category,
-            'occupancy': occupancy1,
+            'occupancy': occupancies[sample.id],
         })
     return samples_data
 
 
 def get_sample_fluences(sample):
     """Calculates fluence of a sample."""
-    fluences = []
-    irradiations = Irradiation.objects.filter(sample=sample)
-    result = 0
-    tuple_list = []
-    for irradiation in irradiations:
-        if irradiation.estimated_fluence:
-            if '.' in str(irradiation.dosimeter):
-                logging.info('no calculation')
-            else:
-                logging.info('size:' + str(irradiation.dosimeter.width) + ' x ' +
-                      str(irradiation.dosimeter.height))
-                dosimeter_area = irradiation.dosimeter.width * irradiation.dosimeter.height
-                dos_position = irradiation.dos_position
-                dos_tuple = (dosimeter_area, irradiation.dosimeter,
-                             irradiation.estimated_fluence,
-                             irradiation.sample, irradiation.dos_position)
-                tuple_list.append(dos_tuple)
-    tuple_list.sort(key=lambda tup: (tup[0], tup[4]))
-    if tuple_list:
-        sum_fluence = tuple_list[0][2]
-        tuple_list_length = len(tuple_list)
-        if tuple_list_length > 1:
-            for i in range(1, tuple_list_length):
-                if tuple_list[i - 1][0] == tuple_list[i][0]:
-                    if tuple_list[i - 1][4] == tuple_list[i][4]:
-                        sum_fluence = sum_fluence + tuple_list[i][2]
-                    else:
-                        fluences.append({
-                            'Sample': sample,
-                            'Fluence_data': {
-                                'width': tuple_list[i - 1][1].width,
-                                'height': tuple_list[i - 1][1].height,
-                                'estimated_fluence': sum_fluence
-                            }
-                        })
-                        sum_fluence = 0
-                else:
-                    fluences.append({
-                        'Sample': sample,
-                        'Fluence_data': {
-                            'width': tuple_list[i - 1][1].width,
-                            'height': tuple_list[i - 1][1].height,
-                            'estimated_fluence': sum_fluence
-                        }
-                    })
-                    sum_fluence = 0
-
-            if tuple_list[tuple_list_length -
-                          2][0] == tuple_list[tuple_list_length - 1][0]:
-                if tuple_list[i - 1][4] == tuple_list[i][4]:
-                    fluences.append({
-                        'Sample': sample,
-                        'Fluence_data': {
-                            'width': tuple_list[tuple_list_length - 1][1].width,
-                            'height':
-                            tuple_list[tuple_list_length - 1][1].height,
-                            'estimated_fluence': sum_fluence
-                        }
-                    })
-                else:
-                    fluences.append({
-                        'Sample': sample,
-                        'Fluence_data': {
-                            'width':
-                            tuple_list[tuple_list_length - 1][1].width,
-                            'height':
-                            tuple_list[tuple_list_length - 1][1].height,
-                            'estimated_fluence':
-                            tuple_list[tuple_list_length - 1][2]
-                        }
-                    })
-            else:
-                fluences.append({
-                    'Sample': sample,
-                    'Fluence_data': {
-                        'width': tuple_list[tuple_list_length - 1][1].width,
-                        'height': tuple_list[tuple_list_length - 1][1].height,
-                        'estimated_fluence':
-                        tuple_list[tuple_list_length - 1][2]
-                    }
-                })
-        else:
-            fluences.append({
-                'Sample': sample,
-                'Fluence_data': {
-                    'width': tuple_list[tuple_list_length - 1][1].width,
-                    'height': tuple_list[tuple_list_length - 1][1].height,
-                    'estimated_fluence': tuple_list[tuple_list_length - 1][2]
-                }
-            })
-    return fluences
+    result = get_samples_fluences([sample])[sample.pk]
+    return result
 
 
 def equipment_print(request):
@@ -686,9 +628,23 @@ def get_infoream_dimensions_from_equipment(equipment_id):
 
 
 def get_actions_from_equipment_list(equipment_id_list):
-    """Returns infoream actions from equipment list."""
+    """
+    Returns infoream actions from equipment list. Infoream ids of
+    equipments and of their box items are gathered first and their
+    existence is resolved with batch reads.
+    """
     result = dict()
     actions = []
+    boxes_items = dict()
+    infoream_ids = []
+    for equipment_id in equipment_id_list:
+        infoream_ids.append(get_infoream_id(equipment_id))
+        if get_equipment_type(equipment_id) == 'box':
+            box = Box.objects.get(box_id=equipment_id)
+            boxes_items[equipment_id] = get_box_items(box)
+            infoream_ids += [item['infoream_id']
+                for item in boxes_items[equipment_id]]
+    existing = read_equipment_existence(infoream_ids)
     for equipment_id in equipment_id_list:
         dimensions = get_infoream_dimensions_from_equipment(equipment_id)
         equipment_type = get_equipment_type(equipment_id)
@@ -701,12 +657,11 @@ def get_actions_from_equipment_list(equipment_id_list):
             text = get_sample_infoream_comment(sample)
             category_desc = \
                 get_category_desc_from_serial_number(equipment_id)
-            exists_equipment_in_infoream = \
-                (read_equipment({'infoream_id': infoream_id})['response'] is not None)
-            exists_comment_in_infoream = \
-                (read_comment({'infoream_id': infoream_id})['response'] is not None)
+            exists_equipment_in_infoream = existing.get(infoream_id, False)
             
             if exists_equipment_in_infoream:
+                exists_comment_in_infoream = \
+                    (read_comment({'infoream_id': infoream_id})['response'] is not None)
                 actions.append({
                     'action': 'update_equipment',
                     'width': dimensions['width'],
@@ -762,8 +717,7 @@ def get_actions_from_equipment_list(equipment_id_list):
             infoream_id = get_infoream_id(dosimeter.dos_id)
             category_desc = \
                 get_category_desc_from_serial_number(equipment_id)
-            exists_in_infoream = \
-                (read_equipment({'infoream_id': infoream_id})['response'] is not None)
+            exists_in_infoream = existing.get(infoream_id, False)
             
             if exists_in_infoream:
                 actions.append({
@@ -796,8 +750,7 @@ def get_actions_from_equipment_list(equipment_id_list):
             infoream_id = get_infoream_id(box.box_id)
             category_desc = \
                 get_category_desc_from_serial_number(equipment_id)
-            exists_in_infoream = \
-                (read_equipment({'infoream_id': infoream_id})['response'] is not None)
+            exists_in_infoream = existing.get(infoream_id, False)
             if exists_in_infoream:
                 actions.append({
                     'action': 'update_equipment',
@@ -816,7 +769,7 @@ def get_actions_from_equipment_list(equipment_id_list):
                 result['alert_message'] = ALERT_MESSAGES['box_not_in_infoream']
                 break
 
-            items = get_box_items(box)
+            items = boxes_items[equipment_id]
             for item in items:
                 dimensions = get_infoream_dimensions_from_equipment(item['id'])
                 infoream_id_child = get_infoream_id(item['id'])
@@ -825,8 +778,7 @@ def get_actions_from_equipment_list(equipment_id_list):
                     get_category_desc_from_serial_number(item['id'])
                 
                 exists_child_in_infoream = \
-                    (read_equipment({'infoream_id': infoream_id_child})['response']\
-                    is not None)
+                    existing.get(infoream_id_child, False)
                 if infoream_id_child is not None and infoream_id_parent is not None:
                     equipment_type = get_equipment_type(item['id'])
                     if exists_child_in_infoream:
@@ -961,7 +913,9 @@ def get_sample_infoream_comment(sample):
     data = dict()
     if not isinstance(sample, Sample):
         return ''
-    layers = Layer.objects.filter(sample=sample)
+    layers = Layer.objects.filter(sample=sample)\
+        .select_related('compound_type').prefetch_related(
+        'compound_type__compoundelement_set__element_type')
     data['layers'] = []
     for i in range(0, len(layers)):
         data['layers'].append({
@@ -973,7 +927,7 @@ def get_sample_infoream_comment(sample):
                 'elements': []
             }
         })
-        elements = CompoundElement.objects.filter(compound=layers[i].compound_type)
+        elements = layers[i].compound_type.compoundelement_set.all()
         compound_data = data['layers'][i]['compound']
         for element in elements:
             compound_data['elements'].append({
@@ -998,27 +952,25 @@ def get_items_from_item_ids(items_ids):
     return result
 
 
-def get_num_samples_compound(compound):
-    """Counts the number of samples where a compound is used."""
-    layers = Layer.objects.filter(compound_type=compound)
-
-    compound_samples = []
-    for layer in layers:
-        if layer.sample not in compound_samples:
-            compound_samples.append(layer.sample)
-
-    return len(compound_samples)
+def annotate_num_samples(compounds):
+    """Annotates number of samples where each compound is used."""
+    result = compounds.annotate(
+        samples_sum=Count('layer__sample', distinct=True))
+    return result
 
 
 def get_compounds_data(compounds):
     """Retrieves all compounds and number of samples where each compound
     appears."""
     compounds_data = []
+    compounds = list(compounds)
+    samples_sums = dict(annotate_num_samples(Compound.objects.filter(
+        pk__in=[compound.pk for compound in compounds]))\
+        .order_by().values_list('pk', 'samples_sum'))
     for compound in compounds:
-        samples_sum = get_num_samples_compound(compound)
         compounds_data.append({
             "compound": compound,
-            "samples_sum": samples_sum,
+            "samples_sum": samples_sums.get(compound.pk, 0),
         })
     return compounds_data
 
@@ -1079,9 +1031,8 @@ def experiments_search(user, query_string=''):
     Retrieves experiments meeting search criteria.
     Search query returns all experiments matching all keywords.
     """
-    experiments = list(write_authorised_experiments(user))
-    results = filter_model_objects_by_str(\
-        query_string, Experiment, instance_list=experiments)
+    experiments = write_authorised_experiments(user)
+    results = search_queryset(experiments, query_string)
     return results
 
 
@@ -1090,9 +1041,8 @@ def experiments_shared_search(user, query_string=''):
     Retrieves experiments meeting search criteria.
     Search query returns all experiments matching all keywords.
     """
-    experiments = list(shared_experiments(user))
-    results = filter_model_objects_by_str(\
-        query_string, Experiment, instance_list=experiments)
+    experiments = shared_experiments(user)
+    results = search_queryset(experiments, query_string)
     return results
 
 
@@ -1102,61 +1052,59 @@ def samples_search(experiment, query_string=''):
     Search query returns all experiments matching all keywords.
     """
     samples = Sample.objects.filter(experiment=experiment)
-    results = filter_model_objects_by_str(\
-        query_string, Sample, instance_list=samples)
+    results = search_queryset(samples, query_string)
     return results
 
 
 def compounds_search(query_string=''):
     """Retrieves compounds meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, Compound)
+    results = search_model(Compound, query_string)
     return results
 
 
 def dosimeters_search(query_string=''):
     """Retrieves dosimeters meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, Dosimeter)
+    results = search_model(Dosimeter, query_string)
     return results
 
 
 def experiment_users_search(experiment, query_string=''):
     """Retrieves users of an experiment meeting search criteria."""
-    users = list(experiment.users.all())
-    users.append(experiment.responsible)
-    results = filter_model_objects_by_str(\
-        query_string, User, instance_list=users)
+    users = User.objects.filter(
+        Q(pk__in=experiment.users.values('pk'))
+        | Q(pk=experiment.responsible_id))
+    results = search_queryset(users, query_string)
     return results
 
 
 def users_search(query_string=''):
     """Retrieves users meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, User)
+    results = search_model(User, query_string)
     return results
 
 
 def irradiations_search(query_string=''):
     """Retrieves irradiations meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, Irradiation)
+    results = search_model(Irradiation, query_string)
     return results
 
 
 def fluence_factors_search(query_string=''):
     """Retrieves fluence factors meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, FluenceFactor)
+    results = search_model(FluenceFactor, query_string)
     return results
 
 
 def dosimetry_results_search(query_string=''):
     """Retrieves dosimetry results meeting search criteria."""
     irradiations = Irradiation.objects.filter(Q(status='Completed'))
-    results = filter_model_objects_by_str(
-        query_string, Irradiation, instance_list=irradiations)
+    results = search_queryset(irradiations, query_string)
     return results
 
 
 def boxes_search(query_string=''):
     """Retrieves boxes meeting search criteria."""
-    results = filter_model_objects_by_str(query_string, Box)
+    results = search_model(Box, query_string)
     return results
 
 
@@ -1255,7 +1203,8 @@ def render_partial_irradiations_list_to_string(request, irradiations=None):
     """Renders irradiations list as string."""
     irradiations_all_pages = Irradiation.objects.all() \
         if irradiations is None else irradiations
-    pagination_data = get_pagination_data(request, irradiations_all_pages)
+    pagination_data = get_pagination_data(request, irradiations_all_pages,
+        IRRADIATIONS_ORDERING)
     irradiations = pagination_data['page_obj'].object_list
     result = render_to_string(
         'samples_manager/partial_irradiations_list.html', {
@@ -1285,7 +1234,8 @@ def render_partial_dosimetry_results_list_to_string(request, irradiations=None):
     """Renders dsoimetry results list as string."""
     irradiations_all_pages = dosimetry_results_search() \
         if irradiations is None else irradiations
-    pagination_data = get_pagination_data(request, irradiations_all_pages)
+    pagination_data = get_pagination_data(request, irradiations_all_pages,
+        DOSIMETRY_RESULTS_ORDERING)
     irradiations = pagination_data['page_obj'].object_list
     result = render_to_string(
         'samples_manager/partial_dosimetry_results_list.html', {